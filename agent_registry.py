@@ -0,0 +1,121 @@
+"""
+Registro de agentes compartilhado entre processos
+
+Agent configs live in a SQLite database (WAL mode) shared by every worker process
+on the host, so uvicorn can run several workers without each one keeping (and
+rewriting) its own copy of the registry. Every write runs in a single
+`BEGIN IMMEDIATE` transaction that also bumps a registry-wide version counter;
+workers poll that counter, one indexed read, and only reload the agents when it
+moved. Each agent also has a data version, bumped when its documents change, so
+other workers know to drop state derived from them.
+"""
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import sqlite3
+import threading
+import time
+
+class AgentRegistry:
+    """Agent configs in SQLite with a version counter bumped by every write"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly so writes take the lock up front
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS agents ("
+            "agent_id TEXT PRIMARY KEY, config TEXT NOT NULL, "
+            "data_version INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS registry (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO registry (key, value) VALUES ('version', 0)")
+
+    def version(self) -> int:
+        """Current registry version; changes whenever any agent is written"""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM registry WHERE key = 'version'").fetchone()[0]
+
+    def load(self) -> Tuple[int, Dict[str, Tuple[str, int]]]:
+        """Registry version and agent_id -> (config JSON, data version), read in one snapshot"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                version = self._conn.execute("SELECT value FROM registry WHERE key = 'version'").fetchone()[0]
+                rows = self._conn.execute(
+                    "SELECT agent_id, config, data_version FROM agents ORDER BY rowid"
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        return version, {agent_id: (config, data_version) for agent_id, config, data_version in rows}
+
+    def initialize(self, configs: List[Dict[str, Any]]) -> bool:
+        """Seed the registry with configs unless it was already initialized
+
+        Returns whether this call seeded it; when several workers start at once only
+        one of them does.
+        """
+        with self._write() as conn:
+            # Seeded by another worker: nothing is written, so the version doesn't move
+            if conn.execute("SELECT 1 FROM registry WHERE key = 'initialized'").fetchone():
+                return False
+            for config in configs:
+                self._upsert(conn, config)
+            conn.execute("INSERT INTO registry (key, value) VALUES ('initialized', 1)")
+            return True
+
+    def put(self, config: Dict[str, Any]) -> str:
+        """Create or replace an agent's config, keeping its data version; returns the stored JSON"""
+        with self._write() as conn:
+            return self._upsert(conn, config)
+
+    def delete(self, agent_id: str) -> bool:
+        """Remove an agent; False if it wasn't registered"""
+        with self._write() as conn:
+            return conn.execute("DELETE FROM agents WHERE agent_id = ?", (agent_id,)).rowcount > 0
+
+    def bump_data_version(self, agent_id: str) -> Optional[int]:
+        """Mark an agent's documents as changed; returns its new data version (None if unknown)"""
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE agents SET data_version = data_version + 1, updated_at = ? WHERE agent_id = ?",
+                (time.time(), agent_id)
+            )
+            row = conn.execute("SELECT data_version FROM agents WHERE agent_id = ?", (agent_id,)).fetchone()
+            return row[0] if row else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _write(self):
+        """Run a write transaction that also bumps the registry version if it changed anything
+
+        Writes that change nothing (seeding an initialized registry, deleting an unknown
+        agent) leave the version alone, so other workers don't reload for them.
+        """
+        with self._lock:
+            # IMMEDIATE takes the database write lock now, serializing writers across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                changes = self._conn.total_changes
+                yield self._conn
+                if self._conn.total_changes != changes:
+                    self._conn.execute("UPDATE registry SET value = value + 1 WHERE key = 'version'")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _upsert(conn: sqlite3.Connection, config: Dict[str, Any]) -> str:
+        data = json.dumps(config, ensure_ascii=False, sort_keys=True)
+        conn.execute(
+            "INSERT INTO agents (agent_id, config, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(agent_id) DO UPDATE SET config = excluded.config, updated_at = excluded.updated_at",
+            (config["agent_id"], data, time.time())
+        )
+        return data
@@ -1,14 +1,108 @@
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_ollama.llms import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
 import os
-import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator, Tuple, TYPE_CHECKING
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+import hashlib
 import json
-import PyPDF2
-from langchain_community.document_loaders import PyPDFLoader
+import tempfile
+import threading
+import time
+import httpx
+from embedding_cache import get_cached_embeddings
+from model_registry import get_llm, model_slot
+from answer_cache import SemanticAnswerCache
+from agent_registry import AgentRegistry
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from quantized_index import QuantizedIndex, QUANTIZATIONS, drop_quantized_index, recall_at_k
+from metadata_filter import to_chroma_where
+from context import build_context, estimate_tokens
+from metrics import stage, record_stage
+from vector_stores import (
+    open_vector_store, close_vector_store, drop_agent_store, rebuild_collection, validate_hnsw_params
+)
+from pdf_extraction import count_pdf_pages, iter_pdf_pages
+import settings
+
+if TYPE_CHECKING:
+    # pandas, langchain's prompt and text splitter modules are slow to import and only
+    # needed once an agent is opened or a file ingested, so they are imported there
+    import pandas as pd
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether an embedding call failure is worth retrying (network or overloaded server)"""
+    if isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError)):
+        return True
+    return getattr(error, "status_code", None) in (429, 500, 502, 503, 504)
+
+def csv_chunk_to_documents(df: "pd.DataFrame", title_col: str, content_col: str,
+                           metadata_cols: Optional[List[str]] = None, first_row: int = 1) -> List[Document]:
+    """Build documents from a CSV chunk with column-wise operations
+    
+    Each document records its 1-based data row in the file as row_number, counting
+    from first_row for the chunk's first row.
+    """
+    # Empty cells are NaN, which astype(str) keeps as a float on pandas 3
+    if title_col != content_col:
+        contents = df[title_col].fillna("").astype(str) + " " + df[content_col].fillna("").astype(str)
+    else:
+        contents = df[content_col].fillna("").astype(str)
+    
+    present_cols = [col for col in (metadata_cols or []) if col in df.columns]
+    if present_cols:
+        metadatas = df[present_cols].to_dict("records")
+    else:
+        metadatas = [{} for _ in range(len(df))]
+    
+    # Positions, not the index: rows with extra fields make pandas index by the first column
+    for row, metadata in enumerate(metadatas, start=first_row):
+        metadata["row_number"] = row
+    
+    return [
+        Document(page_content=content, metadata=metadata)
+        for content, metadata in zip(contents.tolist(), metadatas)
+    ]
+
+# Metadata locating a document within its source; part of its ID so that identical
+# chunks (repeated rows, boilerplate pages) from one source are stored separately
+POSITION_METADATA_KEYS = ("row_number", "page_number", "chunk_index")
+# Metadata kept in the vector store for ingestion only, never returned to clients
+INTERNAL_METADATA_KEYS = ("content_hash",)
+
+def document_id(agent_id: str, source: str, content: str, position: str = "") -> str:
+    """Stable document ID derived from its source, position in it (if known) and content"""
+    key = f"{source}\0{position}\0{content}" if position else f"{source}\0{content}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f"{agent_id}_{digest[:32]}"
+
+def document_position(metadata: Dict[str, Any]) -> str:
+    """Position of a document within its source, from its positional metadata"""
+    return "\0".join(
+        f"{key}={metadata[key]}" for key in POSITION_METADATA_KEYS if metadata.get(key) is not None
+    )
+
+def document_to_dict(document: Document) -> Dict[str, Any]:
+    """Serialize a retrieved document for responses, without internal metadata"""
+    return {
+        "content": document.page_content,
+        "metadata": {
+            key: value for key, value in document.metadata.items() if key not in INTERNAL_METADATA_KEYS
+        }
+    }
+
+def content_hash(content: str, metadata: Dict[str, Any]) -> str:
+    """Hash of a document's content and metadata, used to detect changes"""
+    payload = json.dumps([content, metadata], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+VECTOR_BACKENDS = ("chroma", "int8", "binary")
+
+def quantized_index_path(agent_id: str) -> str:
+    """Directory of an agent's quantized vector index"""
+    return os.path.join(settings.QUANTIZED_INDEX_DIR, agent_id)
 
 class AgentConfig:
     """Configuration for a RAG agent"""
@@ -18,167 +112,919 @@ class AgentConfig:
                  description: str,
                  system_prompt: str,
                  model: str = "llama3.2:1b",
-                 collection_name: Optional[str] = None):
+                 collection_name: Optional[str] = None,
+                 retrieval_mode: str = settings.DEFAULT_RETRIEVAL_MODE,
+                 context_token_budget: int = settings.CONTEXT_TOKEN_BUDGET,
+                 context_metadata_keys: Optional[List[str]] = None,
+                 vector_backend: str = settings.DEFAULT_VECTOR_BACKEND,
+                 hnsw_params: Optional[Dict[str, Any]] = None):
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {retrieval_mode!r}, expected one of {RETRIEVAL_MODES}")
+        if vector_backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend {vector_backend!r}, expected one of {VECTOR_BACKENDS}")
         self.agent_id = agent_id
         self.name = name
         self.description = description
         self.system_prompt = system_prompt
         self.model = model
         self.collection_name = collection_name or f"agent_{agent_id}"
+        self.retrieval_mode = retrieval_mode
+        # Prompt context limits: token budget and metadata fields shown with each document
+        self.context_token_budget = context_token_budget
+        self.context_metadata_keys = (
+            list(settings.CONTEXT_METADATA_KEYS) if context_metadata_keys is None else context_metadata_keys
+        )
+        # "chroma" searches the collection's HNSW index; "int8"/"binary" a quantized in-process index
+        self.vector_backend = vector_backend
+        # HNSW space, M, construction_ef and search_ef of the collection (unset = Chroma's defaults)
+        self.hnsw_params = validate_hnsw_params(hnsw_params)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Fields as stored in the agent registry"""
+        return {
+            "agent_id": self.agent_id,
+            "name": self.name,
+            "description": self.description,
+            "system_prompt": self.system_prompt,
+            "model": self.model,
+            "collection_name": self.collection_name,
+            "retrieval_mode": self.retrieval_mode,
+            "context_token_budget": self.context_token_budget,
+            "context_metadata_keys": self.context_metadata_keys,
+            "vector_backend": self.vector_backend,
+            "hnsw_params": self.hnsw_params
+        }
 
 class RAGAgent:
     """Individual RAG agent with its own document collection"""
     
-    def __init__(self, config: AgentConfig):
+    def __init__(self, config: AgentConfig, on_documents_changed: Optional[Callable[[str], None]] = None):
         self.config = config
-        self.embeddings = OllamaEmbeddings(model="mxbai-embed-large")
-        self.model = OllamaLLM(model=str(config.model))
-        self.db_location = f"./agents_db/{config.agent_id}"
+        self.on_documents_changed = on_documents_changed
+        self.embeddings = get_cached_embeddings()
+        self.model = get_llm(str(config.model))
         
         # Create vector store for this agent
-        os.makedirs(self.db_location, exist_ok=True)
-        self.vector_store = Chroma(
-            collection_name=config.collection_name,
-            persist_directory=self.db_location,
-            embedding_function=self.embeddings
+        self.vector_store = open_vector_store(
+            config.agent_id, config.collection_name, self.embeddings, config.hnsw_params
         )
         
         # Create retriever
-        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 5})
+        self.top_k = 5
+        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": self.top_k})
+        
+        # BM25 index over the stored documents, built on the first lexical or hybrid query
+        self.lexical_index: Optional[BM25Index] = None
+        self._lexical_lock = threading.Lock()
+        
+        # Quantized vector index (vector_backend int8/binary), loaded or built on first use
+        self.quantized_index: Optional[QuantizedIndex] = None
+        self._quantized_lock = threading.Lock()
         
         # Create prompt template
+        from langchain_core.prompts import ChatPromptTemplate
         template = f"""{config.system_prompt}
 
-Here are some relevant documents: {{documents}}
+Here are some relevant documents:
+{{documents}}
 
 Here is the question to answer: {{question}}
 """
         self.prompt = ChatPromptTemplate.from_template(template)
         self.chain = self.prompt | self.model
+        
+        # Answers to near-duplicate questions, dropped whenever the documents change
+        self.answer_cache = SemanticAnswerCache(
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY,
+            ttl=settings.ANSWER_CACHE_TTL,
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES
+        )
+        self.data_version = 0
+        
+        # Calls currently using the vector store; close() waits for them to finish
+        self._users = 0
+        self._close_requested = False
+        self._closed = False
+        self._users_lock = threading.Lock()
+        self._released = threading.Event()
     
-    def add_documents(self, documents: List[Document]) -> None:
-        """Add documents to this agent's knowledge base"""
-        ids = [f"{self.config.agent_id}_{i}" for i in range(len(documents))]
-        self.vector_store.add_documents(documents=documents, ids=ids)
+    @contextmanager
+    def _in_use(self):
+        """Mark the vector store as in use so a concurrent close() is deferred"""
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
     
-    def add_csv_documents(self, csv_path: str, title_col: str, content_col: str, 
-                         metadata_cols: Optional[List[str]] = None) -> None:
-        """Add documents from CSV file"""
-        df = pd.read_csv(csv_path)
-        documents = []
+    def _acquire(self) -> None:
+        with self._users_lock:
+            if self._closed:
+                raise RuntimeError(f"Agent {self.config.agent_id} was closed")
+            self._users += 1
+    
+    def _release(self) -> None:
+        with self._users_lock:
+            self._users -= 1
+            close_now = self._close_requested and self._users == 0
+        if close_now:
+            self._release_store()
+    
+    def close(self) -> None:
+        """Release the vector store client once no call is using it"""
+        with self._users_lock:
+            self._close_requested = True
+            close_now = self._users == 0
+        if close_now:
+            self._release_store()
+    
+    def _release_store(self) -> None:
+        with self._users_lock:
+            if self._closed:
+                return
+            self._closed = True
+        close_vector_store(self.config.agent_id, self.vector_store)
+        with self._quantized_lock:
+            if self.quantized_index is not None:
+                self.quantized_index.close()
+        self._released.set()
+    
+    def wait_closed(self, timeout: Optional[float] = None) -> bool:
+        """Wait until close() has released the vector store"""
+        return self._released.wait(timeout)
+    
+    def _stage(self, name: str, model: str = ""):
+        """Time a stage of this agent's work (see metrics.py)"""
+        return stage(name, agent=self.config.agent_id, model=model)
+    
+    def add_documents(self, documents: Iterable[Document], batch_size: Optional[int] = None,
+                      max_workers: Optional[int] = None, sync: bool = False, default_source: str = "manual",
+                      progress_callback: Optional[Callable[[List[Document]], None]] = None) -> Dict[str, Any]:
+        """Add documents to this agent's knowledge base
+        
+        Documents are embedded in batches on a small thread pool and each batch is
+        written to the vector store as soon as it is embedded, in input order. At most
+        two batches per worker are held in memory at any time. progress_callback is
+        called with each written batch and may raise to abort the ingestion.
         
-        for i, row in df.iterrows():
-            content = f"{row[title_col]} {row[content_col]}" if title_col != content_col else row[content_col]
+        IDs are derived from each document's source, its position there (row or page
+        and chunk, when known) and content, and a hash of the content and metadata is
+        stored alongside, so documents already stored unchanged are skipped without
+        embedding. With sync=True, documents previously stored for the same sources
+        that are no longer present are deleted.
+        """
+        with self._in_use():
+            return self._add_documents(documents, batch_size, max_workers, sync, default_source, progress_callback)
+    
+    def _add_documents(self, documents: Iterable[Document], batch_size: Optional[int], max_workers: Optional[int],
+                       sync: bool, default_source: str,
+                       progress_callback: Optional[Callable[[List[Document]], None]]) -> Dict[str, Any]:
+        batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        max_workers = max_workers or settings.INGEST_EMBED_WORKERS
+        stats = {
+            "documents_processed": 0,
+            "documents_added": 0,
+            "documents_updated": 0,
+            "documents_unchanged": 0,
+            "documents_deleted": 0,
+            "batches": 0,
+            "retries": 0
+        }
+        sources = set()
+        seen_ids = set()
+        start = time.perf_counter()
+        
+        def write_next(pending: deque) -> None:
+            batch, future = pending.popleft()
+            plan, retries = future.result()
+            self._write_batch(plan["new"] + plan["changed"], plan["embeddings"],
+                              replace_ids=[doc.id for doc in plan["changed"]])
+            if plan["new"] or plan["changed"]:
+                # Local caches are dropped per batch; the manager is told once at the end
+                self.documents_changed(notify=False)
+            stats["documents_processed"] += len(batch)
+            stats["documents_added"] += len(plan["new"])
+            stats["documents_updated"] += len(plan["changed"])
+            stats["documents_unchanged"] += plan["unchanged"]
+            stats["batches"] += 1
+            stats["retries"] += retries
+            if progress_callback:
+                progress_callback(batch)
+        
+        documents = iter(documents)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed") as pool:
+                pending = deque()
+                while True:
+                    batch = [self._prepare_document(doc, default_source) for doc in islice(documents, batch_size)]
+                    if not batch:
+                        break
+                    sources.update(doc.metadata["source"] for doc in batch)
+                    if sync:
+                        seen_ids.update(doc.id for doc in batch)
+                    pending.append((batch, pool.submit(self._plan_batch, batch)))
+                    if len(pending) >= max_workers * 2:
+                        write_next(pending)
+                while pending:
+                    write_next(pending)
             
-            metadata = {}
-            if metadata_cols:
-                for col in metadata_cols:
-                    if col in row:
-                        metadata[col] = row[col]
+            if sync:
+                stats["documents_deleted"] = self._delete_missing(sources, seen_ids)
             
-            document = Document(
-                page_content=content,
-                metadata=metadata
+            if stats["documents_deleted"]:
+                self.documents_changed(notify=False)
+        finally:
+            # Also after a cancelled or failed ingestion: its written batches stay stored
+            if stats["documents_added"] or stats["documents_updated"] or stats["documents_deleted"]:
+                self._notify_documents_changed()
+        
+        elapsed = time.perf_counter() - start
+        stats["elapsed_seconds"] = elapsed
+        stats["documents_per_second"] = stats["documents_processed"] / elapsed if elapsed > 0 else 0.0
+        return stats
+    
+    def documents_changed(self, notify: bool = True) -> None:
+        """Invalidate state derived from this agent's documents
+        
+        With notify=False the caller tells the manager later (once per ingestion
+        rather than per batch, since it also bumps the agent's data version for the
+        other workers).
+        """
+        self.data_version += 1
+        self.answer_cache.clear()
+        if notify:
+            self._notify_documents_changed()
+    
+    def _notify_documents_changed(self) -> None:
+        if self.on_documents_changed:
+            self.on_documents_changed(self.config.agent_id)
+    
+    def _prepare_document(self, document: Document, default_source: str) -> Document:
+        """Copy a document adding its source, content hash and deterministic ID"""
+        metadata = dict(document.metadata or {})
+        metadata.pop("content_hash", None)
+        metadata["source"] = str(metadata.get("source") or default_source)
+        metadata["content_hash"] = content_hash(document.page_content, metadata)
+        return Document(
+            id=document_id(
+                self.config.agent_id, metadata["source"], document.page_content, document_position(metadata)
+            ),
+            page_content=document.page_content,
+            metadata=metadata
+        )
+    
+    def _plan_batch(self, batch: List[Document]) -> Tuple[Dict[str, Any], int]:
+        """Split a batch into new, changed and unchanged documents and embed what's needed"""
+        # Repeated IDs in a batch are the same content at the same place in a source; keep the last
+        unique = {doc.id: doc for doc in batch}
+        with self._stage("ingest_lookup"):
+            stored = self.vector_store._collection.get(ids=list(unique), include=["metadatas"])
+        stored_hashes = {
+            doc_id: (metadata or {}).get("content_hash")
+            for doc_id, metadata in zip(stored["ids"], stored["metadatas"])
+        }
+        
+        new = [doc for doc_id, doc in unique.items() if doc_id not in stored_hashes]
+        changed = [
+            doc for doc_id, doc in unique.items()
+            if doc_id in stored_hashes and stored_hashes[doc_id] != doc.metadata["content_hash"]
+        ]
+        to_embed = new + changed
+        embeddings, retries = self._embed_with_retry([doc.page_content for doc in to_embed]) if to_embed else ([], 0)
+        
+        return {
+            "new": new,
+            "changed": changed,
+            "unchanged": len(unique) - len(to_embed),
+            "embeddings": embeddings
+        }, retries
+    
+    def _delete_missing(self, sources: set, keep_ids: set) -> int:
+        """Delete stored documents of the given sources whose IDs are not in keep_ids"""
+        collection = self.vector_store._collection
+        quantized_index = self._get_quantized_index()
+        deleted = 0
+        with self._stage("ingest_delete"):
+            for source in sources:
+                stored = collection.get(where={"source": source}, include=[])
+                stale = [doc_id for doc_id in stored["ids"] if doc_id not in keep_ids]
+                for start in range(0, len(stale), 5000):
+                    collection.delete(ids=stale[start:start + 5000])
+                deleted += len(stale)
+                with self._lexical_lock:
+                    if self.lexical_index is not None:
+                        self.lexical_index.remove(stale)
+                if quantized_index is not None:
+                    quantized_index.remove(stale)
+        return deleted
+    
+    def _embed_with_retry(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Embed a batch, retrying transient failures with exponential backoff"""
+        retries = 0
+        while True:
+            try:
+                with self._stage("ingest_embed", self.embeddings.model):
+                    return self.embeddings.embed_documents(texts), retries
+            except Exception as e:
+                if retries >= settings.INGEST_MAX_RETRIES or not is_transient_error(e):
+                    raise
+                time.sleep(settings.INGEST_RETRY_BACKOFF * (2 ** retries))
+                retries += 1
+    
+    def _write_batch(self, documents: List[Document], embeddings: List[List[float]],
+                     replace_ids: Optional[List[str]] = None) -> None:
+        """Write an embedded batch straight to the collection"""
+        if not documents:
+            return
+        collection = self.vector_store._collection
+        # Loaded before the write, so an index on disk is checked against the old document count
+        quantized_index = self._get_quantized_index()
+        with self._stage("ingest_write"):
+            if replace_ids:
+                # Chroma merges metadata on upsert; drop changed entries so removed keys go away
+                collection.delete(ids=replace_ids)
+            collection.upsert(
+                ids=[doc.id for doc in documents],
+                embeddings=embeddings,
+                metadatas=[doc.metadata for doc in documents],
+                documents=[doc.page_content for doc in documents]
             )
-            documents.append(document)
+            if quantized_index is not None:
+                quantized_index.add([doc.id for doc in documents], embeddings)
+        # Updating after the write keeps an index built concurrently complete; adds replace by ID
+        with self._lexical_lock:
+            if self.lexical_index is not None:
+                self.lexical_index.add((doc.id, doc.page_content) for doc in documents)
+    
+    def _get_lexical_index(self) -> BM25Index:
+        """Return the agent's BM25 index, building it from the stored documents on first use"""
+        with self._lexical_lock:
+            if self.lexical_index is None:
+                index = BM25Index()
+                collection = self.vector_store._collection
+                offset = 0
+                while True:
+                    page = collection.get(include=["documents"], limit=1000, offset=offset)
+                    if not page["ids"]:
+                        break
+                    index.add(
+                        (doc_id, content) for doc_id, content in zip(page["ids"], page["documents"]) if content
+                    )
+                    offset += len(page["ids"])
+                self.lexical_index = index
+            return self.lexical_index
+    
+    def _get_quantized_index(self) -> Optional[QuantizedIndex]:
+        """Return the agent's quantized index (None with the chroma backend)
+        
+        The index on disk is reused when it holds as many vectors as the collection,
+        otherwise it is rebuilt from the stored embeddings.
+        """
+        if self.config.vector_backend == "chroma":
+            return None
+        with self._quantized_lock:
+            if self.quantized_index is None:
+                self.quantized_index = self._build_quantized_index(
+                    quantized_index_path(self.config.agent_id), self.config.vector_backend
+                )
+            return self.quantized_index
+    
+    def _build_quantized_index(self, directory: str, quantization: str) -> QuantizedIndex:
+        collection = self.vector_store._collection
+        index = QuantizedIndex(directory, quantization, settings.QUANTIZED_RESCORE_FACTOR)
+        count = collection.count()
+        if len(index) == count:
+            return index
+        
+        def pages() -> Iterator[Tuple[List[str], Any]]:
+            offset = 0
+            while True:
+                page = collection.get(include=["embeddings"], limit=1000, offset=offset)
+                if not page["ids"]:
+                    break
+                yield page["ids"], page["embeddings"]
+                offset += len(page["ids"])
+        
+        # Under the index's file lock; skipped if another worker rebuilt it meanwhile
+        index.rebuild(pages(), expected=count)
+        return index
+    
+    def measure_recall(self, questions: Optional[List[str]] = None, sample_size: int = 100,
+                       k: Optional[int] = None, quantization: Optional[str] = None) -> Dict[str, Any]:
+        """Recall@k of a quantized index against the collection's own (HNSW) search
+        
+        Queries are the embedded questions or, without questions, a sample of stored
+        embeddings. quantization defaults to the agent's backend; another one is measured
+        on a throwaway index.
+        """
+        k = k or self.top_k
+        quantization = quantization or self.config.vector_backend
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        
+        with self._in_use():
+            collection = self.vector_store._collection
+            if questions:
+                query_embeddings = self.embeddings.embed_queries(questions)
+            else:
+                sample = collection.get(include=["embeddings"], limit=sample_size)
+                query_embeddings = [list(vector) for vector in sample["embeddings"]]
+            if not query_embeddings:
+                return {"error": "Agent has no documents to measure recall on"}
+            
+            start = time.perf_counter()
+            expected = collection.query(query_embeddings=query_embeddings, n_results=k, include=[])["ids"]
+            chroma_time = time.perf_counter() - start
+            
+            temporary = quantization != self.config.vector_backend
+            if temporary:
+                directory = tempfile.mkdtemp(prefix=f"recall_{self.config.agent_id}_")
+                index = self._build_quantized_index(directory, quantization)
+            else:
+                index = self._get_quantized_index()
+            try:
+                start = time.perf_counter()
+                found = [[doc_id for doc_id, _ in hits] for hits in index.search(query_embeddings, k)]
+                quantized_time = time.perf_counter() - start
+                index_stats = index.stats()
+            finally:
+                if temporary:
+                    index.close()
+                    drop_quantized_index(directory)
+        
+        return {
+            "agent_id": self.config.agent_id,
+            "quantization": quantization,
+            "k": k,
+            "queries": len(query_embeddings),
+            "recall_at_k": recall_at_k(expected, found),
+            "chroma_ms_per_query": 1000 * chroma_time / len(query_embeddings),
+            "quantized_ms_per_query": 1000 * quantized_time / len(query_embeddings),
+            "index": index_stats
+        }
+    
+    def _documents_by_id(self, ids: List[str]) -> Dict[str, Document]:
+        """Fetch stored documents by ID"""
+        if not ids:
+            return {}
+        with self._stage("fetch_documents"):
+            stored = self.vector_store._collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            doc_id: Document(id=doc_id, page_content=content, metadata=metadata or {})
+            for doc_id, content, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+            if content is not None
+        }
+    
+    def add_csv_documents(self, csv_path: str, title_col: str, content_col: str, 
+                         metadata_cols: Optional[List[str]] = None, skip_rows: int = 0,
+                         progress_callback: Optional[Callable[[List[Document]], None]] = None,
+                         chunk_size: Optional[int] = None, source: Optional[str] = None,
+                         sync: bool = False) -> Dict[str, Any]:
+        """Add documents from CSV file, optionally resuming after the first skip_rows rows
+        
+        The file is read in chunks of chunk_size rows and each chunk flows straight into
+        the batched embedding pipeline, so memory use doesn't grow with the file size.
+        With sync=True, rows previously ingested from the same source that are no longer
+        in the file are deleted (skip_rows must then be 0).
+        """
+        import pandas as pd
+        
+        reader = pd.read_csv(
+            csv_path,
+            chunksize=chunk_size or settings.CSV_CHUNK_SIZE,
+            skiprows=range(1, skip_rows + 1)
+        )
+        
+        def documents():
+            first_row = skip_rows + 1
+            for chunk in reader:
+                yield from csv_chunk_to_documents(chunk, title_col, content_col, metadata_cols, first_row)
+                first_row += len(chunk)
         
-        self.add_documents(documents)
+        return self.add_documents(
+            documents(),
+            sync=sync,
+            default_source=source or os.path.basename(csv_path),
+            progress_callback=progress_callback
+        )
     
-    def add_pdf_documents(self, pdf_path: str, metadata: Optional[Dict[str, Any]] = None) -> None:
-        """Add documents from PDF file"""
+    def add_pdf_documents(self, pdf_path: str, metadata: Optional[Dict[str, Any]] = None, skip_pages: int = 0,
+                          progress_callback: Optional[Callable[[List[Document]], None]] = None,
+                          chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                          sync: bool = False) -> Dict[str, Any]:
+        """Add documents from PDF file, optionally resuming after the first skip_pages pages
+        
+        Page text is extracted on a process pool and each page is split into overlapping
+        chunks of about chunk_size characters that keep the page-number metadata. With
+        sync=True, chunks previously ingested from the same source that are no longer in
+        the file are deleted (skip_pages must then be 0).
+        """
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        
+        # Only extraction errors are wrapped: errors raised by progress_callback (such as
+        # a job's cancellation) must reach the caller unchanged
         try:
-            loader = PyPDFLoader(pdf_path)
-            pages = loader.load()
+            total_pages = count_pdf_pages(pdf_path)
+        except Exception as e:
+            raise Exception(f"Error processing PDF {pdf_path}: {str(e)}") from e
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size or settings.PDF_CHUNK_SIZE,
+            chunk_overlap=chunk_overlap if chunk_overlap is not None else settings.PDF_CHUNK_OVERLAP
+        )
+        
+        def pages():
+            try:
+                yield from iter_pdf_pages(pdf_path, start_page=skip_pages)
+            except Exception as e:
+                raise Exception(f"Error processing PDF {pdf_path}: {str(e)}") from e
+        
+        def documents():
+            for i, text in pages():
+                chunks = splitter.split_text(text)
+                for chunk_index, chunk in enumerate(chunks):
+                    # Combine default metadata with page-specific info
+                    page_metadata = metadata.copy() if metadata else {}
+                    page_metadata.setdefault("source", os.path.basename(pdf_path))
+                    page_metadata.update({
+                        "page_number": i + 1,
+                        "total_pages": total_pages,
+                        "chunk_index": chunk_index,
+                        "page_chunks": len(chunks),
+                        "file_type": "pdf"
+                    })
+                    yield Document(page_content=chunk, metadata=page_metadata)
+        
+        return self.add_documents(documents(), sync=sync, progress_callback=progress_callback)
+    
+    def retrieve(self, question: str, query_embedding: Optional[List[float]] = None,
+                 retrieval_mode: Optional[str] = None,
+                 metadata_filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """Retrieve the top documents, reusing a precomputed question embedding if given
+        
+        retrieval_mode (defaults to the agent's) is "vector" (embedding similarity),
+        "lexical" (BM25 over exact terms) or "hybrid" (both rankings merged with
+        reciprocal rank fusion). metadata_filter (see metadata_filter.py) restricts the
+        search to matching documents inside the vector store query.
+        """
+        query_embeddings = [query_embedding] if query_embedding is not None else None
+        return self.retrieve_many([question], query_embeddings, retrieval_mode, metadata_filter)[0]
+    
+    def retrieve_many(self, questions: List[str], query_embeddings: Optional[List[List[float]]] = None,
+                      retrieval_mode: Optional[str] = None,
+                      metadata_filter: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        """Retrieve the top documents for several questions with one embedding call and one vector query"""
+        mode = retrieval_mode or self.config.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+        where = to_chroma_where(metadata_filter)
+        if query_embeddings is None and mode != "lexical":
+            with self._stage("embed_query", self.embeddings.model):
+                query_embeddings = self.embeddings.embed_queries(questions)
+        
+        with self._in_use():
+            if mode == "vector":
+                return self._vector_search_many(query_embeddings, self.top_k, where)
             
-            documents = []
-            for i, page in enumerate(pages):
-                # Combine default metadata with page-specific info
-                page_metadata = metadata.copy() if metadata else {}
-                page_metadata.update({
-                    "page_number": i + 1,
-                    "total_pages": len(pages),
-                    "source": os.path.basename(pdf_path),
-                    "file_type": "pdf"
-                })
-                
-                document = Document(
-                    page_content=page.page_content,
-                    metadata=page_metadata
-                )
-                documents.append(document)
+            # The lexical side is restricted to the IDs the vector store matches for the filter
+            allowed_ids = self._matching_ids(where) if where else None
+            index = self._get_lexical_index()
             
-            self.add_documents(documents)
+            if mode == "lexical":
+                with self._stage("lexical_search"):
+                    rankings = [
+                        [doc_id for doc_id, _ in index.search(question, self.top_k, allowed_ids)]
+                        for question in questions
+                    ]
+                found = self._documents_by_id(list({doc_id for ranked in rankings for doc_id in ranked}))
+                return [[found[doc_id] for doc_id in ranked if doc_id in found] for ranked in rankings]
             
-        except Exception as e:
-            raise Exception(f"Error processing PDF {pdf_path}: {str(e)}")
+            candidates = max(self.top_k, settings.HYBRID_CANDIDATES)
+            vector_results = self._vector_search_many(query_embeddings, candidates, where)
+            rankings = []
+            found = {}
+            with self._stage("lexical_search"):
+                for question, vector_docs in zip(questions, vector_results):
+                    lexical_ids = [doc_id for doc_id, _ in index.search(question, candidates, allowed_ids)]
+                    rankings.append(reciprocal_rank_fusion(
+                        [[doc.id for doc in vector_docs], lexical_ids], k=settings.RRF_K
+                    )[:self.top_k])
+                    found.update((doc.id, doc) for doc in vector_docs)
+            missing = {doc_id for ranked in rankings for doc_id in ranked if doc_id not in found}
+            found.update(self._documents_by_id(list(missing)))
+            return [[found[doc_id] for doc_id in ranked if doc_id in found] for ranked in rankings]
     
-    def get_relevant_documents(self, question: str) -> List[Dict[str, Any]]:
-        """Retrieve relevant documents for a question"""
-        docs = self.retriever.invoke(question)
+    def _vector_search_many(self, query_embeddings: List[List[float]], k: int,
+                            where: Optional[Dict[str, Any]]) -> List[List[Document]]:
+        """Nearest documents for each embedding, in a single collection query"""
+        if not query_embeddings:
+            return []
+        quantized_index = self._get_quantized_index()
+        if quantized_index is not None:
+            allowed_ids = self._matching_ids(where) if where else None
+            with self._stage("vector_search"):
+                hits = quantized_index.search(query_embeddings, k, allowed_ids)
+            found = self._documents_by_id(list({doc_id for ranked in hits for doc_id, _ in ranked}))
+            return [[found[doc_id] for doc_id, _ in ranked if doc_id in found] for ranked in hits]
+        
+        with self._stage("vector_search"):
+            results = self.vector_store._collection.query(
+                query_embeddings=query_embeddings,
+                n_results=k,
+                where=where,
+                include=["documents", "metadatas"]
+            )
+        return [
+            [
+                Document(id=doc_id, page_content=content, metadata=metadata or {})
+                for doc_id, content, metadata in zip(ids, contents, metadatas)
+                if content is not None
+            ]
+            for ids, contents, metadatas in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+    
+    def _matching_ids(self, where: Dict[str, Any]) -> set:
+        """IDs of the stored documents matching a where clause"""
+        return set(self.vector_store._collection.get(where=where, include=[])["ids"])
+    
+    def get_relevant_documents_many(self, questions: List[str], retrieval_mode: Optional[str] = None,
+                                    metadata_filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Retrieve relevant documents for several questions at once"""
         return [
-            {
-                "content": doc.page_content,
-                "metadata": doc.metadata
-            } for doc in docs
+            [document_to_dict(doc) for doc in docs]
+            for docs in self.retrieve_many(questions, retrieval_mode=retrieval_mode, metadata_filter=metadata_filter)
         ]
     
-    def answer_question(self, question: str) -> Dict[str, Any]:
+    def get_relevant_documents(self, question: str, retrieval_mode: Optional[str] = None,
+                               metadata_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Retrieve relevant documents for a question"""
+        docs = self.retrieve(question, retrieval_mode=retrieval_mode, metadata_filter=metadata_filter)
+        return [document_to_dict(doc) for doc in docs]
+    
+    def answer_question(self, question: str, query_embedding: Optional[List[float]] = None,
+                        retrieval_mode: Optional[str] = None,
+                        metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Answer a question using this agent's knowledge"""
-        docs = self.retriever.invoke(question)
-        result = self.chain.invoke({"documents": docs, "question": question})
+        if query_embedding is None:
+            with self._stage("embed_query", self.embeddings.model):
+                query_embedding = self.embeddings.embed_query(question)
+        
+        # Cached answers were produced with the agent's own retrieval mode and no filter
+        use_cache = self._uses_answer_cache(retrieval_mode, metadata_filter)
+        if use_cache:
+            with self._stage("answer_cache_lookup"):
+                cached = self.answer_cache.lookup(query_embedding)
+            if cached:
+                cached.update({"question": question, "cache_hit": True})
+                return cached
+        
+        data_version = self.data_version
+        docs = self.retrieve(question, query_embedding, retrieval_mode, metadata_filter)
+        response = self._generate(question, docs)
+        if use_cache:
+            self._cache_answer(query_embedding, response, data_version)
+        return response
+    
+    def answer_many(self, questions: List[str], retrieval_mode: Optional[str] = None,
+                    metadata_filter: Optional[Dict[str, Any]] = None,
+                    concurrency: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Answer several questions, yielding each result as soon as it is generated
+        
+        All questions are embedded with one call and retrieved with one vector store
+        query; answers are generated on up to concurrency threads. Results come in
+        completion order with the question's index and timings in seconds (embedding
+        and retrieval are shared by the whole batch).
+        """
+        start = time.perf_counter()
+        with self._stage("embed_query", self.embeddings.model):
+            query_embeddings = self.embeddings.embed_queries(questions)
+        embedding_time = time.perf_counter() - start
+        
+        use_cache = self._uses_answer_cache(retrieval_mode, metadata_filter)
+        cached = {}
+        if use_cache:
+            for i, query_embedding in enumerate(query_embeddings):
+                result = self.answer_cache.lookup(query_embedding)
+                if result:
+                    cached[i] = result
+        pending = [i for i in range(len(questions)) if i not in cached]
+        
+        data_version = self.data_version
+        retrieval_start = time.perf_counter()
+        retrieved = self.retrieve_many(
+            [questions[i] for i in pending], [query_embeddings[i] for i in pending], retrieval_mode, metadata_filter
+        ) if pending else []
+        timing = {"embedding_time": embedding_time, "retrieval_time": time.perf_counter() - retrieval_start}
+        
+        for i, result in cached.items():
+            result.update({"question": questions[i], "cache_hit": True})
+            yield {"index": i, **result, **timing, "generation_time": 0.0, "total_time": time.perf_counter() - start}
+        
+        def generate(i: int, docs: List[Document]) -> Tuple[Dict[str, Any], float]:
+            generation_start = time.perf_counter()
+            response = self._generate(questions[i], docs)
+            return response, time.perf_counter() - generation_start
+        
+        # Callers other than the API don't go through its validation, so cap here as well
+        workers = min(concurrency or settings.BATCH_GENERATE_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+        pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch")
+        try:
+            futures = {pool.submit(generate, i, docs): i for i, docs in zip(pending, retrieved)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    response, generation_time = future.result()
+                except Exception as e:
+                    yield {"index": i, "question": questions[i], "error": str(e)}
+                    continue
+                if use_cache:
+                    self._cache_answer(query_embeddings[i], response, data_version)
+                yield {
+                    "index": i,
+                    **response,
+                    **timing,
+                    "generation_time": generation_time,
+                    "total_time": time.perf_counter() - start
+                }
+        finally:
+            # A closed stream (client gone) drops the answers not started yet
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _generate(self, question: str, docs: List[Document]) -> Dict[str, Any]:
+        """Generate the answer to a question from its retrieved documents"""
+        inputs, docs, prompt_tokens = self._prompt_inputs(question, docs)
+        with self._stage("generate", self.config.model), model_slot(self.config.model):
+            result = self.chain.invoke(inputs)
         
         return {
             "agent_id": self.config.agent_id,
             "agent_name": self.config.name,
             "question": question,
             "answer": result,
-            "relevant_documents": [
-                {
-                    "content": doc.page_content,
-                    "metadata": doc.metadata
-                } for doc in docs
-            ]
+            "relevant_documents": [document_to_dict(doc) for doc in docs],
+            "prompt_tokens": prompt_tokens,
+            "cache_hit": False
         }
 
+    def stream_answer(self, question: str, retrieval_mode: Optional[str] = None,
+                      metadata_filter: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Answer a question yielding (event, data) pairs: documents, tokens, then done"""
+        start = time.perf_counter()
+        with self._stage("embed_query", self.embeddings.model):
+            query_embedding = self.embeddings.embed_query(question)
+        
+        use_cache = self._uses_answer_cache(retrieval_mode, metadata_filter)
+        cached = None
+        if use_cache:
+            with self._stage("answer_cache_lookup"):
+                cached = self.answer_cache.lookup(query_embedding)
+        if cached:
+            yield "documents", {
+                "agent_id": self.config.agent_id,
+                "agent_name": self.config.name,
+                "question": question,
+                "relevant_documents": cached["relevant_documents"]
+            }
+            yield "token", {"text": cached["answer"]}
+            elapsed = time.perf_counter() - start
+            yield "done", {
+                "answer": cached["answer"],
+                "cache_hit": True,
+                "prompt_tokens": cached.get("prompt_tokens"),
+                "retrieval_time": elapsed,
+                "time_to_first_token": elapsed,
+                "total_time": elapsed
+            }
+            return
+        
+        data_version = self.data_version
+        docs = self.retrieve(question, query_embedding, retrieval_mode, metadata_filter)
+        inputs, docs, prompt_tokens = self._prompt_inputs(question, docs)
+        relevant_documents = [document_to_dict(doc) for doc in docs]
+        yield "documents", {
+            "agent_id": self.config.agent_id,
+            "agent_name": self.config.name,
+            "question": question,
+            "relevant_documents": relevant_documents
+        }
+        
+        generation_start = time.perf_counter()
+        time_to_first_token = None
+        chunks = []
+        with self._stage("generate", self.config.model), model_slot(self.config.model):
+            for chunk in self.chain.stream(inputs):
+                if not chunk:
+                    continue
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - generation_start
+                    record_stage("first_token", time_to_first_token, self.config.agent_id, self.config.model)
+                chunks.append(chunk)
+                yield "token", {"text": chunk}
+        
+        answer = "".join(chunks)
+        if use_cache:
+            self._cache_answer(query_embedding, {
+                "agent_id": self.config.agent_id,
+                "agent_name": self.config.name,
+                "question": question,
+                "answer": answer,
+                "relevant_documents": relevant_documents,
+                "prompt_tokens": prompt_tokens
+            }, data_version)
+        
+        yield "done", {
+            "answer": answer,
+            "cache_hit": False,
+            "prompt_tokens": prompt_tokens,
+            "retrieval_time": generation_start - start,
+            "time_to_first_token": time_to_first_token,
+            "total_time": time.perf_counter() - start
+        }
+    
+    def _prompt_inputs(self, question: str, docs: List[Document]) -> Tuple[Dict[str, Any], List[Document], int]:
+        """Pack retrieved documents into the agent's context budget and estimate the prompt size"""
+        with self._stage("build_prompt"):
+            context, included = build_context(
+                docs, self.config.context_token_budget, self.config.context_metadata_keys
+            )
+            inputs = {"documents": context, "question": question}
+            return inputs, included, estimate_tokens(self.prompt.format(**inputs))
+    
+    def _uses_answer_cache(self, retrieval_mode: Optional[str], metadata_filter: Optional[Dict[str, Any]]) -> bool:
+        """Whether answers retrieved this way may be served from and stored in the cache"""
+        mode = retrieval_mode or self.config.retrieval_mode
+        return settings.ANSWER_CACHE_ENABLED and mode == self.config.retrieval_mode and not metadata_filter
+    
+    def _cache_answer(self, query_embedding: List[float], response: Dict[str, Any], data_version: int) -> None:
+        """Cache an answer unless the documents changed while it was being generated"""
+        if settings.ANSWER_CACHE_ENABLED and data_version == self.data_version:
+            self.answer_cache.store(query_embedding, response)
+
 class AgentManager:
-    """Manages multiple RAG agents"""
+    """Manages multiple RAG agents
     
-    def __init__(self):
-        self.agents: Dict[str, RAGAgent] = {}
+    Agents are registered as configs and only opened (vector store, model clients) on
+    first use. At most max_open_agents stay open; the least recently used is closed.
+    
+    The configs live in a registry shared by every worker process (agent_registry.py).
+    Each worker polls its version at most every poll_interval seconds and reloads the
+    agents when another worker created, changed or deleted one.
+    """
+    
+    def __init__(self, max_open_agents: int = settings.MAX_OPEN_AGENTS,
+                 registry_path: str = settings.AGENT_REGISTRY_PATH,
+                 poll_interval: float = settings.AGENT_REGISTRY_POLL_INTERVAL):
+        self.configs: Dict[str, AgentConfig] = {}
+        self.max_open_agents = max_open_agents
+        # Pre-registry agent list, imported into the registry on first start
         self.config_file = "agents_config.json"
+        self.registry = AgentRegistry(registry_path)
+        self.poll_interval = poll_interval
+        # Registry version and agent_id -> (config JSON, data version) this worker last saw
+        self._registry_version = -1
+        self._loaded: Dict[str, Tuple[str, int]] = {}
+        self._next_poll = 0.0
+        self.registry_reloads = 0
+        self._open_agents: "OrderedDict[str, RAGAgent]" = OrderedDict()
+        self._open_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.cold_opens = 0
+        self.cold_open_seconds = 0.0
+        self.last_cold_open_seconds = 0.0
+        self.evictions = 0
+        # Called with an agent ID whenever its documents change or it is deleted
+        self.change_listeners: List[Callable[[str], None]] = []
         self.load_agents_config()
     
     def load_agents_config(self):
-        """Load agents configuration from file"""
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                configs = json.load(f)
-                for config_data in configs:
-                    config = AgentConfig(**config_data)
-                    self.agents[config.agent_id] = RAGAgent(config)
-        else:
-            # Create default restaurant agent for backward compatibility
-            self.create_default_restaurant_agent()
-    
-    def save_agents_config(self):
-        """Save agents configuration to file"""
-        configs = []
-        for agent in self.agents.values():
-            configs.append({
-                "agent_id": agent.config.agent_id,
-                "name": agent.config.name,
-                "description": agent.config.description,
-                "system_prompt": agent.config.system_prompt,
-                "model": agent.config.model,
-                "collection_name": agent.config.collection_name
-            })
-        
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(configs, f, indent=2, ensure_ascii=False)
-    
-    def create_default_restaurant_agent(self):
-        """Create the default restaurant agent"""
-        config = AgentConfig(
+        """Load agents from the registry, seeding it on first start"""
+        legacy = self.read_legacy_config()
+        default = None if legacy is not None else self.default_agent_config()
+        seeded = self.registry.initialize(
+            [config.to_dict() for config in legacy] if legacy is not None else [default.to_dict()]
+        )
+        self.refresh(force=True)
+        
+        # Add existing restaurant data if available
+        csv_path = "realistic_restaurant_reviews.csv"
+        if seeded and default is not None and os.path.exists(csv_path):
+            with self.lease(default.agent_id) as agent:
+                agent.add_csv_documents(
+                    csv_path=csv_path,
+                    title_col="Title",
+                    content_col="Review", 
+                    metadata_cols=["Rating", "Date"]
+                )
+    
+    def read_legacy_config(self) -> Optional[List[AgentConfig]]:
+        """Agents saved in agents_config.json by earlier versions, None if there is no such file"""
+        if not os.path.exists(self.config_file):
+            return None
+        with open(self.config_file, 'r', encoding='utf-8') as f:
+            return [AgentConfig(**config_data) for config_data in json.load(f)]
+    
+    def default_agent_config(self) -> AgentConfig:
+        """Config of the default agent, registered when there is nothing to import"""
+        return AgentConfig(
     agent_id="finance_chatbot",
     name="Financial Services Expert",
     description="Especialista em responder perguntas sobre atendimento digital e automação no setor financeiro",
@@ -191,59 +1037,288 @@ class AgentManager:
         "consulta de extratos, renegociação de dívidas e análise de padrões financeiros."
     )
 )
-
-        
-        agent = RAGAgent(config)
+    
+    def refresh(self, force: bool = False) -> None:
+        """Pick up agents created, changed or deleted by other workers
         
-        # Add existing restaurant data if available
-        csv_path = "realistic_restaurant_reviews.csv"
-        if os.path.exists(csv_path):
-            agent.add_csv_documents(
-                csv_path=csv_path,
-                title_col="Title",
-                content_col="Review", 
-                metadata_cols=["Rating", "Date"]
-            )
+        Reads the registry version at most every poll_interval seconds (unless forced)
+        and reloads the agents only when it moved.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now < self._next_poll:
+                return
+            self._next_poll = now + self.poll_interval
+            known_version = self._registry_version
+        if force or self.registry.version() != known_version:
+            self._reload()
+    
+    def _reload(self) -> None:
+        version, rows = self.registry.load()
+        closing, changed = [], []
+        with self._lock:
+            # Versions only grow: a concurrent reload may already have loaded this one
+            if version <= self._registry_version:
+                return
+            self._registry_version = version
+            self.registry_reloads += 1
+            for agent_id in list(self._loaded):
+                if agent_id not in rows:
+                    del self._loaded[agent_id]
+                    self.configs.pop(agent_id, None)
+                    changed.append(agent_id)
+                    if agent_id in self._open_agents:
+                        closing.append(self._open_agents.pop(agent_id))
+            for agent_id, (config_json, data_version) in rows.items():
+                loaded = self._loaded.get(agent_id)
+                if loaded == (config_json, data_version):
+                    continue
+                if loaded is None or loaded[0] != config_json:
+                    self.configs[agent_id] = AgentConfig(**json.loads(config_json))
+                if loaded is not None and loaded[1] != data_version:
+                    changed.append(agent_id)
+                self._loaded[agent_id] = (config_json, data_version)
+                # Reopened with the new config, or to drop caches of the changed documents
+                if loaded is not None and agent_id in self._open_agents:
+                    closing.append(self._open_agents.pop(agent_id))
         
-        self.agents["restaurant"] = agent
-        self.save_agents_config()
+        # Leased agents finish their calls first: close() only takes effect once they are idle
+        for agent in closing:
+            agent.close()
+        for agent_id in changed:
+            self._notify_listeners(agent_id)
     
     def create_agent(self, config: AgentConfig) -> RAGAgent:
         """Create a new agent"""
-        agent = RAGAgent(config)
-        self.agents[config.agent_id] = agent
-        self.save_agents_config()
-        return agent
+        config_json = self.registry.put(config.to_dict())
+        with self._lock:
+            self.configs[config.agent_id] = config
+            self._loaded[config.agent_id] = (config_json, self._loaded.get(config.agent_id, ("", 0))[1])
+        return self.get_agent(config.agent_id)
     
     def get_agent(self, agent_id: str) -> Optional[RAGAgent]:
-        """Get an agent by ID"""
-        return self.agents.get(agent_id)
+        """Get an agent by ID, opening it on first use
+        
+        The agent may be closed (evicted, rebuilt) as soon as this returns; callers
+        that go on to use it should hold it with lease() instead.
+        """
+        return self._get_agent(agent_id, lease=False)
+    
+    @contextmanager
+    def lease(self, agent_id: str) -> Iterator[Optional[RAGAgent]]:
+        """Get an agent (None if unknown) that isn't closed before the block exits
+        
+        The lease is taken while the agent is still registered as open, so a
+        concurrent eviction defers its close until the lease is released.
+        """
+        agent = self._get_agent(agent_id, lease=True)
+        try:
+            yield agent
+        finally:
+            if agent is not None:
+                agent._release()
+    
+    @contextmanager
+    def lease_if_open(self, agent_id: str) -> Iterator[Optional[RAGAgent]]:
+        """Like lease(), but None unless the agent is already open; never opens one
+        
+        Doesn't count as a use for the LRU order either, so background work (such as
+        routing) doesn't keep agents open.
+        """
+        with self._lock:
+            agent = self._open_agents.get(agent_id)
+            if agent is not None:
+                agent._acquire()
+        try:
+            yield agent
+        finally:
+            if agent is not None:
+                agent._release()
+    
+    def _get_agent(self, agent_id: str, lease: bool) -> Optional[RAGAgent]:
+        self.refresh()
+        with self._lock:
+            agent = self._open_agents.get(agent_id)
+            if agent is not None:
+                self._open_agents.move_to_end(agent_id)
+                if lease:
+                    agent._acquire()
+                return agent
+            config = self.configs.get(agent_id)
+            if config is None:
+                return None
+            open_lock = self._open_locks.setdefault(agent_id, threading.Lock())
+        
+        # Open outside the manager lock so other agents stay available meanwhile
+        with open_lock:
+            with self._lock:
+                agent = self._open_agents.get(agent_id)
+                if agent is not None:
+                    self._open_agents.move_to_end(agent_id)
+                    if lease:
+                        agent._acquire()
+                    return agent
+            
+            start = time.perf_counter()
+            agent = RAGAgent(config, on_documents_changed=self.notify_documents_changed)
+            elapsed = time.perf_counter() - start
+            
+            with self._lock:
+                self._open_agents[agent_id] = agent
+                if lease:
+                    agent._acquire()
+                self.cold_opens += 1
+                self.cold_open_seconds += elapsed
+                self.last_cold_open_seconds = elapsed
+                evicted = []
+                while self.max_open_agents and len(self._open_agents) > self.max_open_agents:
+                    _, lru_agent = self._open_agents.popitem(last=False)
+                    evicted.append(lru_agent)
+                    self.evictions += 1
+        
+        for lru_agent in evicted:
+            lru_agent.close()
+        return agent
+    
+    def rebuild_index(self, agent_id: str, hnsw_params: Optional[Dict[str, Any]] = None,
+                      sample_size: int = 50, allow_space_change: bool = False) -> Optional[Dict[str, Any]]:
+        """Rebuild an agent's HNSW index offline, optionally with new parameters
+        
+        hnsw_params are merged over the agent's current ones; a different space is
+        rejected with ValueError unless allow_space_change is set. The agent is closed
+        once its in-flight calls finish and requests for it wait until the rebuilt
+        collection is reopened. Returns None for an unknown agent.
+        """
+        hnsw_params = validate_hnsw_params(hnsw_params) if hnsw_params is not None else None
+        self.refresh()
+        with self._lock:
+            config = self.configs.get(agent_id)
+            if config is None:
+                return None
+            open_lock = self._open_locks.setdefault(agent_id, threading.Lock())
+        if hnsw_params is not None:
+            hnsw_params = {**config.hnsw_params, **hnsw_params}
+            if hnsw_params.get("space", "l2") != config.hnsw_params.get("space", "l2") and not allow_space_change:
+                raise ValueError(
+                    f"Changing the HNSW space of agent {agent_id} changes relevance scores; "
+                    f"pass allow_space_change to do it"
+                )
+        
+        # Holding the open lock keeps get_agent from reopening the agent meanwhile
+        with open_lock:
+            with self._lock:
+                agent = self._open_agents.pop(agent_id, None)
+            if agent is not None:
+                agent.close()
+                agent.wait_closed()
+            
+            report = rebuild_collection(
+                agent_id, config.collection_name, hnsw_params, sample_size, allow_space_change=allow_space_change
+            )
+            if hnsw_params is not None:
+                config.hnsw_params = hnsw_params
+                config_json = self.registry.put(config.to_dict())
+                with self._lock:
+                    if agent_id in self._loaded:
+                        self._loaded[agent_id] = (config_json, self._loaded[agent_id][1])
+            # Other workers reopen the agent, their handle points to the replaced collection
+            self._bump_data_version(agent_id)
+        return report
+    
+    def notify_documents_changed(self, agent_id: str) -> None:
+        """Record that an agent's documents changed, here and for the other workers"""
+        self._bump_data_version(agent_id)
+        self._notify_listeners(agent_id)
+    
+    def _bump_data_version(self, agent_id: str) -> None:
+        data_version = self.registry.bump_data_version(agent_id)
+        with self._lock:
+            if data_version is not None and agent_id in self._loaded:
+                self._loaded[agent_id] = (self._loaded[agent_id][0], data_version)
+    
+    def _notify_listeners(self, agent_id: str) -> None:
+        """Tell listeners (e.g. the router) that an agent's documents changed"""
+        for listener in list(self.change_listeners):
+            listener(agent_id)
+    
+    def get_config(self, agent_id: str) -> Optional[AgentConfig]:
+        """An agent's config, without opening it"""
+        self.refresh()
+        with self._lock:
+            return self.configs.get(agent_id)
+    
+    def has_agent(self, agent_id: str) -> bool:
+        """Whether an agent is registered, without opening it"""
+        self.refresh()
+        with self._lock:
+            return agent_id in self.configs
+    
+    def agent_ids(self) -> List[str]:
+        """IDs of every registered agent, open or not"""
+        self.refresh()
+        with self._lock:
+            return list(self.configs)
+    
+    def open_agents(self) -> Dict[str, RAGAgent]:
+        """Agents currently open, least recently used first"""
+        with self._lock:
+            return dict(self._open_agents)
     
     def list_agents(self) -> Dict[str, Dict[str, Any]]:
         """List all available agents"""
-        return {
-            agent_id: {
-                "name": agent.config.name,
-                "description": agent.config.description,
-                "model": agent.config.model
+        self.refresh()
+        with self._lock:
+            return {
+                agent_id: {
+                    "name": config.name,
+                    "description": config.description,
+                    "model": config.model,
+                    "retrieval_mode": config.retrieval_mode,
+                    "vector_backend": config.vector_backend,
+                    "hnsw_params": config.hnsw_params
+                }
+                for agent_id, config in self.configs.items()
+            }
+    
+    def stats(self) -> Dict[str, Any]:
+        """Open agent count, cold open timings and registry version"""
+        self.refresh()
+        with self._lock:
+            return {
+                "registered_agents": len(self.configs),
+                "registry_version": self._registry_version,
+                "registry_reloads": self.registry_reloads,
+                "open_agents": len(self._open_agents),
+                "max_open_agents": self.max_open_agents,
+                "cold_opens": self.cold_opens,
+                "evictions": self.evictions,
+                "avg_cold_open_ms": 1000 * self.cold_open_seconds / self.cold_opens if self.cold_opens else 0.0,
+                "last_cold_open_ms": 1000 * self.last_cold_open_seconds
             }
-            for agent_id, agent in self.agents.items()
-        }
     
     def delete_agent(self, agent_id: str) -> bool:
         """Delete an agent"""
-        if agent_id in self.agents:
-            # Remove database files
-            import shutil
-            db_path = f"./agents_db/{agent_id}"
-            if os.path.exists(db_path):
-                shutil.rmtree(db_path)
-            
-            # Remove from memory
-            del self.agents[agent_id]
-            self.save_agents_config()
-            return True
-        return False
+        self.refresh()
+        with self._lock:
+            config = self.configs.get(agent_id)
+        # Only the worker whose delete removed the registry entry drops the documents
+        if config is None or not self.registry.delete(agent_id):
+            return False
+        with self._lock:
+            self.configs.pop(agent_id, None)
+            self._loaded.pop(agent_id, None)
+            agent = self._open_agents.pop(agent_id, None)
+        
+        # In-flight calls hold leases on the agent: let them finish before its files go
+        if agent is not None:
+            agent.close()
+            agent.wait_closed()
+        
+        # Remove the agent's documents (its collection or its database directory)
+        drop_agent_store(agent_id, config.collection_name)
+        drop_quantized_index(quantized_index_path(agent_id))
+        self._notify_listeners(agent_id)
+        return True
 
 # Global agent manager instance
-agent_manager = AgentManager()
\ No newline at end of file
+agent_manager = AgentManager()
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import copy
+import threading
+import time
+import numpy as np
+
+class SemanticAnswerCache:
+    """Per-agent LRU cache of answers looked up by question embedding similarity"""
+
+    def __init__(self, similarity_threshold: float, ttl: float, max_entries: int):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # key -> (stored_at, result); order is least to most recently used
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._keys: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached result for the most similar question above the threshold"""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._expire()
+            if self._matrix is None or not self._keys:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = copy.deepcopy(self._entries[key][1])
+
+        result["cache_similarity"] = similarity
+        return result
+
+    def store(self, embedding: List[float], result: Dict[str, Any]) -> None:
+        """Cache the result for a question, evicting the least recently used entry if full"""
+        if self.max_entries <= 0:
+            # A cache of size 0 stores nothing
+            return
+        vector = self._normalize(embedding)
+        with self._lock:
+            while len(self._entries) >= self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (time.monotonic(), copy.deepcopy(result))
+            self._keys.append(key)
+            row = vector[np.newaxis, :]
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+
+    def clear(self) -> None:
+        """Drop every entry (the agent's documents changed)"""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._keys = []
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.similarity_threshold,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, (stored_at, _) in self._entries.items() if stored_at < cutoff]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key: int) -> None:
+        del self._entries[key]
+        row = self._keys.index(key)
+        del self._keys[row]
+        self._matrix = np.delete(self._matrix, row, axis=0) if self._keys else None
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -1,25 +1,87 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from pydantic import BaseModel, Field
 from services import qa_service, legacy_qa_service
-from typing import List, Dict, Any, Optional
+from executor import executors, QueueFullError
+import model_registry
+import metrics
+from profiling import profiler, to_folded
+from metadata_filter import to_chroma_where, InvalidFilterError
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Callable, Tuple, Literal
+from contextlib import asynccontextmanager
 import uvicorn
-import tempfile
+import asyncio
 import os
 import json
+import shutil
+import time
+
+import settings
+
+# Agents opened in the background at startup (settings.WARM_AGENTS); see /health/ready
+warm_up_state: Dict[str, Any] = {"pending": list(settings.WARM_AGENTS), "failed": {}}
+
+async def warm_up_agents() -> None:
+    """Open the configured agents without holding up startup"""
+    try:
+        result = await executors["ingest"].run(qa_service.warm_up, settings.WARM_AGENTS)
+        warm_up_state["failed"] = result["failed"]
+    except Exception as e:
+        warm_up_state["failed"] = {agent_id: str(e) for agent_id in settings.WARM_AGENTS}
+    finally:
+        warm_up_state["pending"] = []
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    qa_service.ingestion_jobs.start()
+    warm_up = asyncio.create_task(warm_up_agents()) if settings.WARM_AGENTS else None
+    yield
+    if warm_up is not None:
+        warm_up.cancel()
 
 app = FastAPI(
     title="Multi-Agent RAG API",
     description="API para perguntas e respostas usando m\u00faltiplos agentes RAG especializados",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Request Models
 class QuestionRequest(BaseModel):
     question: str
 
+RetrievalMode = Literal["vector", "hybrid", "lexical"]
+VectorBackend = Literal["chroma", "int8", "binary"]
+
+class HNSWParams(BaseModel):
+    # Unset fields keep Chroma's defaults
+    space: Optional[Literal["l2", "cosine", "ip"]] = None
+    M: Optional[int] = Field(None, gt=0)
+    construction_ef: Optional[int] = Field(None, gt=0)
+    search_ef: Optional[int] = Field(None, gt=0)
+
 class AgentQuestionRequest(BaseModel):
     agent_id: str
     question: str
+    retrieval_mode: Optional[RetrievalMode] = None
+    # Metadata conditions, e.g. {"categoria": "cartao", "Rating": {"gte": 4}, "source": {"in": ["faq.pdf"]}}
+    filter: Optional[Dict[str, Any]] = None
+
+class AskAllRequest(BaseModel):
+    question: str
+    retrieval_mode: Optional[RetrievalMode] = None
+    filter: Optional[Dict[str, Any]] = None
+    # Ask only the top_n most relevant agents (0 = all) scoring at least min_score
+    top_n: Optional[int] = Field(None, ge=0)
+    min_score: Optional[float] = None
+
+class BatchQuestionRequest(BaseModel):
+    agent_id: str
+    questions: List[str] = Field(..., min_length=1, max_length=settings.BATCH_MAX_QUESTIONS)
+    retrieval_mode: Optional[RetrievalMode] = None
+    filter: Optional[Dict[str, Any]] = None
+    # Answers generated in parallel (ask-batch only)
+    concurrency: Optional[int] = Field(None, ge=1, le=settings.BATCH_MAX_CONCURRENCY)
 
 class CreateAgentRequest(BaseModel):
     agent_id: str
@@ -27,6 +89,29 @@ class CreateAgentRequest(BaseModel):
     description: str
     system_prompt: str
     model: str = "llama3.2:1b"
+    retrieval_mode: Optional[RetrievalMode] = None
+    context_token_budget: Optional[int] = Field(None, gt=0)
+    context_metadata_keys: Optional[List[str]] = None
+    vector_backend: Optional[VectorBackend] = None
+    hnsw: Optional[HNSWParams] = None
+
+class RebuildIndexRequest(BaseModel):
+    agent_id: str
+    # HNSW parameters to change (the others are kept); omitted = compact with the current ones
+    hnsw: Optional[HNSWParams] = None
+    # Changing the space changes relevance scores (and any thresholds tuned on them)
+    allow_space_change: bool = False
+    # Stored vectors used as queries to measure latency and recall before and after
+    sample_size: int = Field(50, ge=1, le=1000)
+
+class VectorRecallRequest(BaseModel):
+    agent_id: str
+    # Questions to measure with; a sample of stored embeddings when omitted
+    questions: Optional[List[str]] = None
+    sample_size: int = Field(100, ge=1, le=10000)
+    k: Optional[int] = Field(None, ge=1)
+    # Defaults to the agent's own backend
+    quantization: Optional[Literal["int8", "binary"]] = None
 
 class DocumentRequest(BaseModel):
     content: str
@@ -35,6 +120,7 @@ class DocumentRequest(BaseModel):
 class AddDocumentsRequest(BaseModel):
     agent_id: str
     documents: List[DocumentRequest]
+    sync: bool = False
 
 class CSVUploadRequest(BaseModel):
     agent_id: str
@@ -61,11 +147,16 @@ class AgentQAResponse(BaseModel):
     question: str
     answer: str
     relevant_documents: List[ReviewResponse]
+    prompt_tokens: Optional[int] = None
+    cache_hit: bool = False
 
 class AgentInfo(BaseModel):
     name: str
     description: str
     model: str
+    retrieval_mode: str = "vector"
+    vector_backend: str = "chroma"
+    hnsw_params: Dict[str, Any] = {}
 
 class AgentListResponse(BaseModel):
     agents: Dict[str, AgentInfo]
@@ -91,27 +182,255 @@ async def root():
             "/agents": "GET - Listar todos os agentes",
             "/agents/create": "POST - Criar um novo agente",
             "/agents/{agent_id}": "DELETE - Deletar um agente",
+            "/agents/vector-recall": "POST - Recall@k do índice vetorial quantizado comparado ao Chroma",
+            "/agents/index/rebuild": "POST - Reconstruir/compactar o índice HNSW de um agente (admin)",
             
             # Agent interaction endpoints
             "/agents/ask": "POST - Fazer pergunta para um agente específico",
-            "/agents/ask-all": "POST - Fazer pergunta para todos os agentes",
+            "/agents/ask/stream": "POST - Resposta de um agente via Server-Sent Events",
+            "/agents/ask-all": "POST - Fazer pergunta para os agentes mais relevantes",
             "/agents/documents": "POST - Obter documentos relevantes de um agente",
+            "/agents/ask-batch": "POST - Várias perguntas para um agente (JSON Lines)",
+            "/agents/documents-batch": "POST - Documentos relevantes para várias perguntas (JSON Lines)",
             
             # Document management endpoints
             "/agents/documents/add": "POST - Adicionar documentos a um agente",
-            "/agents/documents/upload-csv": "POST - Upload CSV para um agente",
-            "/agents/documents/upload-pdf": "POST - Upload PDF para um agente",
+            "/agents/documents/upload-csv": "POST - Upload CSV para um agente (job em segundo plano)",
+            "/agents/documents/upload-pdf": "POST - Upload PDF para um agente (job em segundo plano)",
+            
+            # Ingestion job endpoints
+            "/agents/jobs": "GET - Listar jobs de ingestão",
+            "/agents/jobs/{job_id}": "GET - Progresso de um job de ingestão",
+            "/agents/jobs/{job_id}/cancel": "POST - Cancelar um job de ingestão",
             
             # System endpoints
-            "/health": "GET - Status da API"
+            "/health": "GET - Status da API",
+            "/health/live": "GET - O processo está respondendo (liveness)",
+            "/health/ready": "GET - Pronto para receber tráfego, com os agentes já abertos (readiness)",
+            "/system/embedding-cache": "GET - Estatísticas do cache de embeddings",
+            "/system/executors": "GET - Carga dos executores (generate, retrieve, ingest, ask-all)",
+            "/system/answer-cache": "GET - Estatísticas do cache de respostas por agente",
+            "/system/agents": "GET - Agentes abertos e tempo de abertura",
+            "/system/models": "GET - Clientes Ollama compartilhados e requisições por modelo",
+            "/metrics": "GET - Métricas no formato Prometheus (latência por etapa, filas, caches)",
+            "/system/profiles": "GET - Perfis de requisições amostradas ou lentas",
+            "/system/profiles/{profile_id}": "GET - Baixar um perfil (JSON ou format=folded)"
         }
     }
 
+# ==================== BLOCKING CALL HELPERS ====================
+
+def check_filter(metadata_filter: Optional[Dict[str, Any]]) -> None:
+    """Reject a malformed metadata filter before any work is queued"""
+    try:
+        to_chroma_where(metadata_filter)
+    except InvalidFilterError as e:
+        raise HTTPException(status_code=400, detail=f"Filtro inválido: {str(e)}")
+
+def queue_full_exception(e: QueueFullError) -> HTTPException:
+    """Build the 429 response for a saturated executor"""
+    return HTTPException(
+        status_code=429,
+        detail=f"Servidor ocupado com operações '{e.operation}', tente novamente em {e.retry_after}s",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def run_blocking(operation: str, fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking service call on the bounded executor of its operation class"""
+    try:
+        return await executors[operation].run(fn, *args, **kwargs)
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+
+def stream_blocking(operation: str, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+    """Consume a blocking iterator on the bounded executor of its operation class"""
+    try:
+        return executors[operation].stream(iterator)
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+
+# ==================== METRICS ====================
+
+# Request bodies larger than this aren't copied into profiles
+PROFILE_MAX_BODY_BYTES = 16 * 1024
+
+async def profile_params(request: Request) -> Dict[str, Any]:
+    """Request parameters stored with a profile: query string and small JSON bodies"""
+    params: Dict[str, Any] = {"query": dict(request.query_params)}
+    content_type = request.headers.get("content-type", "")
+    length = int(request.headers.get("content-length") or 0)
+    if content_type.startswith("application/json") and 0 < length <= PROFILE_MAX_BODY_BYTES:
+        try:
+            params["body"] = json.loads(await request.body())
+        except ValueError:
+            pass
+    elif length:
+        params["content_type"] = content_type
+        params["content_length"] = length
+    return params
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request and, when asked with X-Debug-Timing, report its stages in Server-Timing
+
+    Sampled and slow requests are also profiled (see profiling.py), until their
+    whole body has been sent.
+    """
+    with metrics.timed_request() as timings:
+        profile = None
+        if profiler.enabled:
+            profile = profiler.start(request.method, request.url.path, await profile_params(request))
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        except Exception:
+            if profile is not None:
+                profiler.finish(profile, 500, timings)
+            raise
+        # Streaming responses are timed until their headers are sent
+        route = request.scope.get("route")
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            path=getattr(route, "path", "unmatched"),
+            status=str(response.status_code)
+        )
+        if request.headers.get("X-Debug-Timing"):
+            response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    
+    if profile is not None:
+        body = response.body_iterator
+        
+        async def finish_profile_after_body():
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                profiler.finish(profile, response.status_code, timings)
+        
+        response.body_iterator = finish_profile_after_body()
+    return response
+
+def gauge_families() -> List[List[str]]:
+    """Scrape-time gauges for executors, caches, model slots and open agents"""
+    executor_stats = {name: executor.stats() for name, executor in executors.items()}
+    embedding_stats = qa_service.get_embedding_cache_stats()
+    answer_stats = qa_service.get_answer_cache_stats().values()
+    model_stats = model_registry.stats()["models"]
+    return [
+        metrics.render_gauges("rag_executor_in_flight", "Operations running or queued per executor",
+                              [({"operation": name}, stats["in_flight"]) for name, stats in executor_stats.items()]),
+        metrics.render_gauges("rag_executor_queued", "Operations waiting for a worker per executor",
+                              [({"operation": name}, stats["queued"]) for name, stats in executor_stats.items()]),
+        metrics.render_gauges("rag_executor_rejected_total", "Operations rejected with 429 per executor",
+                              [({"operation": name}, stats["rejected"]) for name, stats in executor_stats.items()],
+                              "counter"),
+        metrics.render_gauges("rag_embedding_cache_hits_total", "Embedding cache hits",
+                              [({}, embedding_stats["hits"])], "counter"),
+        metrics.render_gauges("rag_embedding_cache_misses_total", "Embedding cache misses",
+                              [({}, embedding_stats["misses"])], "counter"),
+        metrics.render_gauges("rag_embedding_cache_hit_rate", "Embedding cache hit rate",
+                              [({}, embedding_stats["hit_rate"])]),
+        metrics.render_gauges("rag_answer_cache_hits", "Answer cache hits of the open agents",
+                              [({}, sum(stats["hits"] for stats in answer_stats))]),
+        metrics.render_gauges("rag_answer_cache_misses", "Answer cache misses of the open agents",
+                              [({}, sum(stats["misses"] for stats in answer_stats))]),
+        metrics.render_gauges("rag_model_requests_in_use", "Ollama requests running per model",
+                              [({"model": model}, stats["in_use"]) for model, stats in model_stats.items()]),
+        metrics.render_gauges("rag_model_requests_waiting", "Requests waiting for a model slot",
+                              [({"model": model}, stats["waiting"]) for model, stats in model_stats.items()]),
+        metrics.render_gauges("rag_open_agents", "Agents currently open",
+                              [({}, qa_service.get_agent_manager_stats()["open_agents"])])
+    ]
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["System"])
+async def prometheus_metrics():
+    """Métricas no formato de texto do Prometheus"""
+    try:
+        return PlainTextResponse(metrics.render(gauge_families()), media_type="text/plain; version=0.0.4")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar métricas: {str(e)}")
+
+@app.get("/system/profiles", tags=["System"])
+async def list_profiles():
+    """Perfis gravados de requisições amostradas ou lentas, mais recentes primeiro"""
+    try:
+        return {"profiler": profiler.stats(), "profiles": profiler.list_profiles()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar perfis: {str(e)}")
+
+@app.get("/system/profiles/{profile_id}", tags=["System"])
+async def get_profile(profile_id: str, format: Literal["json", "folded"] = "json"):
+    """Baixar um perfil; format=folded devolve as pilhas no formato do flamegraph.pl/speedscope"""
+    record = profiler.load(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Perfil '{profile_id}' não encontrado")
+    if format == "folded":
+        return PlainTextResponse(
+            to_folded(record),
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'}
+        )
+    return record
+
 @app.get("/health")
 async def health_check():
     """Verificar status da API"""
     return {"status": "healthy", "message": "API funcionando corretamente"}
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: o processo está de pé e o event loop responde"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: agentes de RAG_WARM_AGENTS já abertos; lista os agentes abertos (quentes)"""
+    ready = not warm_up_state["pending"]
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "warming",
+            "warming": warm_up_state["pending"],
+            "failed": warm_up_state["failed"],
+            "warm_agents": qa_service.get_warm_agents(),
+            "registered_agents": len(qa_service.list_agents())
+        }
+    )
+
+@app.get("/system/embedding-cache", tags=["System"])
+async def embedding_cache_stats():
+    """Estatísticas do cache persistente de embeddings"""
+    try:
+        return qa_service.get_embedding_cache_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao obter estatísticas do cache: {str(e)}")
+
+@app.get("/system/executors", tags=["System"])
+async def executor_stats():
+    """Carga atual dos executores de operações bloqueantes"""
+    return {name: executor.stats() for name, executor in executors.items()}
+
+@app.get("/system/answer-cache", tags=["System"])
+async def answer_cache_stats():
+    """Estatísticas do cache semântico de respostas de cada agente"""
+    try:
+        return qa_service.get_answer_cache_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao obter estatísticas do cache: {str(e)}")
+
+@app.get("/system/agents", tags=["System"])
+async def agent_manager_stats():
+    """Quantos agentes estão abertos e quanto tempo leva abrir um agente"""
+    try:
+        return qa_service.get_agent_manager_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao obter estatísticas dos agentes: {str(e)}")
+
+@app.get("/system/models", tags=["System"])
+async def model_stats():
+    """Clientes Ollama compartilhados e uso dos limites de concorrência por modelo"""
+    return model_registry.stats()
+
 # ==================== LEGACY ENDPOINTS (Backward Compatibility) ====================
 
 @app.post("/ask", response_model=QAResponse, tags=["Legacy"])
@@ -123,7 +442,7 @@ async def ask_question(request: QuestionRequest):
     Use /agents/ask para interagir com agentes específicos.
     """
     try:
-        result = legacy_qa_service.answer_question(request.question)
+        result = await run_blocking("generate", legacy_qa_service.answer_question, request.question)
         # Convert dict reviews to ReviewResponse objects
         review_objects = [ReviewResponse(**review) for review in result["relevant_reviews"]]
         return QAResponse(
@@ -131,6 +450,8 @@ async def ask_question(request: QuestionRequest):
             answer=result["answer"],
             relevant_reviews=review_objects
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar pergunta: {str(e)}")
 
@@ -143,10 +464,12 @@ async def get_relevant_reviews(request: QuestionRequest):
     Use /agents/documents para interagir com agentes específicos.
     """
     try:
-        reviews = legacy_qa_service.get_relevant_reviews(request.question)
+        reviews = await run_blocking("retrieve", legacy_qa_service.get_relevant_reviews, request.question)
         # Convert dict reviews to ReviewResponse objects
         review_objects = [ReviewResponse(**review) for review in reviews]
         return ReviewsResponse(reviews=review_objects)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar reviews: {str(e)}")
 
@@ -168,22 +491,83 @@ async def list_agents():
 async def create_agent(request: CreateAgentRequest):
     """Criar um novo agente RAG"""
     try:
-        result = qa_service.create_agent(
+        result = await run_blocking(
+            "ingest",
+            qa_service.create_agent,
             agent_id=request.agent_id,
             name=request.name,
             description=request.description,
             system_prompt=request.system_prompt,
-            model=request.model
+            model=request.model,
+            retrieval_mode=request.retrieval_mode,
+            context_token_budget=request.context_token_budget,
+            context_metadata_keys=request.context_metadata_keys,
+            vector_backend=request.vector_backend,
+            hnsw_params=request.hnsw.model_dump(exclude_none=True) if request.hnsw else None
         )
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao criar agente: {str(e)}")
 
+@app.post("/agents/index/rebuild", tags=["Agent Management"])
+async def rebuild_agent_index(request: RebuildIndexRequest):
+    """Reconstruir o índice HNSW de um agente (remove entradas apagadas, aplica novos parâmetros)
+
+    Só os parâmetros enviados em `hnsw` mudam; os demais são mantidos. Mudar `space`
+    exige `allow_space_change`. O agente fica indisponível durante a reconstrução; o
+    relatório traz tamanho, latência e recall@k antes e depois.
+    """
+    try:
+        result = await run_blocking(
+            "ingest",
+            qa_service.rebuild_agent_index,
+            request.agent_id,
+            request.hnsw.model_dump(exclude_none=True) if request.hnsw else None,
+            request.sample_size,
+            request.allow_space_change
+        )
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Space change without allow_space_change
+        raise HTTPException(status_code=400, detail=f"Parâmetros HNSW inválidos: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao reconstruir índice: {str(e)}")
+
+@app.post("/agents/vector-recall", tags=["Agent Management"])
+async def measure_vector_recall(request: VectorRecallRequest):
+    """Medir o recall@k do índice quantizado (int8/binary) em relação à busca do Chroma"""
+    try:
+        result = await run_blocking(
+            "ingest",
+            qa_service.measure_vector_recall,
+            request.agent_id,
+            request.questions,
+            request.sample_size,
+            request.k,
+            request.quantization
+        )
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # The agent uses the chroma backend and no quantization was given
+        raise HTTPException(status_code=400, detail=f"Informe quantization (int8 ou binary): {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao medir recall: {str(e)}")
+
 @app.delete("/agents/{agent_id}", tags=["Agent Management"])
 async def delete_agent(agent_id: str):
     """Deletar um agente específico"""
     try:
-        result = qa_service.delete_agent(agent_id)
+        result = await run_blocking("ingest", qa_service.delete_agent, agent_id)
         if result["status"] == "not_found":
             raise HTTPException(status_code=404, detail=f"Agente {agent_id} não encontrado")
         return result
@@ -198,7 +582,11 @@ async def delete_agent(agent_id: str):
 async def ask_agent(request: AgentQuestionRequest):
     """Fazer uma pergunta para um agente específico"""
     try:
-        result = qa_service.ask_agent(request.agent_id, request.question)
+        check_filter(request.filter)
+        result = await run_blocking(
+            "generate", qa_service.ask_agent, request.agent_id, request.question,
+            request.retrieval_mode, request.filter
+        )
         if "error" in result:
             raise HTTPException(status_code=404, detail=result["error"])
         
@@ -210,18 +598,125 @@ async def ask_agent(request: AgentQuestionRequest):
             agent_name=result["agent_name"],
             question=result["question"],
             answer=result["answer"],
-            relevant_documents=doc_objects
+            relevant_documents=doc_objects,
+            prompt_tokens=result.get("prompt_tokens"),
+            cache_hit=result.get("cache_hit", False)
         )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar pergunta: {str(e)}")
 
+def format_sse(events: Iterator[Tuple[str, Dict[str, Any]]]) -> Iterator[str]:
+    """Serialize (event, data) pairs as Server-Sent Events"""
+    try:
+        for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+    except Exception as e:
+        error = json.dumps({"error": f"Erro ao processar pergunta: {str(e)}"}, ensure_ascii=False)
+        yield f"event: error\ndata: {error}\n\n"
+
+@app.post("/agents/ask/stream", tags=["Agent Interaction"])
+async def ask_agent_stream(request: AgentQuestionRequest):
+    """
+    Fazer uma pergunta para um agente específico com resposta em streaming
+    
+    Envia eventos SSE: `documents` (documentos recuperados), `token` (trechos da
+    resposta conforme são gerados) e `done` (resposta completa e tempo até o primeiro token).
+    """
+    try:
+        check_filter(request.filter)
+        # Opening a cold agent touches disk, so it goes through the executor too
+        result = await run_blocking(
+            "retrieve", qa_service.stream_agent_answer, request.agent_id, request.question,
+            request.retrieval_mode, request.filter
+        )
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        
+        return StreamingResponse(
+            stream_blocking("generate", format_sse(result["events"])),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao processar pergunta: {str(e)}")
+
+def format_jsonl(items: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    """Serialize items as JSON Lines"""
+    try:
+        for item in items:
+            yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": f"Erro ao processar lote: {str(e)}"}, ensure_ascii=False) + "\n"
+
+@app.post("/agents/ask-batch", tags=["Agent Interaction"])
+async def ask_agent_batch(request: BatchQuestionRequest):
+    """
+    Fazer várias perguntas para um agente específico
+    
+    Todas as perguntas são convertidas em embeddings numa única chamada e buscadas
+    numa única consulta ao banco vetorial; as respostas são geradas com até
+    `concurrency` perguntas em paralelo. Cada linha da resposta (JSON Lines) traz o
+    `index` da pergunta, a resposta e os tempos, na ordem em que ficam prontas.
+    """
+    try:
+        check_filter(request.filter)
+        result = await run_blocking(
+            "retrieve", qa_service.ask_agent_batch, request.agent_id, request.questions,
+            request.retrieval_mode, request.filter, request.concurrency
+        )
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        
+        return StreamingResponse(
+            stream_blocking("generate", format_jsonl(result["results"])),
+            media_type="application/x-ndjson"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao processar perguntas: {str(e)}")
+
+@app.post("/agents/documents-batch", tags=["Agent Interaction"])
+async def get_agent_documents_batch(request: BatchQuestionRequest):
+    """Obter documentos relevantes de um agente para várias perguntas (JSON Lines, uma linha por pergunta)"""
+    try:
+        check_filter(request.filter)
+        result = await run_blocking(
+            "retrieve", qa_service.get_relevant_documents_batch, request.agent_id, request.questions,
+            request.retrieval_mode, request.filter
+        )
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        
+        return StreamingResponse(format_jsonl(iter(result["results"])), media_type="application/x-ndjson")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar documentos: {str(e)}")
+
 @app.post("/agents/ask-all", tags=["Agent Interaction"])
-async def ask_all_agents(request: QuestionRequest):
-    """Fazer uma pergunta para todos os agentes"""
+async def ask_all_agents(request: AskAllRequest):
+    """
+    Fazer uma pergunta para os agentes relevantes
+    
+    Cada agente recebe uma pontuação de relevância para a pergunta (descrição e
+    documentos); só os `top_n` melhores com pontuação de pelo menos `min_score` são
+    consultados. As pontuações de todos os agentes vêm em `routing_scores`.
+    
+    Um agente que estoura o tempo continua ocupando um worker até terminar; com
+    o executor `ask-all` cheio os agentes sem vaga vêm com erro (HTTP 429 se nenhum
+    pôde ser consultado).
+    """
     try:
-        result = qa_service.ask_all_agents(request.question)
+        check_filter(request.filter)
+        result = await run_blocking(
+            "generate", qa_service.ask_all_agents, request.question, request.retrieval_mode, request.filter,
+            request.top_n, request.min_score
+        )
         
         # Convert responses to proper format
         formatted_responses = {}
@@ -233,7 +728,9 @@ async def ask_all_agents(request: QuestionRequest):
                     agent_name=response["agent_name"],
                     question=response["question"],
                     answer=response["answer"],
-                    relevant_documents=doc_objects
+                    relevant_documents=doc_objects,
+                    prompt_tokens=response.get("prompt_tokens"),
+                    cache_hit=response.get("cache_hit", False)
                 )
             else:
                 # Keep error responses as is
@@ -242,16 +739,30 @@ async def ask_all_agents(request: QuestionRequest):
         return {
             "question": result["question"],
             "responses": formatted_responses,
-            "total_agents": result["total_agents"]
+            "total_agents": result["total_agents"],
+            "registered_agents": result["registered_agents"],
+            "routing_scores": result["routing_scores"]
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar pergunta: {str(e)}")
 
 @app.post("/agents/documents", tags=["Agent Interaction"])
 async def get_agent_documents(request: AgentQuestionRequest):
-    """Obter documentos relevantes de um agente específico"""
+    """
+    Obter documentos relevantes de um agente específico
+    
+    `filter` restringe a busca por metadados dentro da consulta ao banco vetorial:
+    igualdade (`{"categoria": "cartao"}`), intervalos numéricos (`{"Rating": {"gte": 4}}`)
+    e conjuntos (`{"source": {"in": ["faq.pdf"]}}`).
+    """
     try:
-        result = qa_service.get_relevant_documents(request.agent_id, request.question)
+        check_filter(request.filter)
+        result = await run_blocking(
+            "retrieve", qa_service.get_relevant_documents, request.agent_id, request.question,
+            request.retrieval_mode, request.filter
+        )
         if "error" in result:
             raise HTTPException(status_code=404, detail=result["error"])
         
@@ -273,10 +784,17 @@ async def get_agent_documents(request: AgentQuestionRequest):
 
 @app.post("/agents/documents/add", tags=["Document Management"])
 async def add_documents_to_agent(request: AddDocumentsRequest):
-    """Adicionar documentos a um agente"""
+    """
+    Adicionar documentos a um agente
+    
+    Documentos já armazenados sem alteração não são reprocessados. Com `sync`,
+    documentos das mesmas fontes (`metadata.source`) que não estão na requisição são removidos.
+    """
     try:
         documents = [{"content": doc.content, "metadata": doc.metadata} for doc in request.documents]
-        result = qa_service.add_documents_to_agent(request.agent_id, documents)
+        result = await run_blocking(
+            "ingest", qa_service.add_documents_to_agent, request.agent_id, documents, sync=request.sync
+        )
         
         if "error" in result:
             raise HTTPException(status_code=404, detail=result["error"])
@@ -287,100 +805,147 @@ async def add_documents_to_agent(request: AddDocumentsRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao adicionar documentos: {str(e)}")
 
+# The upload and job endpoints below do only file and SQLite I/O, so they are plain
+# def handlers: FastAPI runs them on its thread pool instead of the event loop, and
+# they don't wait behind long operations on the bounded executors
+
+def save_upload(file: UploadFile, suffix: str) -> str:
+    """Save an uploaded file where its ingestion job can read it"""
+    path = qa_service.new_upload_path(suffix)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(file.file, f, 1024 * 1024)
+    return path
+
 @app.post("/agents/documents/upload-csv", tags=["Document Management"])
-async def upload_csv_to_agent(
+def upload_csv_to_agent(
     agent_id: str,
     title_col: str,
     content_col: str,
     metadata_cols: Optional[str] = None,
+    sync: bool = False,
     file: UploadFile = File(...)
 ):
-    """Upload e adicionar CSV a um agente"""
+    """
+    Upload e adicionar CSV a um agente
+    
+    O arquivo é processado em segundo plano. A resposta traz o `job_id`;
+    acompanhe o progresso em /agents/jobs/{job_id}. Linhas já armazenadas sem
+    alteração não são reprocessadas; com `sync`, linhas de um envio anterior do mesmo
+    arquivo que não existem mais são removidas.
+    """
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(mode="wb", suffix=".csv", delete=False) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
+        # Parse metadata columns
+        metadata_col_list = None
+        if metadata_cols:
+            metadata_col_list = [col.strip() for col in metadata_cols.split(",")]
         
-        try:
-            # Parse metadata columns
-            metadata_col_list = None
-            if metadata_cols:
-                metadata_col_list = [col.strip() for col in metadata_cols.split(",")]
-            
-            result = qa_service.add_csv_to_agent(
-                agent_id=agent_id,
-                csv_path=temp_path,
-                title_col=title_col,
-                content_col=content_col,
-                metadata_cols=metadata_col_list
-            )
-            
-            if "error" in result:
-                if "not found" in result["error"].lower():
-                    raise HTTPException(status_code=404, detail=result["error"])
-                else:
-                    raise HTTPException(status_code=400, detail=result["error"])
-            
-            return result
-        finally:
-            # Clean up temp file
-            os.unlink(temp_path)
-            
+        upload_path = save_upload(file, ".csv")
+        result = qa_service.submit_csv_job(
+            agent_id=agent_id,
+            csv_path=upload_path,
+            file_name=file.filename,
+            title_col=title_col,
+            content_col=content_col,
+            metadata_cols=metadata_col_list,
+            sync=sync
+        )
+        
+        if "error" in result:
+            os.unlink(upload_path)
+            raise HTTPException(status_code=404, detail=result["error"])
+        
+        return result
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao fazer upload do CSV: {str(e)}")
 
 @app.post("/agents/documents/upload-pdf", tags=["Document Management"])
-async def upload_pdf_to_agent(
+def upload_pdf_to_agent(
     agent_id: str,
     metadata: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    sync: bool = False,
     file: UploadFile = File(...)
 ):
-    """Upload e adicionar PDF a um agente"""
+    """
+    Upload e adicionar PDF a um agente
+    
+    O arquivo é processado em segundo plano. A resposta traz o `job_id`;
+    acompanhe o progresso em /agents/jobs/{job_id}. As páginas são divididas em
+    trechos de `chunk_size` caracteres com sobreposição de `chunk_overlap`. Com `sync`,
+    trechos de um envio anterior do mesmo arquivo que não existem mais são removidos.
+    """
     try:
         # Validate file type
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Arquivo deve ser um PDF")
         
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(mode="wb", suffix=".pdf", delete=False) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
+        # Parse metadata
+        metadata_dict = None
+        if metadata:
+            try:
+                metadata_dict = json.loads(metadata)
+            except json.JSONDecodeError:
+                raise HTTPException(status_code=400, detail="Metadata deve ser um JSON válido")
         
-        try:
-            # Parse metadata
-            metadata_dict = None
-            if metadata:
-                try:
-                    metadata_dict = json.loads(metadata)
-                except json.JSONDecodeError:
-                    raise HTTPException(status_code=400, detail="Metadata deve ser um JSON válido")
-            
-            result = qa_service.add_pdf_to_agent(
-                agent_id=agent_id,
-                pdf_path=temp_path,
-                metadata=metadata_dict
-            )
-            
-            if "error" in result:
-                if "not found" in result["error"].lower():
-                    raise HTTPException(status_code=404, detail=result["error"])
-                else:
-                    raise HTTPException(status_code=400, detail=result["error"])
-            
-            return result
-        finally:
-            # Clean up temp file
-            os.unlink(temp_path)
-            
+        upload_path = save_upload(file, ".pdf")
+        result = qa_service.submit_pdf_job(
+            agent_id=agent_id,
+            pdf_path=upload_path,
+            file_name=file.filename,
+            metadata=metadata_dict,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            sync=sync
+        )
+        
+        if "error" in result:
+            os.unlink(upload_path)
+            raise HTTPException(status_code=404, detail=result["error"])
+        
+        return result
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao fazer upload do PDF: {str(e)}")
 
+# ==================== INGESTION JOB ENDPOINTS ====================
+
+@app.get("/agents/jobs", tags=["Ingestion Jobs"])
+def list_ingestion_jobs(agent_id: Optional[str] = None):
+    """Listar jobs de ingestão recentes"""
+    try:
+        return qa_service.list_jobs(agent_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar jobs: {str(e)}")
+
+@app.get("/agents/jobs/{job_id}", tags=["Ingestion Jobs"])
+def get_ingestion_job(job_id: str):
+    """Progresso de um job de ingestão (itens processados, taxa, ETA e erros)"""
+    try:
+        result = qa_service.get_job(job_id)
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar job: {str(e)}")
+
+@app.post("/agents/jobs/{job_id}/cancel", tags=["Ingestion Jobs"])
+def cancel_ingestion_job(job_id: str):
+    """Cancelar um job de ingestão na fila ou em execução"""
+    try:
+        result = qa_service.cancel_job(job_id)
+        if "error" in result:
+            raise HTTPException(status_code=404, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao cancelar job: {str(e)}")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Servidor Ollama falso para benchmarks
+
+Deterministic stand-in for the parts of the Ollama HTTP API the project uses:
+- POST /api/embed: feature-hashed bag-of-words embeddings (similar texts get similar vectors)
+- POST /api/generate: a canned answer streamed as NDJSON at a fixed token rate
+- GET /api/tags, /api/version
+
+Run standalone with:
+    python benchmarks/fake_ollama.py --port 11434 --token-rate 50
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any
+import argparse
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+
+ANSWER = (
+    "Com base nos documentos, o atendimento digital reduz o tempo de resposta e os custos, "
+    "e casos como segunda via de boleto e consulta de extrato podem ser automatizados."
+)
+
+def hash_embedding(text: str, dim: int) -> List[float]:
+    """Signed feature hashing of the text's words, normalized to unit length"""
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm:
+        # Texts without words still get a deterministic, non-zero vector
+        vector[int(hashlib.blake2b(text.encode("utf-8"), digest_size=4).hexdigest(), 16) % dim] = 1.0
+        return vector
+    return [x / norm for x in vector]
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle delay the body
+    disable_nagle_algorithm = True
+    # Set by FakeOllamaServer
+    config: Dict[str, Any] = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": []})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/api/embed":
+            self._embed(request)
+        elif self.path == "/api/generate":
+            self._generate(request)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _embed(self, request: Dict[str, Any]) -> None:
+        texts = request.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        delay = self.config["embed_latency"] + self.config["embed_latency_per_text"] * len(texts)
+        if delay:
+            time.sleep(delay)
+        self._send_json({
+            "model": request.get("model"),
+            "embeddings": [hash_embedding(text, self.config["embed_dim"]) for text in texts]
+        })
+
+    def _generate(self, request: Dict[str, Any]) -> None:
+        tokens = re.findall(r"\s*\S+", ANSWER)[:self.config["answer_tokens"]]
+        prompt_tokens = len(request.get("prompt", "")) // 4
+        if self.config["prefill_rate"]:
+            time.sleep(prompt_tokens / self.config["prefill_rate"])
+
+        interval = 1.0 / self.config["token_rate"] if self.config["token_rate"] else 0.0
+        final = {
+            "model": request.get("model"),
+            "created_at": "1970-01-01T00:00:00Z",
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": len(tokens)
+        }
+
+        if request.get("stream", True) is False:
+            time.sleep(interval * len(tokens))
+            final["response"] = "".join(tokens)
+            self._send_json(final)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(interval)
+            self._write_chunk({
+                "model": request.get("model"),
+                "created_at": "1970-01-01T00:00:00Z",
+                "response": token,
+                "done": False
+            })
+        self._write_chunk(final)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload: Dict[str, Any]) -> None:
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakeOllamaServer:
+    """Fake Ollama server running on a background thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, embed_dim: int = 256,
+                 token_rate: float = 50.0, answer_tokens: int = 32, prefill_rate: float = 0.0,
+                 embed_latency: float = 0.0, embed_latency_per_text: float = 0.0):
+        config = {
+            "embed_dim": embed_dim,
+            "token_rate": token_rate,
+            "answer_tokens": answer_tokens,
+            "prefill_rate": prefill_rate,
+            "embed_latency": embed_latency,
+            "embed_latency_per_text": embed_latency_per_text
+        }
+        handler = type("ConfiguredFakeOllamaHandler", (FakeOllamaHandler,), {"config": config})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor Ollama falso e determinístico")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Tokens gerados por segundo (0 = sem espera)")
+    parser.add_argument("--answer-tokens", type=int, default=32)
+    parser.add_argument("--prefill-rate", type=float, default=0.0, help="Tokens de prompt processados por segundo (0 = sem espera)")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Latência fixa de cada chamada de embeddings")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        args.host, args.port, args.embed_dim, args.token_rate, args.answer_tokens, args.prefill_rate,
+        args.embed_latency_ms / 1000
+    )
+    print(f"Ollama falso em {server.url}")
+    server.server.serve_forever()
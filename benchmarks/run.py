@@ -0,0 +1,339 @@
+"""
+Benchmarks de desempenho
+
+Runs ingestion, retrieval, ask and ask-all scenarios against RAGAgent,
+MultiAgentQAService and the FastAPI app, with a deterministic fake Ollama server
+(benchmarks/fake_ollama.py) instead of a real model. Everything runs in a
+throwaway working directory, so local agents and caches are left untouched.
+
+    python benchmarks/run.py                   # full run
+    python benchmarks/run.py --quick           # small corpora, for a quick check
+    python benchmarks/run.py --output out.json --corpus-sizes 1000 20000 --agent-counts 1 8 32
+
+Results are written as JSON with p50/p95/p99 latency (ms) and throughput per scenario.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, ROOT)
+
+from fake_ollama import FakeOllamaServer
+
+TOPICS = ["pix", "boleto", "cartao", "fatura", "extrato", "emprestimo", "investimento", "seguro"]
+WORDS = (
+    "cliente atendimento conta pagamento limite juros prazo taxa banco digital aplicativo "
+    "senha bloqueio transferencia saldo cobranca parcela credito debito suporte chatbot "
+    "automacao contrato renegociacao vencimento comprovante agencia tarifa portabilidade"
+).split()
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    low = math.floor(position)
+    high = math.ceil(position)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+def summarize(name: str, params: Dict[str, Any], latencies: List[float], elapsed: float,
+              items: Optional[int] = None) -> Dict[str, Any]:
+    """Scenario result: latency percentiles in ms and items per second"""
+    ordered = sorted(latencies)
+    items = len(latencies) if items is None else items
+    result = {
+        "scenario": name,
+        "params": params,
+        "operations": len(latencies),
+        "items": items,
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": items / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": 1000 * percentile(ordered, 50),
+            "p95": 1000 * percentile(ordered, 95),
+            "p99": 1000 * percentile(ordered, 99),
+            "mean": 1000 * sum(ordered) / len(ordered) if ordered else 0.0,
+            "max": 1000 * ordered[-1] if ordered else 0.0
+        }
+    }
+    print(f"  {name} {params}: p50 {result['latency_ms']['p50']:.1f} ms, "
+          f"p95 {result['latency_ms']['p95']:.1f} ms, {result['throughput_per_second']:.1f}/s")
+    return result
+
+def timed_calls(fn: Callable[[Any], Any], inputs: List[Any], concurrency: int = 1) -> tuple:
+    """Call fn for every input on concurrency threads; returns (latencies, elapsed)"""
+    def call(value):
+        start = time.perf_counter()
+        fn(value)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        latencies = [call(value) for value in inputs]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(call, inputs))
+    return latencies, time.perf_counter() - start
+
+def synthetic_documents(count: int, seed: int) -> List[Dict[str, Any]]:
+    """Deterministic documents with the metadata shape of the CSV/PDF loaders"""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(count):
+        topic = TOPICS[i % len(TOPICS)]
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 90)))
+        documents.append({
+            "content": f"Documento {i} sobre {topic}: {words}",
+            "metadata": {
+                "categoria": topic,
+                "prioridade": rng.randint(1, 5),
+                "source": f"bench_{i // 500}.csv"
+            }
+        })
+    return documents
+
+def synthetic_questions(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        f"Pergunta {i}: como funciona {rng.choice(TOPICS)} com {rng.choice(WORDS)} e {rng.choice(WORDS)}?"
+        for i in range(count)
+    ]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class ApiServer:
+    """The FastAPI app served by uvicorn on a background thread"""
+
+    def __init__(self, app):
+        import uvicorn
+        self.port = free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "ApiServer":
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self._thread.join()
+
+def run_benchmarks(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    # Imported here: settings are read from the environment set up in main()
+    from langchain_core.documents import Document
+    from agents import agent_manager, AgentConfig
+    from services import qa_service
+    import api
+    import httpx
+
+    results = []
+    # Start from an empty registry (drops the default agent created on first import)
+    for agent_id in agent_manager.agent_ids():
+        agent_manager.delete_agent(agent_id)
+
+    def create_agent(agent_id: str, documents: List[Dict[str, Any]], retrieval_mode: str = "vector"):
+        agent = agent_manager.create_agent(AgentConfig(
+            agent_id=agent_id,
+            name=f"Agente {agent_id}",
+            description=f"Especialista em {agent_id.split('_')[-1]}",
+            system_prompt="Responda com base nos documentos.",
+            retrieval_mode=retrieval_mode
+        ))
+        batch_times = []
+        last = [time.perf_counter()]
+
+        def on_batch(batch):
+            now = time.perf_counter()
+            batch_times.append(now - last[0])
+            last[0] = now
+
+        stats = agent.add_documents(
+            (Document(page_content=doc["content"], metadata=doc["metadata"]) for doc in documents),
+            progress_callback=on_batch
+        )
+        return agent, stats, batch_times
+
+    for size in args.corpus_sizes:
+        print(f"Corpus de {size} documentos")
+        documents = synthetic_documents(size, args.seed)
+        questions = synthetic_questions(args.queries, args.seed + size)
+
+        # Ingestion: latency per written batch, throughput in documents per second
+        agent, stats, batch_times = create_agent(f"bench_{size}", documents)
+        results.append(summarize(
+            "ingest", {"corpus_size": size}, batch_times, stats["elapsed_seconds"], items=stats["documents_processed"]
+        ))
+
+        # Re-ingesting the same documents only hashes and compares them
+        _, stats, batch_times = create_agent(f"bench_{size}", documents)
+        results.append(summarize(
+            "ingest_unchanged", {"corpus_size": size}, batch_times, stats["elapsed_seconds"],
+            items=stats["documents_processed"]
+        ))
+
+        for mode in ("vector", "lexical", "hybrid"):
+            latencies, elapsed = timed_calls(lambda q: agent.retrieve(q, retrieval_mode=mode), questions)
+            results.append(summarize("retrieve", {"corpus_size": size, "retrieval_mode": mode}, latencies, elapsed))
+
+        start = time.perf_counter()
+        agent.retrieve_many(questions)
+        elapsed = time.perf_counter() - start
+        results.append(summarize("retrieve_batch", {"corpus_size": size}, [elapsed], elapsed, items=len(questions)))
+
+        ask_questions = questions[:args.ask_queries]
+        for concurrency in args.concurrency:
+            latencies, elapsed = timed_calls(
+                lambda q: qa_service.ask_agent(f"bench_{size}", q), ask_questions, concurrency
+            )
+            results.append(summarize(
+                "ask", {"corpus_size": size, "concurrency": concurrency}, latencies, elapsed
+            ))
+
+        with ApiServer(api.app) as server, httpx.Client(base_url=server.url, timeout=300) as client:
+            for concurrency in args.concurrency:
+                def post_documents(question):
+                    client.post("/agents/documents", json={"agent_id": f"bench_{size}", "question": question}).raise_for_status()
+
+                def post_ask(question):
+                    client.post("/agents/ask", json={"agent_id": f"bench_{size}", "question": question}).raise_for_status()
+
+                latencies, elapsed = timed_calls(post_documents, questions, concurrency)
+                results.append(summarize(
+                    "api_documents", {"corpus_size": size, "concurrency": concurrency}, latencies, elapsed
+                ))
+                latencies, elapsed = timed_calls(post_ask, ask_questions, concurrency)
+                results.append(summarize(
+                    "api_ask", {"corpus_size": size, "concurrency": concurrency}, latencies, elapsed
+                ))
+
+            start = time.perf_counter()
+            response = client.post(
+                "/agents/ask-batch", json={"agent_id": f"bench_{size}", "questions": ask_questions}
+            )
+            response.raise_for_status()
+            elapsed = time.perf_counter() - start
+            items = [json.loads(line) for line in response.text.splitlines() if line]
+            results.append(summarize(
+                "api_ask_batch", {"corpus_size": size}, [item["total_time"] for item in items], elapsed
+            ))
+
+        agent_manager.delete_agent(f"bench_{size}")
+
+    for count in args.agent_counts:
+        print(f"{count} agentes")
+        agent_ids = [f"bench_agents{count}_{TOPICS[i % len(TOPICS)]}{i}" for i in range(count)]
+        for i, agent_id in enumerate(agent_ids):
+            create_agent(agent_id, synthetic_documents(args.agent_corpus_size, args.seed + i))
+        questions = synthetic_questions(args.ask_queries, args.seed + count)
+
+        for top_n in (0, args.router_top_n):
+            latencies, elapsed = timed_calls(lambda q: qa_service.ask_all_agents(q, top_n=top_n), questions)
+            results.append(summarize(
+                "ask_all", {"agents": count, "top_n": top_n}, latencies, elapsed
+            ))
+
+        for agent_id in agent_ids:
+            agent_manager.delete_agent(agent_id)
+
+    return results
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do sistema RAG com um Ollama falso")
+    parser.add_argument("--output", help="Arquivo JSON de resultados (padrão benchmarks/results/<data>.json)")
+    parser.add_argument("--quick", action="store_true", help="Corpora e contagens pequenos")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+")
+    parser.add_argument("--agent-counts", type=int, nargs="+")
+    parser.add_argument("--agent-corpus-size", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200, help="Perguntas por cenário de busca")
+    parser.add_argument("--ask-queries", type=int, default=40, help="Perguntas por cenário de resposta")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--router-top-n", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Tokens por segundo do Ollama falso")
+    parser.add_argument("--answer-tokens", type=int, default=24)
+    parser.add_argument("--prefill-rate", type=float, default=0.0, help="Tokens de prompt por segundo (0 = instantâneo)")
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--embed-latency-ms", type=float, default=2.0)
+    parser.add_argument("--keep-workdir", action="store_true", help="Manter o diretório temporário de dados")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.corpus_sizes = args.corpus_sizes or [200]
+        args.agent_counts = args.agent_counts or [1, 4]
+        args.queries = min(args.queries, 50)
+        args.ask_queries = min(args.ask_queries, 10)
+    args.corpus_sizes = args.corpus_sizes or [1000, 10000]
+    args.agent_counts = args.agent_counts or [1, 4, 16]
+
+    output = args.output or os.path.join(BENCHMARKS_DIR, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    output = os.path.abspath(output)
+
+    server = FakeOllamaServer(
+        embed_dim=args.embed_dim, token_rate=args.token_rate, answer_tokens=args.answer_tokens,
+        prefill_rate=args.prefill_rate, embed_latency=args.embed_latency_ms / 1000
+    ).start()
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    os.environ["RAG_OLLAMA_BASE_URL"] = server.url
+    # Repeated questions would measure the answer cache instead of the pipeline
+    os.environ.setdefault("RAG_ANSWER_CACHE_ENABLED", "false")
+    os.chdir(workdir)
+
+    try:
+        started = time.time()
+        results = run_benchmarks(args)
+    finally:
+        os.chdir(ROOT)
+        server.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            "duration_seconds": time.time() - started,
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args)
+        },
+        "results": results
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultados em {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Montagem do contexto enviado ao LLM
+
+Retrieved documents are formatted as numbered blocks holding their content and a
+few chosen metadata fields, near-duplicate chunks are dropped and the result is
+packed into a token budget, so prompt size (and prefill time) stays bounded.
+"""
+from langchain_core.documents import Document
+from typing import List, Optional, Sequence, Tuple
+import math
+
+from lexical_index import tokenize
+import settings
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text (Ollama models average ~4 characters per token)"""
+    return math.ceil(len(text) / settings.CHARS_PER_TOKEN) if text else 0
+
+def format_document(index: int, document: Document, metadata_keys: Sequence[str]) -> str:
+    """Format a document as a numbered block with the chosen metadata fields"""
+    fields = [
+        f"{key}: {document.metadata[key]}"
+        for key in metadata_keys
+        if document.metadata.get(key) not in (None, "")
+    ]
+    header = f"[{index}] ({', '.join(fields)})" if fields else f"[{index}]"
+    return f"{header}\n{document.page_content.strip()}"
+
+def _is_near_duplicate(terms: set, kept: List[set], threshold: float) -> bool:
+    for other in kept:
+        union = len(terms | other)
+        if union and len(terms & other) / union >= threshold:
+            return True
+    return False
+
+def build_context(documents: List[Document], token_budget: int,
+                  metadata_keys: Optional[Sequence[str]] = None,
+                  duplicate_threshold: Optional[float] = None) -> Tuple[str, List[Document]]:
+    """Pack documents, in rank order, into at most token_budget tokens
+
+    Documents whose word set overlaps an already packed one by duplicate_threshold
+    (Jaccard) or more are skipped. A document that doesn't fit is skipped in favour of
+    later, shorter ones; the first document is truncated rather than dropped.
+    Returns the context text and the documents it includes.
+    """
+    metadata_keys = settings.CONTEXT_METADATA_KEYS if metadata_keys is None else metadata_keys
+    threshold = settings.CONTEXT_DUPLICATE_THRESHOLD if duplicate_threshold is None else duplicate_threshold
+
+    blocks: List[str] = []
+    included: List[Document] = []
+    kept_terms: List[set] = []
+    used = 0
+    for document in documents:
+        terms = set(tokenize(document.page_content))
+        if _is_near_duplicate(terms, kept_terms, threshold):
+            continue
+
+        block = format_document(len(blocks) + 1, document, metadata_keys)
+        # Blocks are separated by a blank line
+        cost = estimate_tokens(block) + (1 if blocks else 0)
+        if used + cost > token_budget:
+            if blocks:
+                continue
+            block = block[:max(0, token_budget * settings.CHARS_PER_TOKEN)]
+            cost = estimate_tokens(block)
+            if not block:
+                break
+
+        blocks.append(block)
+        included.append(document)
+        kept_terms.append(terms)
+        used += cost
+
+    return "\n\n".join(blocks), included
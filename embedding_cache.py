@@ -0,0 +1,171 @@
+from langchain_core.embeddings import Embeddings
+from typing import List, Dict, Any, Optional
+from array import array
+import hashlib
+import sqlite3
+import threading
+import time
+
+import settings
+from model_registry import get_embeddings
+
+class EmbeddingCache:
+    """Disk-backed LRU cache of embeddings keyed by (model, content hash)"""
+
+    # SQLite limits the number of bound parameters per statement
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Build the cache key for a text embedded with a given model"""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up cached vectors; missing entries are returned as None"""
+        keys = [self.make_key(model, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), self._QUERY_CHUNK):
+                chunk = unique_keys[start:start + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for vector in results if vector is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store vectors and evict the least recently used entries over the limit"""
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), model, array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._size += self._conn.total_changes - before
+
+            if self._size > self.max_entries:
+                # Evict a little more than needed so we don't evict on every insert
+                excess = self._size - self.max_entries + max(1, self.max_entries // 100)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess,)
+                )
+                self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                self.evictions += excess
+
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only calls the underlying model for uncached texts"""
+
+    def __init__(self, underlying: Embeddings, model: str, cache: EmbeddingCache):
+        self.underlying = underlying
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, reusing cached vectors when available"""
+        return self._embed(texts, namespace=self.model, embed_fn=self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, reusing a cached vector when available"""
+        # Queries get their own namespace since some models embed them differently
+        return self._embed(
+            [text],
+            namespace=f"{self.model}:query",
+            embed_fn=lambda missing: [self.underlying.embed_query(t) for t in missing]
+        )[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries with a single call to the model for the uncached ones"""
+        # Ollama embeds queries and documents alike, so the batched document call is used
+        return self._embed(texts, namespace=f"{self.model}:query", embed_fn=self.underlying.embed_documents)
+
+    def _embed(self, texts: List[str], namespace: str, embed_fn) -> List[List[float]]:
+        vectors = self.cache.get_many(namespace, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+
+        if missing:
+            computed = embed_fn(missing)
+            self.cache.put_many(namespace, missing, computed)
+            by_text = dict(zip(missing, computed))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+
+        return vectors
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_embeddings: Dict[str, CachedEmbeddings] = {}
+_shared_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_ENTRIES)
+        return _shared_cache
+
+def get_cached_embeddings(model: str = settings.EMBEDDING_MODEL) -> CachedEmbeddings:
+    """Return the cached embedding function shared by every agent using this model"""
+    cache = get_embedding_cache()
+    with _shared_lock:
+        if model not in _shared_embeddings:
+            _shared_embeddings[model] = CachedEmbeddings(get_embeddings(model), model, cache)
+        return _shared_embeddings[model]
@@ -0,0 +1,132 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+import asyncio
+import contextvars
+import threading
+
+from profiling import run_tracked
+import settings
+
+class QueueFullError(Exception):
+    """Raised when an operation executor has no free worker or queue slot"""
+
+    def __init__(self, operation: str, retry_after: int):
+        super().__init__(f"Too many concurrent '{operation}' operations, retry in {retry_after}s")
+        self.operation = operation
+        self.retry_after = retry_after
+
+class OperationExecutor:
+    """Thread pool with a bounded queue for one class of blocking operations"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"rag-{name}")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Schedule fn on the pool or raise QueueFullError if workers and queue are busy"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(self.name, self.retry_after)
+
+        with self._lock:
+            self.in_flight += 1
+
+        # Propagate context variables (request-scoped state) into the worker thread,
+        # which the profiler samples while the request is profiled
+        context = contextvars.copy_context()
+        try:
+            future = self._pool.submit(context.run, run_tracked, fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Await fn on the pool without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stream(self, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+        """Consume a blocking iterator on the pool, holding a single slot until it ends
+
+        The slot is reserved immediately, so QueueFullError is raised here and not
+        once the caller has started streaming the items.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, ("item", item))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+            finally:
+                close = getattr(iterator, "close", None)
+                if close:
+                    close()
+                loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+
+        self.submit(produce)
+
+        async def consume():
+            try:
+                while True:
+                    kind, value = await queue.get()
+                    if kind == "end":
+                        break
+                    if kind == "error":
+                        raise value
+                    yield value
+            finally:
+                # Client went away or we finished: let the producer stop early
+                stop.set()
+
+        return consume()
+
+    def _release(self, _future: Any) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool size and current load"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.max_workers),
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+# One executor per operation class, so slow generations can't starve retrieval
+executors: Dict[str, OperationExecutor] = {
+    "generate": OperationExecutor(
+        "generate", settings.GENERATE_MAX_WORKERS, settings.GENERATE_MAX_QUEUE, settings.EXECUTOR_RETRY_AFTER
+    ),
+    "retrieve": OperationExecutor(
+        "retrieve", settings.RETRIEVE_MAX_WORKERS, settings.RETRIEVE_MAX_QUEUE, settings.EXECUTOR_RETRY_AFTER
+    ),
+    "ingest": OperationExecutor(
+        "ingest", settings.INGEST_MAX_WORKERS, settings.INGEST_MAX_QUEUE, settings.EXECUTOR_RETRY_AFTER
+    ),
+    # Per-agent calls fanned out by /agents/ask-all (inside a "generate" operation)
+    "ask-all": OperationExecutor(
+        "ask-all", settings.ASK_ALL_MAX_WORKERS, settings.ASK_ALL_MAX_QUEUE, settings.EXECUTOR_RETRY_AFTER
+    ),
+}
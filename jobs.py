@@ -0,0 +1,406 @@
+from typing import List, Dict, Any, Optional
+import csv
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from pdf_extraction import count_pdf_pages
+import settings
+
+class JobCancelled(Exception):
+    """Raised inside a running job when cancellation was requested"""
+
+class JobStore:
+    """SQLite persistence for ingestion jobs so they survive a restart"""
+
+    COLUMNS = [
+        "job_id", "agent_id", "kind", "file_name", "file_path", "params", "status",
+        "total", "done", "errors", "result", "created_at", "started_at", "updated_at",
+        "finished_at", "run_started_at", "run_start_done", "owner", "heartbeat_at", "cancel_requested"
+    ]
+
+    # Columns added after the first release, created on databases that predate them
+    ADDED_COLUMNS = {
+        "owner": "TEXT",
+        "heartbeat_at": "REAL",
+        "cancel_requested": "INTEGER NOT NULL DEFAULT 0"
+    }
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        # Shared by every worker process; wait for a sibling's write instead of failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, agent_id TEXT NOT NULL, kind TEXT NOT NULL, "
+            "file_name TEXT, file_path TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "total INTEGER, done INTEGER NOT NULL DEFAULT 0, errors TEXT NOT NULL DEFAULT '[]', "
+            "result TEXT, created_at REAL NOT NULL, started_at REAL, updated_at REAL NOT NULL, "
+            "finished_at REAL, run_started_at REAL, run_start_done INTEGER NOT NULL DEFAULT 0, "
+            "owner TEXT, heartbeat_at REAL, cancel_requested INTEGER NOT NULL DEFAULT 0)"
+        )
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in self.ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        self._conn.commit()
+
+    def insert(self, job: Dict[str, Any]) -> None:
+        """Insert a new job record"""
+        row = self._to_row(job)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                list(row.values())
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields) -> None:
+        """Update some fields of a job"""
+        fields["updated_at"] = time.time()
+        row = self._to_row(fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in row)} WHERE job_id = ?",
+                list(row.values()) + [job_id]
+            )
+            self._conn.commit()
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Mark a queued job as running for owner; False if another worker got it first"""
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, heartbeat_at = ?, updated_at = ? "
+                "WHERE job_id = ? AND status = 'queued'",
+                (owner, now, now, job_id)
+            ).rowcount == 1
+            self._conn.commit()
+        return claimed
+
+    def cancel_if_queued(self, job_id: str) -> bool:
+        """Cancel a job that no worker has claimed yet"""
+        with self._lock:
+            cancelled = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, updated_at = ? "
+                "WHERE job_id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            ).rowcount == 1
+            self._conn.commit()
+        return cancelled
+
+    def cancel_requested(self, job_id: str) -> bool:
+        """Whether cancellation of a job was requested (by any worker)"""
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def heartbeat(self, owner: str) -> None:
+        """Record that owner is still running its jobs"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'", (time.time(), owner)
+            )
+            self._conn.commit()
+
+    def requeue(self, job_id: str, owner: Optional[str]) -> bool:
+        """Put a running job back in the queue if owner (a dead worker) still holds it"""
+        with self._lock:
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, updated_at = ? "
+                "WHERE job_id = ? AND status = 'running' AND owner IS ?",
+                (time.time(), job_id, owner)
+            ).rowcount == 1
+            self._conn.commit()
+        return requeued
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job by ID"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._from_row(row) if row else None
+
+    def list(self, agent_id: Optional[str] = None, statuses: Optional[List[str]] = None,
+             limit: int = 100) -> List[Dict[str, Any]]:
+        """List jobs, newest first"""
+        conditions, params = [], []
+        if agent_id:
+            conditions.append("agent_id = ?")
+            params.append(agent_id)
+        if statuses:
+            conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs {where} ORDER BY created_at DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    @staticmethod
+    def _to_row(job: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(job)
+        for key in ("params", "errors", "result"):
+            if key in row and row[key] is not None:
+                row[key] = json.dumps(row[key], ensure_ascii=False, default=str)
+        return row
+
+    def _from_row(self, row) -> Dict[str, Any]:
+        job = dict(zip(self.COLUMNS, row))
+        for key in ("params", "errors", "result"):
+            if job[key] is not None:
+                job[key] = json.loads(job[key])
+        return job
+
+class IngestionJobManager:
+    """Runs CSV and PDF ingestion in background workers with progress and cancellation
+
+    The job database may be shared by several server processes. A worker claims a
+    queued job with a conditional update, so each job runs once, and heartbeats the
+    jobs it runs; a running job is only taken over once its owner process is gone or
+    has stopped heartbeating. Cancellation is a flag in the job row, polled after
+    every batch by whichever process runs the job.
+    """
+
+    TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+    def __init__(self, agent_manager, db_path: str = settings.JOBS_DB_PATH,
+                 upload_dir: str = settings.UPLOAD_DIR, workers: int = settings.JOB_WORKERS,
+                 heartbeat_interval: float = settings.JOB_HEARTBEAT_INTERVAL,
+                 stale_after: float = settings.JOB_STALE_AFTER):
+        self.agent_manager = agent_manager
+        self.upload_dir = upload_dir
+        self.store = JobStore(db_path)
+        self.workers = workers
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        # host:pid:random, so a restarted process with a recycled pid isn't mistaken for the old one
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        # Jobs in this process's queue, so recovery doesn't queue them twice
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._started = False
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def start(self) -> None:
+        """Start the worker threads; called once the server starts, so that merely
+        importing the app (e.g. in a spawned process) never picks up jobs"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        # Queued jobs (a sibling may claim them first) and jobs of dead workers resume from `done`
+        self.recover_jobs()
+
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"ingestion-job-{i}", daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, name="ingestion-job-heartbeat", daemon=True).start()
+
+    def recover_jobs(self) -> None:
+        """Queue unclaimed jobs and requeue the running jobs of dead or stale workers"""
+        for job in reversed(self.store.list(statuses=["queued", "running"], limit=1_000_000)):
+            if job["status"] == "running":
+                if not self._owner_is_gone(job) or not self.store.requeue(job["job_id"], job["owner"]):
+                    continue
+            self._enqueue(job["job_id"])
+
+    def _enqueue(self, job_id: str) -> None:
+        with self._lock:
+            if job_id in self._queued:
+                return
+            self._queued.add(job_id)
+        self._queue.put(job_id)
+
+    def _owner_is_gone(self, job: Dict[str, Any]) -> bool:
+        owner = job["owner"] or ""
+        if owner == self.owner:
+            return False
+        host, _, rest = owner.partition(":")
+        pid = rest.partition(":")[0]
+        if host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+        # Jobs from before owners were recorded, or owners on other hosts, go by their heartbeat
+        heartbeat = job["heartbeat_at"] or job["updated_at"]
+        return time.time() - heartbeat > self.stale_after
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self.store.heartbeat(self.owner)
+                self.recover_jobs()
+            except sqlite3.Error:
+                # Busy database: try again on the next beat
+                pass
+
+    def new_upload_path(self, suffix: str) -> str:
+        """Path where an uploaded file is kept until its job finishes"""
+        return os.path.join(self.upload_dir, f"{uuid.uuid4().hex}{suffix}")
+
+    def submit(self, agent_id: str, kind: str, file_path: str, file_name: Optional[str],
+               params: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue an ingestion job for a file already saved with new_upload_path"""
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "agent_id": agent_id,
+            "kind": kind,
+            "file_name": file_name,
+            "file_path": file_path,
+            "params": params,
+            "status": "queued",
+            "done": 0,
+            "errors": [],
+            "created_at": now,
+            "updated_at": now
+        }
+        self.store.insert(job)
+        self._enqueue(job["job_id"])
+        return self.get_job(job["job_id"])
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job with its progress, rate and ETA"""
+        job = self.store.get(job_id)
+        return self._with_progress(job) if job else None
+
+    def list_jobs(self, agent_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """List recent jobs with their progress"""
+        return [self._with_progress(job) for job in self.store.list(agent_id=agent_id, limit=limit)]
+
+    def cancel_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Request cancellation; a running job stops after its current batch"""
+        job = self.store.get(job_id)
+        if not job:
+            return None
+        if job["status"] not in self.TERMINAL_STATUSES:
+            if self.store.cancel_if_queued(job_id):
+                self._finish(job, "cancelled")
+            else:
+                # Running, possibly in another process: it sees the flag after its batch
+                self.store.update(job_id, cancel_requested=1)
+        return self.get_job(job_id)
+
+    def _with_progress(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        rate, eta = None, None
+        if job["status"] == "running" and job["run_started_at"]:
+            # Rate only counts work done since this run started (not before a restart)
+            elapsed = time.time() - job["run_started_at"]
+            processed = job["done"] - job["run_start_done"]
+            if elapsed > 0 and processed > 0:
+                rate = processed / elapsed
+                if job["total"]:
+                    eta = max(0, job["total"] - job["done"]) / rate
+        
+        public = {
+            key: value for key, value in job.items()
+            if key not in ("file_path", "run_started_at", "run_start_done", "owner", "heartbeat_at")
+        }
+        public["rate_per_second"] = rate
+        public["eta_seconds"] = eta
+        public["progress"] = job["done"] / job["total"] if job["total"] else None
+        return public
+
+    def _worker(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                self._queued.discard(job_id)
+            try:
+                # Claimed atomically: the job may also be queued in a sibling process
+                if self.store.claim(job_id, self.owner):
+                    self._run(self.store.get(job_id))
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        if job["cancel_requested"]:
+            # Cancelled while its previous owner was running it
+            self._finish(job, "cancelled")
+            return
+        # Leased so the agent isn't evicted or rebuilt under the running job
+        with self.agent_manager.lease(job["agent_id"]) as agent:
+            if not agent:
+                self._finish(job, "failed", error=f"Agent {job['agent_id']} not found")
+                return
+            self._ingest(job, agent)
+
+    def _ingest(self, job: Dict[str, Any], agent) -> None:
+        job_id = job["job_id"]
+        params = job["params"]
+        if params.get("sync"):
+            # Sync deletes whatever this run doesn't see, so it can't skip the part already
+            # done; unchanged documents are cheap to re-check since nothing is re-embedded
+            job["done"] = 0
+        
+        now = time.time()
+        self.store.update(
+            job_id, status="running", started_at=job["started_at"] or now,
+            run_started_at=now, done=job["done"], run_start_done=job["done"]
+        )
+        progress = {"done": job["done"]}
+
+        def on_batch(batch):
+            if job["kind"] == "pdf":
+                # A page counts as done once its last chunk is written
+                last = batch[-1].metadata
+                page_done = last["page_number"] if last["chunk_index"] == last["page_chunks"] - 1 else last["page_number"] - 1
+                progress["done"] = max(progress["done"], page_done)
+            else:
+                progress["done"] += len(batch)
+            self.store.update(job_id, done=progress["done"])
+            if self.store.cancel_requested(job_id):
+                raise JobCancelled()
+
+        try:
+            if job["kind"] == "csv":
+                if job["total"] is None:
+                    self.store.update(job_id, total=count_csv_rows(job["file_path"]))
+                result = agent.add_csv_documents(
+                    job["file_path"], params["title_col"], params["content_col"], params.get("metadata_cols"),
+                    skip_rows=job["done"], progress_callback=on_batch,
+                    source=job["file_name"], sync=params.get("sync", False)
+                )
+            else:
+                if job["total"] is None:
+                    self.store.update(job_id, total=count_pdf_pages(job["file_path"]))
+                metadata = dict(params.get("metadata") or {})
+                metadata.setdefault("source", job["file_name"] or os.path.basename(job["file_path"]))
+                result = agent.add_pdf_documents(
+                    job["file_path"], metadata,
+                    skip_pages=job["done"], progress_callback=on_batch,
+                    chunk_size=params.get("chunk_size"), chunk_overlap=params.get("chunk_overlap"),
+                    sync=params.get("sync", False)
+                )
+            self._finish(self.store.get(job_id), "completed", result=result)
+        except JobCancelled:
+            self._finish(self.store.get(job_id), "cancelled")
+        except Exception as e:
+            self._finish(self.store.get(job_id), "failed", error=str(e))
+
+    def _finish(self, job: Dict[str, Any], status: str, error: Optional[str] = None,
+                result: Optional[Dict[str, Any]] = None) -> None:
+        errors = job["errors"] + ([error] if error else [])
+        self.store.update(job["job_id"], status=status, errors=errors, result=result, finished_at=time.time())
+        if os.path.exists(job["file_path"]):
+            os.unlink(job["file_path"])
+
+def count_csv_rows(csv_path: str) -> int:
+    """Count data rows in a CSV file (quoted newlines included)"""
+    with open(csv_path, newline="", encoding="utf-8", errors="replace") as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+import heapq
+import math
+import re
+import threading
+import unicodedata
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-insensitive word tokens ("Cartão" and "cartao" match)"""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(char for char in normalized if not unicodedata.combining(char))
+    return _TOKEN_PATTERN.findall(stripped)
+
+class BM25Index:
+    """In-memory BM25 inverted index over document IDs"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {doc_id: term frequency}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        # doc_id -> (length, distinct terms)
+        self._documents: Dict[str, Tuple[int, Tuple[str, ...]]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, documents: Iterable[Tuple[str, str]]) -> None:
+        """Index (doc_id, text) pairs, replacing documents already indexed under the same ID"""
+        with self._lock:
+            for doc_id, text in documents:
+                self._remove(doc_id)
+                frequencies: Dict[str, int] = defaultdict(int)
+                tokens = tokenize(text)
+                for token in tokens:
+                    frequencies[token] += 1
+                for term, frequency in frequencies.items():
+                    self._postings[term][doc_id] = frequency
+                self._documents[doc_id] = (len(tokens), tuple(frequencies))
+                self._total_length += len(tokens)
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        """Drop documents from the index"""
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        entry = self._documents.pop(doc_id, None)
+        if entry is None:
+            return
+        length, terms = entry
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, k: int, allowed_ids: Optional[set] = None) -> List[Tuple[str, float]]:
+        """Return the k best (doc_id, score) pairs for a query, optionally among allowed_ids only"""
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._documents)
+            if not count or not terms:
+                return []
+            average_length = self._total_length / count or 1.0
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if allowed_ids is not None and doc_id not in allowed_ids:
+                        continue
+                    length = self._documents[doc_id][0]
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> Dict[str, Any]:
+        """Index size"""
+        with self._lock:
+            return {"documents": len(self._documents), "terms": len(self._postings)}
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge rankings of document IDs, scoring each ID by the sum of 1 / (k + rank)"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -1,8 +1,8 @@
-from langchain_ollama.llms import OllamaLLM
+from model_registry import get_llm
 from langchain_core.prompts import ChatPromptTemplate
-from vector import retriever
+from vector import get_retriever
 
-model = OllamaLLM(model="llama3.2:1b")
+model = get_llm("llama3.2:1b")
 
 template = """
 You are an exeprt in answering questions about a pizza restaurant
@@ -13,6 +13,7 @@ Here is the question to answer: {question}
 """
 prompt = ChatPromptTemplate.from_template(template)
 chain = prompt | model
+retriever = get_retriever()
 
 while True:
     print("\n\n-------------------------------")
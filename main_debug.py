@@ -1,9 +1,60 @@
 """
 Versão de debug para identificar problemas de startup
+
+Benchmark do tempo de startup (cada execução num processo novo):
+    python main_debug.py --startup-benchmark [execuções]
 """
+import json
+import statistics
+import subprocess
 import sys
+import time
 import traceback
 
+# Run in a fresh interpreter: import the API, serve /health/ready and open the first agent
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(api.app) as client:
+    while client.get("/health/ready").status_code != 200:
+        time.sleep(0.01)
+    ready = time.perf_counter()
+    agent_ids = api.qa_service.agent_manager.agent_ids()
+    if agent_ids:
+        api.qa_service.agent_manager.get_agent(agent_ids[0])
+    opened = time.perf_counter()
+print(json.dumps({
+    "import_api_s": imported - start,
+    "ready_s": ready - start,
+    "first_agent_open_s": opened - ready if agent_ids else None
+}))
+"""
+
+def benchmark_startup(runs: int = 5):
+    """Time cold starts of the API, each in a new process"""
+    print(f"⏱️  Medindo startup da API ({runs} execuções)...")
+    results = []
+    for i in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE], capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process_s"] = time.perf_counter() - start
+        results.append(result)
+        print(f"  #{i + 1}: " + ", ".join(
+            f"{key}={value:.3f}" for key, value in result.items() if value is not None
+        ))
+    
+    print("📊 Medianas:")
+    for key in results[0]:
+        values = [result[key] for result in results if result[key] is not None]
+        if values:
+            print(f"  {key}: {statistics.median(values):.3f}s")
+
 def main():
     try:
         print("🔄 Iniciando diagnóstico...")
@@ -42,4 +93,7 @@ def main():
         input("\nPressione Enter para sair...")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "--startup-benchmark":
+        benchmark_startup(int(sys.argv[2]) if len(sys.argv) > 2 else 5)
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+Filtros de metadados das buscas
+
+A filter maps metadata keys to a value (equality) or to an object of operators:
+
+    {"categoria": "cartao", "Rating": {"gte": 4}, "source": {"in": ["faq.pdf", "manual.pdf"]}}
+
+Supported operators: eq, ne, gt, gte, lt, lte (ranges apply to numeric metadata),
+in and nin. Every condition must hold. Filters are translated to a Chroma where
+clause so they run inside the vector store query.
+"""
+from typing import List, Dict, Any, Optional
+
+OPERATORS = ("eq", "ne", "gt", "gte", "lt", "lte", "in", "nin")
+_SCALARS = (str, int, float, bool)
+
+class InvalidFilterError(ValueError):
+    """A metadata filter that can't be translated to a vector store query"""
+
+def to_chroma_where(metadata_filter: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Translate a metadata filter to a Chroma where clause (None for no filter)"""
+    if not metadata_filter:
+        return None
+    if not isinstance(metadata_filter, dict):
+        raise InvalidFilterError("Filter must be an object mapping metadata keys to conditions")
+
+    clauses: List[Dict[str, Any]] = []
+    for key, condition in metadata_filter.items():
+        if isinstance(condition, dict):
+            if not condition:
+                raise InvalidFilterError(f"Empty condition for {key!r}")
+            for operator, value in condition.items():
+                clauses.append({key: {f"${operator}": _check_operand(key, operator, value)}})
+        else:
+            clauses.append({key: {"$eq": _check_operand(key, "eq", condition)}})
+
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _check_operand(key: str, operator: str, value: Any) -> Any:
+    if operator not in OPERATORS:
+        raise InvalidFilterError(f"Unknown operator {operator!r} for {key!r}, expected one of {OPERATORS}")
+    if operator in ("in", "nin"):
+        if not isinstance(value, list) or not value or not all(isinstance(item, _SCALARS) for item in value):
+            raise InvalidFilterError(f"{operator!r} for {key!r} needs a non-empty list of values")
+        return value
+    if operator in ("gt", "gte", "lt", "lte"):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise InvalidFilterError(f"{operator!r} for {key!r} needs a number")
+        return value
+    if not isinstance(value, _SCALARS):
+        raise InvalidFilterError(f"{operator!r} for {key!r} needs a string, number or boolean")
+    return value
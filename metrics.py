@@ -0,0 +1,146 @@
+"""
+Métricas de latência por etapa
+
+Every stage of answering and ingesting (embedding, search, prompt building,
+generation, ...) is timed with `stage()`. Durations feed a histogram labelled by
+stage, agent and model, exported in the Prometheus text format at /metrics, and
+are also collected per request so the API can return them in a Server-Timing
+header.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+import bisect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# (stage, seconds) recorded during the current request; None outside a timed request
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+class Histogram:
+    """Thread-safe Prometheus histogram with fixed buckets"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in snapshot:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Duration of each answering/ingestion stage",
+    ("stage", "agent", "model")
+)
+REQUEST_SECONDS = Histogram(
+    "rag_http_request_duration_seconds",
+    "HTTP request duration until the response headers are sent",
+    ("method", "path", "status")
+)
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+@contextmanager
+def stage(name: str, agent: str = "", model: str = ""):
+    """Time a block as one stage, recording it in the histogram and the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, agent, model)
+
+def record_stage(name: str, seconds: float, agent: str = "", model: str = "") -> None:
+    """Record an already measured stage duration"""
+    STAGE_SECONDS.observe(seconds, stage=name, agent=agent, model=model)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+@contextmanager
+def timed_request():
+    """Collect the stages run while handling a request (in this context and in the
+    executor threads it submits to, which copy the context)"""
+    global _in_flight
+    timings: List[Tuple[str, float]] = []
+    token = _request_timings.set(timings)
+    with _in_flight_lock:
+        _in_flight += 1
+    try:
+        yield timings
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+        _request_timings.reset(token)
+
+def server_timing_header(timings: Iterable[Tuple[str, float]]) -> str:
+    """Format stage timings as a Server-Timing header, summing repeated stages"""
+    totals: Dict[str, List[float]] = {}
+    for name, seconds in timings:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    return ", ".join(
+        f'{name};dur={1000 * seconds:.2f}' + (f';desc="x{count}"' if count > 1 else "")
+        for name, (seconds, count) in totals.items()
+    )
+
+def in_flight_requests() -> int:
+    with _in_flight_lock:
+        return _in_flight
+
+def render_gauges(name: str, documentation: str, samples: Iterable[Tuple[Dict[str, Any], float]],
+                  metric_type: str = "gauge") -> List[str]:
+    """Render a metric family whose values are read at scrape time"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+    return lines
+
+def render(extra_families: Iterable[List[str]] = ()) -> str:
+    """Prometheus text exposition of the histograms plus gauge families read at scrape time"""
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render()
+    lines += render_gauges("rag_http_requests_in_flight", "HTTP requests being handled", [({}, in_flight_requests())])
+    for family in extra_families:
+        lines += family
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,126 @@
+from langchain_core.embeddings import Embeddings
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple, TYPE_CHECKING
+import threading
+import httpx
+
+import settings
+
+if TYPE_CHECKING:
+    # langchain_ollama is slow to import; it is only loaded when the first client is built
+    from langchain_ollama.llms import OllamaLLM
+
+class FairSemaphore:
+    """Counting semaphore that admits waiters in arrival order"""
+
+    def __init__(self, value: int):
+        self.value = value
+        self.in_use = 0
+        self.waiting = 0
+        self._queue: deque = deque()
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            ticket = object()
+            self._queue.append(ticket)
+            self.waiting += 1
+            try:
+                while self._queue[0] is not ticket or self.in_use >= self.value:
+                    self._condition.wait()
+            finally:
+                self.waiting -= 1
+            self._queue.popleft()
+            self.in_use += 1
+            # The next waiter may be admissible too
+            self._condition.notify_all()
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_use -= 1
+            self._condition.notify_all()
+
+class LimitedEmbeddings(Embeddings):
+    """Embeddings wrapper that queues calls behind the model's concurrency limit"""
+
+    def __init__(self, underlying: Embeddings, model: str):
+        self.underlying = underlying
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with model_slot(self.model):
+            return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with model_slot(self.model):
+            return self.underlying.embed_query(text)
+
+_llms: Dict[Tuple, "OllamaLLM"] = {}
+_embeddings: Dict[Tuple, LimitedEmbeddings] = {}
+_semaphores: Dict[str, FairSemaphore] = {}
+_registry_lock = threading.Lock()
+
+def _client_options() -> Dict[str, Any]:
+    # One keep-alive connection pool per model client, reused by every agent
+    return {
+        "base_url": settings.OLLAMA_BASE_URL,
+        "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+        "client_kwargs": {
+            "limits": httpx.Limits(
+                max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY
+            )
+        }
+    }
+
+def _key(model: str, options: Dict[str, Any]) -> Tuple:
+    return (model, tuple(sorted(options.items())))
+
+def get_llm(model: str, **options) -> "OllamaLLM":
+    """Return the process-wide LLM client for a model and options"""
+    key = _key(model, options)
+    with _registry_lock:
+        if key not in _llms:
+            from langchain_ollama.llms import OllamaLLM
+            _llms[key] = OllamaLLM(model=model, **_client_options(), **options)
+        return _llms[key]
+
+def get_embeddings(model: str, **options) -> LimitedEmbeddings:
+    """Return the process-wide (uncached) embedding client for a model and options"""
+    key = _key(model, options)
+    with _registry_lock:
+        if key not in _embeddings:
+            from langchain_ollama import OllamaEmbeddings
+            _embeddings[key] = LimitedEmbeddings(OllamaEmbeddings(model=model, **_client_options(), **options), model)
+        return _embeddings[key]
+
+def _semaphore(model: str) -> FairSemaphore:
+    with _registry_lock:
+        if model not in _semaphores:
+            limit = settings.OLLAMA_MODEL_CONCURRENCY.get(model, settings.OLLAMA_DEFAULT_CONCURRENCY)
+            _semaphores[model] = FairSemaphore(limit)
+        return _semaphores[model]
+
+@contextmanager
+def model_slot(model: str):
+    """Hold one of the model's concurrent request slots, waiting in arrival order"""
+    semaphore = _semaphore(model)
+    semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+def stats() -> Dict[str, Any]:
+    """Clients in the registry and per-model slot usage"""
+    with _registry_lock:
+        return {
+            "llm_clients": len(_llms),
+            "embedding_clients": len(_embeddings),
+            "models": {
+                model: {"limit": semaphore.value, "in_use": semaphore.in_use, "waiting": semaphore.waiting}
+                for model, semaphore in _semaphores.items()
+            }
+        }
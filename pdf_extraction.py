@@ -0,0 +1,65 @@
+"""
+Extração de texto de PDFs em paralelo
+
+Kept free of heavy imports: the API imports it at startup, so PyPDF2 is only
+imported once a PDF is read. Workers are not forked from the API process: it runs
+threads (executors, job workers) whose locks a forked child could inherit
+mid-acquire. They come from a forkserver that preloads only this module and PyPDF2
+(spawn where forkserver isn't available, e.g. Windows), so they don't re-import
+the app's entry point either.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Iterator, Tuple
+import multiprocessing
+
+import settings
+
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _mp_context = multiprocessing.get_context("forkserver")
+    _mp_context.set_forkserver_preload([__name__, "PyPDF2"])
+else:
+    _mp_context = multiprocessing.get_context("spawn")
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Count pages in a PDF file"""
+    import PyPDF2
+    
+    with open(pdf_path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract (page_index, text) for pages [start, end); runs in a worker process"""
+    import PyPDF2
+    
+    with open(pdf_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [(i, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+def iter_pdf_pages(pdf_path: str, start_page: int = 0, workers: int = settings.PDF_EXTRACT_WORKERS,
+                   pages_per_task: int = settings.PDF_PAGES_PER_TASK) -> Iterator[Tuple[int, str]]:
+    """Yield (page_index, text) in page order, extracting page ranges on a process pool"""
+    total_pages = count_pdf_pages(pdf_path)
+    ranges = [
+        (start, min(start + pages_per_task, total_pages))
+        for start in range(start_page, total_pages, pages_per_task)
+    ]
+
+    # Small documents aren't worth the process start-up cost
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from extract_page_range(pdf_path, start, end)
+        return
+
+    pool = ProcessPoolExecutor(
+        max_workers=min(workers, len(ranges)), mp_context=_mp_context
+    )
+    try:
+        futures = [pool.submit(extract_page_range, pdf_path, start, end) for start, end in ranges]
+        for future in futures:
+            yield from future.result()
+    except BaseException:
+        # Closed early (GeneratorExit from a cancelled job) or failed: drop the ranges not
+        # started yet instead of extracting the rest of the document first
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
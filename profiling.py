@@ -0,0 +1,243 @@
+"""
+Profiler de requisições por amostragem
+
+Opt-in statistical profiler for the API. A fraction of requests (sample rate) is
+profiled from the start; every other request is profiled once it has run for half
+the slow threshold, so a request that turns out slow still has the stacks of its
+slow part. A single background thread reads the stacks of the threads working on
+profiled requests (sys._current_frames) every interval, so requests that aren't
+being profiled pay only for a context variable and a random draw.
+
+Profiles of sampled and slow requests are written as JSON to a rotating slow log
+directory, holding the request parameters, the stage timings from metrics.py and
+the sampled stacks in collapsed ("folded") form, which flamegraph.pl and
+speedscope read directly.
+"""
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Callable
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+import settings
+
+# Start time (to the millisecond, so ids sort chronologically) plus a random suffix
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}-[0-9]{9}-[0-9a-f]{8}$")
+
+class RequestProfile:
+    """Stacks sampled while handling one request"""
+
+    def __init__(self, method: str, path: str, params: Dict[str, Any], sampled: bool):
+        self.created_at = time.time()
+        self.id = (
+            f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.created_at))}"
+            f"{int(self.created_at % 1 * 1000):03d}-{uuid.uuid4().hex[:8]}"
+        )
+        self.method = method
+        self.path = path
+        self.params = params
+        self.sampled = sampled
+        self.start = time.perf_counter()
+        # thread id -> label used as the root frame of its stacks
+        self.threads: Dict[int, str] = {}
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+# Profile of the request being handled; copied into executor threads with the context
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+def _fold(frame) -> str:
+    """Collapse a stack into 'outermost;...;innermost' frames"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def run_tracked(fn: Callable, *args, **kwargs) -> Any:
+    """Run fn, letting the profiler sample this thread for the current request's profile"""
+    profile = _current_profile.get()
+    if profile is None:
+        return fn(*args, **kwargs)
+    thread_id = threading.get_ident()
+    profile.threads[thread_id] = threading.current_thread().name
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.threads.pop(thread_id, None)
+
+class Profiler:
+    """Samples the stacks of profiled requests and keeps a rotating slow log"""
+
+    def __init__(self, directory: str = settings.PROFILE_DIR,
+                 sample_rate: float = settings.PROFILE_SAMPLE_RATE,
+                 slow_threshold: float = settings.PROFILE_SLOW_THRESHOLD,
+                 interval: float = settings.PROFILE_INTERVAL,
+                 max_files: int = settings.PROFILE_MAX_FILES):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.interval = interval
+        self.max_files = max_files
+        self.profiled = 0
+        self._active: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_threshold > 0
+
+    def start(self, method: str, path: str, params: Dict[str, Any]) -> Optional[RequestProfile]:
+        """Begin tracking a request on the calling thread; None when profiling is off"""
+        if not self.enabled:
+            return None
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_threshold <= 0:
+            return None
+
+        profile = RequestProfile(method, path, params, sampled)
+        # The event loop thread is shared with concurrent requests, hence its own label
+        profile.threads[threading.get_ident()] = "event-loop"
+        _current_profile.set(profile)
+        with self._lock:
+            self._active.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="rag-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return profile
+
+    def finish(self, profile: RequestProfile, status: int,
+               timings: List[tuple]) -> Optional[str]:
+        """Stop tracking a request and write its profile if it was sampled or slow"""
+        duration = time.perf_counter() - profile.start
+        with self._lock:
+            self._active.remove(profile)
+        profile.threads.clear()
+
+        slow = self.slow_threshold > 0 and duration >= self.slow_threshold
+        if not (profile.sampled or slow):
+            return None
+        with self._lock:
+            self.profiled += 1
+
+        record = {
+            "id": profile.id,
+            "created_at": profile.created_at,
+            "reason": "slow" if slow else "sampled",
+            "method": profile.method,
+            "path": profile.path,
+            "params": profile.params,
+            "status": status,
+            "duration_ms": 1000 * duration,
+            "stages": [{"stage": name, "ms": 1000 * seconds} for name, seconds in timings],
+            "interval_ms": 1000 * self.interval,
+            "samples": profile.samples,
+            "stacks": dict(profile.stacks.most_common())
+        }
+        return self._write(record)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Summaries of the profiles in the slow log, newest first"""
+        summaries = []
+        for profile_id in reversed(self._profile_ids()):
+            record = self.load(profile_id)
+            if record is None:
+                continue
+            summaries.append({
+                key: record.get(key)
+                for key in ("id", "created_at", "reason", "method", "path", "status", "duration_ms", "samples")
+            })
+        return summaries
+
+    def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """A stored profile, or None if it doesn't exist (or was rotated out)"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Profiler configuration and counters"""
+        with self._lock:
+            active = len(self._active)
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_threshold_seconds": self.slow_threshold,
+            "interval_ms": 1000 * self.interval,
+            "active_requests": active,
+            "profiled": self.profiled,
+            "stored": len(self._profile_ids()),
+            "max_files": self.max_files
+        }
+
+    def _sample_loop(self) -> None:
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                # Unsampled requests are only profiled once they are on their way to being slow
+                due = [
+                    profile for profile in self._active
+                    if profile.sampled or now - profile.start >= self.slow_threshold / 2
+                ]
+            if not due:
+                continue
+
+            frames = sys._current_frames()
+            for profile in due:
+                for thread_id, label in list(profile.threads.items()):
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.stacks[f"{label};{_fold(frame)}"] += 1
+                profile.samples += 1
+            del frames
+
+    def _profile_ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[:-len(".json")] for name in os.listdir(self.directory)
+            if name.endswith(".json") and PROFILE_ID_PATTERN.match(name[:-len(".json")])
+        )
+
+    def _write(self, record: Dict[str, Any]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{record['id']}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+        # Rotate: ids start with a timestamp, so the oldest sort first
+        stale = self._profile_ids()[:-self.max_files] if self.max_files > 0 else []
+        for profile_id in stale:
+            try:
+                os.remove(os.path.join(self.directory, f"{profile_id}.json"))
+            except OSError:
+                pass
+        return path
+
+def to_folded(record: Dict[str, Any]) -> str:
+    """A stored profile's stacks in collapsed format ('frame;frame;frame count' per line)"""
+    return "".join(f"{stack} {count}\n" for stack, count in record.get("stacks", {}).items())
+
+# Global profiler instance
+profiler = Profiler()
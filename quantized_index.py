@@ -0,0 +1,389 @@
+"""
+Índice vetorial quantizado em memória mapeada
+
+Keeps an agent's embeddings in append-only files next to its Chroma store:
+- codes.bin: int8 (1 byte per dimension) or binary (1 bit per dimension) codes,
+  the only part scanned on every query
+- scales.bin: per-vector scale of the int8 codes
+- vectors.bin: full-precision float32 vectors, read only for the rescored candidates
+- ids.txt / deleted.bin: row ids and rows deleted since the last compaction
+
+A query scans the codes with a vectorized dot product (int8) or Hamming distance
+(binary) to pick rescore_factor * k candidates and ranks those by exact cosine
+similarity. The scanned codes take 4x (int8) or 32x (binary) less memory than
+float32 vectors; the full vectors stay on disk and in the page cache.
+
+Several processes (server workers) may share an index directory. Writes take an
+exclusive flock on its lock file, reload the index if another process changed it,
+and bump the number in the generation file when done; searches compare that number
+with the one they loaded and reload first when it moved. Files are only appended to
+or replaced (never truncated in place), so other processes' memory maps stay valid.
+Without fcntl (Windows) there is no cross-process locking: use one writer process.
+"""
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+import json
+import os
+import shutil
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+QUANTIZATIONS = ("int8", "binary")
+
+# Rows scanned per step, bounding the float32 temporaries of the int8 scan
+SCAN_CHUNK_ROWS = 16384
+
+DATA_FILES = ("vectors.bin", "codes.bin", "scales.bin", "ids.txt", "deleted.bin", "meta.json")
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class QuantizedIndex:
+    """int8 or binary quantized vectors with exact rescoring, stored in memory-mapped files"""
+
+    def __init__(self, directory: str, quantization: str = "int8", rescore_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        self.directory = directory
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.dim: Optional[int] = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._live = np.zeros(0, dtype=bool)
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._vectors: Optional[np.ndarray] = None
+        # Generation of the files loaded in memory (-1 = nothing loaded yet)
+        self._generation = -1
+        self._lock = threading.Lock()
+        with self._lock:
+            with self._file_lock(exclusive=False):
+                stale = self._load()
+            if stale:
+                # Built with another quantization: start over
+                with self._file_lock(exclusive=True):
+                    self._clear_locked()
+                    self._bump_generation()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def _code_width(self) -> int:
+        return self.dim if self.quantization == "int8" else (self.dim + 7) // 8
+
+    def add(self, ids: List[str], embeddings: Iterable[Iterable[float]]) -> None:
+        """Add or replace vectors"""
+        if not len(ids):
+            return
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh_locked()
+            self._add_locked(ids, embeddings)
+            self._bump_generation()
+
+    def rebuild(self, pages: Iterable[Tuple[List[str], Iterable[Iterable[float]]]],
+                expected: Optional[int] = None) -> None:
+        """Replace every vector with pages of (ids, embeddings)
+
+        Holds the write lock throughout, so processes rebuilding at once do it one after
+        the other; with expected, a rebuild finding that many vectors (another process
+        just rebuilt it) is skipped.
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh_locked()
+            if expected is not None and len(self._rows) == expected:
+                return
+            self._clear_locked()
+            for ids, embeddings in pages:
+                if len(ids):
+                    self._add_locked(ids, embeddings)
+            self._bump_generation()
+
+    def _add_locked(self, ids: List[str], embeddings: Iterable[Iterable[float]]) -> None:
+        vectors = _normalize_rows(np.asarray(list(embeddings), dtype=np.float32))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._save_meta()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+        self._remove_locked([doc_id for doc_id in ids if doc_id in self._rows])
+        codes, scales = self._quantize(vectors)
+        first_row = len(self._ids)
+        self._drop_partial_rows()
+        with open(self._path("vectors.bin"), "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self._path("codes.bin"), "ab") as f:
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(self._path("scales.bin"), "ab") as f:
+                f.write(scales.tobytes())
+        # ids.txt goes last: rows past its length are ignored when loading
+        with open(self._path("ids.txt"), "a", encoding="utf-8") as f:
+            f.write("".join(f"{doc_id}\n" for doc_id in ids))
+
+        for offset, doc_id in enumerate(ids):
+            self._ids.append(doc_id)
+            self._rows[doc_id] = first_row + offset
+        self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+        self._map_files()
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """Remove vectors, compacting the files once most rows are deleted"""
+        ids = list(ids)
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh_locked()
+            ids = [doc_id for doc_id in ids if doc_id in self._rows]
+            if not ids:
+                return
+            self._remove_locked(ids)
+            if len(self._ids) > 2 * max(len(self._rows), 1):
+                self._compact()
+            self._bump_generation()
+
+    def search(self, query_embeddings: List[List[float]], k: int,
+               allowed_ids: Optional[set] = None) -> List[List[Tuple[str, float]]]:
+        """(id, cosine similarity) of the k nearest vectors to each query, best first"""
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            if self._read_generation() != self._generation:
+                with self._file_lock(exclusive=False):
+                    self._refresh_locked()
+            if self._codes is None or not self._rows:
+                return [[] for _ in range(len(queries))]
+            codes, scales, vectors = self._codes, self._scales, self._vectors
+            ids = self._ids
+            mask = self._live.copy()
+            if allowed_ids is not None:
+                allowed = np.zeros(len(mask), dtype=bool)
+                allowed[[self._rows[doc_id] for doc_id in allowed_ids if doc_id in self._rows]] = True
+                mask &= allowed
+
+        candidates = min(int(mask.sum()), max(k, k * self.rescore_factor))
+        if not candidates:
+            return [[] for _ in range(len(queries))]
+        approximate = self._approximate_scores(queries, codes, scales)
+        approximate[~mask] = -np.inf
+
+        results = []
+        for column, query in enumerate(queries):
+            scores = approximate[:, column]
+            rows = np.argpartition(-scores, candidates - 1)[:candidates]
+            # Exact rescoring reads only these rows of the full-precision vectors
+            rows.sort()
+            exact = vectors[rows] @ query
+            order = np.argsort(-exact)[:k]
+            results.append([(ids[rows[i]], float(exact[i])) for i in order])
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and memory of the quantized codes against float32 vectors"""
+        with self._lock:
+            rows = len(self._ids)
+            code_bytes = rows * self._code_width if self.dim else 0
+            if self._scales is not None:
+                code_bytes += self._scales.nbytes
+            float_bytes = rows * self.dim * 4 if self.dim else 0
+            return {
+                "quantization": self.quantization,
+                "dimensions": self.dim,
+                "vectors": len(self._rows),
+                "deleted_rows": rows - len(self._rows),
+                "rescore_factor": self.rescore_factor,
+                "code_bytes": code_bytes,
+                "float32_bytes": float_bytes,
+                "compression": float_bytes / code_bytes if code_bytes else 0.0
+            }
+
+    def close(self) -> None:
+        """Drop the memory maps"""
+        with self._lock:
+            self._codes = self._scales = self._vectors = None
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.quantization == "binary":
+            return np.packbits(vectors > 0, axis=1), None
+        # Symmetric per-vector scale: v ~= codes * scale
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        codes = np.clip(np.rint(vectors / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _approximate_scores(self, queries: np.ndarray, codes: np.ndarray,
+                            scales: Optional[np.ndarray]) -> np.ndarray:
+        """(rows, queries) scores from the codes alone; higher is closer"""
+        scores = np.empty((len(codes), len(queries)), dtype=np.float32)
+        if self.quantization == "binary":
+            query_bits = np.packbits(queries > 0, axis=1)
+            for start in range(0, len(codes), SCAN_CHUNK_ROWS):
+                chunk = codes[start:start + SCAN_CHUNK_ROWS]
+                for column, bits in enumerate(query_bits):
+                    distances = np.bitwise_count(np.bitwise_xor(chunk, bits)).sum(axis=1, dtype=np.int32)
+                    scores[start:start + len(chunk), column] = -distances
+            return scores
+
+        for start in range(0, len(codes), SCAN_CHUNK_ROWS):
+            chunk = codes[start:start + SCAN_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = (
+                (chunk.astype(np.float32) @ queries.T) * scales[start:start + len(chunk), np.newaxis]
+            )
+        return scores
+
+    def _remove_locked(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        rows = np.asarray([self._rows.pop(doc_id) for doc_id in ids], dtype=np.int64)
+        self._live[rows] = False
+        with open(self._path("deleted.bin"), "ab") as f:
+            f.write(rows.tobytes())
+
+    def _compact(self) -> None:
+        """Rewrite the files with only the live rows"""
+        rows = np.flatnonzero(self._live)
+        live_ids = [self._ids[row] for row in rows]
+        vectors = np.asarray(self._vectors[rows]) if self._vectors is not None else None
+        codes = np.asarray(self._codes[rows]) if self._codes is not None else None
+        scales = np.asarray(self._scales[rows]) if self._scales is not None else None
+        self._codes = self._scales = self._vectors = None
+
+        # Removed and rewritten rather than truncated: other processes may still map the old files
+        for name in ("vectors.bin", "codes.bin", "scales.bin", "ids.txt", "deleted.bin"):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        self._ids, self._rows, self._live = [], {}, np.zeros(0, dtype=bool)
+        if live_ids:
+            with open(self._path("vectors.bin"), "wb") as f:
+                f.write(vectors.tobytes())
+            with open(self._path("codes.bin"), "wb") as f:
+                f.write(codes.tobytes())
+            if scales is not None:
+                with open(self._path("scales.bin"), "wb") as f:
+                    f.write(scales.tobytes())
+            with open(self._path("ids.txt"), "w", encoding="utf-8") as f:
+                f.write("".join(f"{doc_id}\n" for doc_id in live_ids))
+            self._ids = live_ids
+            self._rows = {doc_id: row for row, doc_id in enumerate(live_ids)}
+            self._live = np.ones(len(live_ids), dtype=bool)
+            self._map_files()
+
+    def _clear_locked(self) -> None:
+        """Delete the data files (not the lock and generation files) and forget their rows"""
+        self._codes = self._scales = self._vectors = None
+        for name in DATA_FILES:
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        self.dim = None
+        self._ids, self._rows, self._live = [], {}, np.zeros(0, dtype=bool)
+
+    def _drop_partial_rows(self) -> None:
+        """Cut rows a write interrupted before ids.txt left past the end of the data files
+
+        Only bytes past the rows of ids.txt go, which no memory map covers.
+        """
+        rows = len(self._ids)
+        sizes = {"vectors.bin": rows * self.dim * 4, "codes.bin": rows * self._code_width}
+        if self.quantization == "int8":
+            sizes["scales.bin"] = rows * 4
+        for name, size in sizes.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """flock on the directory's lock file, shared by every process using the index"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self._path("lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self._path("generation"), "r", encoding="ascii") as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _bump_generation(self) -> None:
+        """Tell other processes the files changed (called holding the exclusive lock)"""
+        generation = self._read_generation() + 1
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self._path(f"generation.{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="ascii") as f:
+            f.write(str(generation))
+        os.replace(temp_path, self._path("generation"))
+        self._generation = generation
+
+    def _refresh_locked(self) -> None:
+        """Reload the files if another process changed them since they were loaded"""
+        if self._read_generation() == self._generation:
+            return
+        self._codes = self._scales = self._vectors = None
+        self.dim = None
+        self._ids, self._rows, self._live = [], {}, np.zeros(0, dtype=bool)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _save_meta(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path("meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"quantization": self.quantization, "dimensions": self.dim}, f)
+
+    def _load(self) -> bool:
+        """Load the files (holding the file lock); True if they hold another quantization"""
+        self._generation = self._read_generation()
+        if not os.path.exists(self._path("meta.json")):
+            return False
+        with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["quantization"] != self.quantization:
+            return True
+        self.dim = meta["dimensions"]
+        if os.path.exists(self._path("ids.txt")):
+            with open(self._path("ids.txt"), "r", encoding="utf-8") as f:
+                self._ids = f.read().splitlines()
+        # A write interrupted before ids.txt leaves extra rows in the other files; they are ignored
+        self._live = np.ones(len(self._ids), dtype=bool)
+        if os.path.exists(self._path("deleted.bin")):
+            deleted = np.fromfile(self._path("deleted.bin"), dtype=np.int64)
+            self._live[deleted[deleted < len(self._ids)]] = False
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids) if self._live[row]}
+        self._map_files()
+        return False
+
+    def _map_files(self) -> None:
+        rows = len(self._ids)
+        if not rows:
+            self._codes = self._scales = self._vectors = None
+            return
+        self._vectors = np.memmap(self._path("vectors.bin"), dtype=np.float32, mode="r", shape=(rows, self.dim))
+        code_dtype = np.int8 if self.quantization == "int8" else np.uint8
+        self._codes = np.memmap(self._path("codes.bin"), dtype=code_dtype, mode="r", shape=(rows, self._code_width))
+        self._scales = (
+            np.memmap(self._path("scales.bin"), dtype=np.float32, mode="r", shape=(rows,))
+            if self.quantization == "int8" else None
+        )
+
+def drop_quantized_index(directory: str) -> None:
+    """Delete an index's files"""
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+
+def recall_at_k(expected: List[List[str]], found: List[List[str]]) -> float:
+    """Mean fraction of the expected top-k ids that were found"""
+    recalls = [len(set(want) & set(got)) / len(want) for want, got in zip(expected, found) if want]
+    return sum(recalls) / len(recalls) if recalls else 0.0
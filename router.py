@@ -0,0 +1,132 @@
+from typing import List, Dict, Optional
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+
+from embedding_cache import get_cached_embeddings
+import settings
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class AgentRouter:
+    """Scores a question against every agent to pick the ones worth asking
+
+    An agent's score blends the similarity of the question to its profile
+    (name, description and system prompt) with the similarity to the centroid of
+    its stored document embeddings. Centroids are computed once per agent, kept on
+    disk and recomputed after the agent's documents change. Routing never opens an
+    agent: a centroid is only computed while its agent is open for other reasons,
+    and agents without one are scored by their profile alone.
+    """
+
+    def __init__(self, agent_manager, centroids_path: str = settings.ROUTER_CENTROIDS_PATH,
+                 profile_weight: float = settings.ROUTER_PROFILE_WEIGHT):
+        self.agent_manager = agent_manager
+        self.centroids_path = centroids_path
+        self.profile_weight = profile_weight
+        # agent_id -> (profile text, normalized profile embedding)
+        self._profiles: Dict[str, tuple] = {}
+        # agent_id -> normalized centroid, or None for an agent without documents
+        self._centroids: Dict[str, Optional[np.ndarray]] = self._load_centroids()
+        # Bumped on invalidation so a centroid computed meanwhile isn't stored
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        agent_manager.change_listeners.append(self.invalidate)
+
+    def invalidate(self, agent_id: str) -> None:
+        """Forget an agent's centroid (its documents changed or it was deleted)"""
+        with self._lock:
+            self._versions[agent_id] = self._versions.get(agent_id, 0) + 1
+            if agent_id in self._centroids:
+                del self._centroids[agent_id]
+                self._save_centroids()
+            self._profiles.pop(agent_id, None)
+
+    def score(self, query_embedding: List[float]) -> Dict[str, float]:
+        """Routing score of every registered agent, best first"""
+        query = _normalize(query_embedding)
+        scores = {}
+        for agent_id in self.agent_manager.agent_ids():
+            profile = self._profile(agent_id)
+            if profile is None:
+                continue
+            score = float(profile @ query)
+            centroid = self._centroid(agent_id)
+            if centroid is not None:
+                score = self.profile_weight * score + (1 - self.profile_weight) * float(centroid @ query)
+            scores[agent_id] = score
+        return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+
+    def select(self, scores: Dict[str, float], top_n: Optional[int] = None,
+               min_score: Optional[float] = None) -> List[str]:
+        """Agents to ask: the top_n best scored (0 = all) at or above min_score"""
+        top_n = settings.ROUTER_TOP_N if top_n is None else top_n
+        min_score = settings.ROUTER_MIN_SCORE if min_score is None else min_score
+        selected = [agent_id for agent_id, score in scores.items() if score >= min_score]
+        return selected[:top_n] if top_n else selected
+
+    def _profile(self, agent_id: str) -> Optional[np.ndarray]:
+        config = self.agent_manager.get_config(agent_id)
+        if config is None:
+            return None
+        text = f"{config.name}. {config.description}\n{config.system_prompt}"
+        with self._lock:
+            cached = self._profiles.get(agent_id)
+            if cached and cached[0] == text:
+                return cached[1]
+        vector = _normalize(get_cached_embeddings().embed_query(text))
+        with self._lock:
+            self._profiles[agent_id] = (text, vector)
+        return vector
+
+    def _centroid(self, agent_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            if agent_id in self._centroids:
+                return self._centroids[agent_id]
+            version = self._versions.get(agent_id, 0)
+
+        with self.agent_manager.lease_if_open(agent_id) as agent:
+            if agent is None:
+                return None
+            sample = agent.vector_store._collection.get(
+                include=["embeddings"], limit=settings.ROUTER_CENTROID_SAMPLE
+            )
+        vectors = sample["embeddings"]
+        centroid = None
+        if vectors is not None and len(vectors):
+            rows = np.asarray(vectors, dtype=np.float32)
+            rows /= np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+            centroid = _normalize(rows.mean(axis=0))
+
+        with self._lock:
+            if self._versions.get(agent_id, 0) == version:
+                self._centroids[agent_id] = centroid
+                self._save_centroids()
+        return centroid
+
+    def _load_centroids(self) -> Dict[str, Optional[np.ndarray]]:
+        if not os.path.exists(self.centroids_path):
+            return {}
+        with open(self.centroids_path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        return {
+            agent_id: np.asarray(vector, dtype=np.float32) if vector is not None else None
+            for agent_id, vector in stored.items()
+        }
+
+    def _save_centroids(self) -> None:
+        stored = {
+            agent_id: vector.tolist() if vector is not None else None
+            for agent_id, vector in self._centroids.items()
+        }
+        # Every worker process saves the file: write a temp file of our own, then swap it in
+        directory, name = os.path.split(os.path.abspath(self.centroids_path))
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, prefix=f"{name}.",
+                                         suffix=".tmp", delete=False) as f:
+            json.dump(stored, f)
+        os.replace(f.name, self.centroids_path)
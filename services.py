@@ -1,27 +1,49 @@
 from agents import agent_manager, AgentConfig
+from embedding_cache import get_cached_embeddings, get_embedding_cache
+from executor import executors, OperationExecutor, QueueFullError
+from jobs import IngestionJobManager
+from router import AgentRouter
 from langchain_core.documents import Document
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Iterator
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import os
+import time
+
+import settings
 
 class MultiAgentQAService:
     """Service for managing multiple RAG agents"""
     
-    def __init__(self):
+    def __init__(self, executor: Optional[OperationExecutor] = None,
+                 agent_timeout: float = settings.ASK_ALL_AGENT_TIMEOUT):
         self.agent_manager = agent_manager
+        self.ingestion_jobs = IngestionJobManager(agent_manager)
+        self.router = AgentRouter(agent_manager)
+        self.agent_timeout = agent_timeout
+        self.executor = executor or executors["ask-all"]
     
     def list_agents(self) -> Dict[str, Dict[str, Any]]:
         """List all available agents"""
         return self.agent_manager.list_agents()
     
     def create_agent(self, agent_id: str, name: str, description: str, 
-                    system_prompt: str, model: str = "llama3.2:1b") -> Dict[str, Any]:
+                    system_prompt: str, model: str = "llama3.2:1b",
+                    retrieval_mode: Optional[str] = None, context_token_budget: Optional[int] = None,
+                    context_metadata_keys: Optional[List[str]] = None,
+                    vector_backend: Optional[str] = None,
+                    hnsw_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Create a new agent"""
         config = AgentConfig(
             agent_id=agent_id,
             name=name,
             description=description,
             system_prompt=system_prompt,
-            model=model
+            model=model,
+            retrieval_mode=retrieval_mode or settings.DEFAULT_RETRIEVAL_MODE,
+            context_token_budget=context_token_budget or settings.CONTEXT_TOKEN_BUDGET,
+            context_metadata_keys=context_metadata_keys,
+            vector_backend=vector_backend or settings.DEFAULT_VECTOR_BACKEND,
+            hnsw_params=hnsw_params
         )
         
         agent = self.agent_manager.create_agent(config)
@@ -31,6 +53,11 @@ class MultiAgentQAService:
             "name": name,
             "description": description,
             "model": model,
+            "retrieval_mode": config.retrieval_mode,
+            "context_token_budget": config.context_token_budget,
+            "context_metadata_keys": config.context_metadata_keys,
+            "vector_backend": config.vector_backend,
+            "hnsw_params": config.hnsw_params,
             "status": "created"
         }
     
@@ -42,76 +69,150 @@ class MultiAgentQAService:
             "status": "deleted" if success else "not_found"
         }
     
-    def add_documents_to_agent(self, agent_id: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def add_documents_to_agent(self, agent_id: str, documents: List[Dict[str, Any]], sync: bool = False) -> Dict[str, Any]:
         """Add documents to an agent's knowledge base"""
-        agent = self.agent_manager.get_agent(agent_id)
-        if not agent:
-            return {"error": f"Agent {agent_id} not found"}
-        
-        # Convert dict documents to Document objects
-        doc_objects = []
-        for doc in documents:
-            document = Document(
-                page_content=doc["content"],
-                metadata=doc.get("metadata", {})
-            )
-            doc_objects.append(document)
-        
-        agent.add_documents(doc_objects)
+        with self.agent_manager.lease(agent_id) as agent:
+            if not agent:
+                return {"error": f"Agent {agent_id} not found"}
+            
+            # Convert dict documents to Document objects
+            doc_objects = []
+            for doc in documents:
+                document = Document(
+                    page_content=doc["content"],
+                    metadata=doc.get("metadata", {})
+                )
+                doc_objects.append(document)
+            
+            stats = agent.add_documents(doc_objects, sync=sync)
         
         return {
             "agent_id": agent_id,
             "documents_added": len(documents),
-            "status": "success"
+            "status": "success",
+            "ingestion": stats
         }
     
     def add_csv_to_agent(self, agent_id: str, csv_path: str, title_col: str, 
-                        content_col: str, metadata_cols: Optional[List[str]] = None) -> Dict[str, Any]:
+                        content_col: str, metadata_cols: Optional[List[str]] = None,
+                        sync: bool = False) -> Dict[str, Any]:
         """Add CSV documents to an agent"""
-        agent = self.agent_manager.get_agent(agent_id)
-        if not agent:
-            return {"error": f"Agent {agent_id} not found"}
-        
-        if not os.path.exists(csv_path):
-            return {"error": f"CSV file {csv_path} not found"}
-        
-        try:
-            agent.add_csv_documents(csv_path, title_col, content_col, metadata_cols)
-            return {
-                "agent_id": agent_id,
-                "csv_path": csv_path,
-                "status": "success"
-            }
-        except Exception as e:
-            return {"error": f"Failed to add CSV: {str(e)}"}
-    
-    def add_pdf_to_agent(self, agent_id: str, pdf_path: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self.agent_manager.lease(agent_id) as agent:
+            if not agent:
+                return {"error": f"Agent {agent_id} not found"}
+            
+            if not os.path.exists(csv_path):
+                return {"error": f"CSV file {csv_path} not found"}
+            
+            try:
+                stats = agent.add_csv_documents(csv_path, title_col, content_col, metadata_cols, sync=sync)
+                return {
+                    "agent_id": agent_id,
+                    "csv_path": csv_path,
+                    "status": "success",
+                    "ingestion": stats
+                }
+            except Exception as e:
+                return {"error": f"Failed to add CSV: {str(e)}"}
+    
+    def add_pdf_to_agent(self, agent_id: str, pdf_path: str, metadata: Optional[Dict[str, Any]] = None,
+                        chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                        sync: bool = False) -> Dict[str, Any]:
         """Add PDF documents to an agent"""
-        agent = self.agent_manager.get_agent(agent_id)
-        if not agent:
+        with self.agent_manager.lease(agent_id) as agent:
+            if not agent:
+                return {"error": f"Agent {agent_id} not found"}
+            
+            if not os.path.exists(pdf_path):
+                return {"error": f"PDF file {pdf_path} not found"}
+            
+            try:
+                stats = agent.add_pdf_documents(pdf_path, metadata, chunk_size=chunk_size,
+                                                chunk_overlap=chunk_overlap, sync=sync)
+                return {
+                    "agent_id": agent_id,
+                    "pdf_path": pdf_path,
+                    "status": "success",
+                    "message": "PDF processed and added successfully",
+                    "ingestion": stats
+                }
+            except Exception as e:
+                return {"error": f"Failed to add PDF: {str(e)}"}
+    
+    def new_upload_path(self, suffix: str) -> str:
+        """Where to save an uploaded file before submitting its ingestion job"""
+        return self.ingestion_jobs.new_upload_path(suffix)
+    
+    def submit_csv_job(self, agent_id: str, csv_path: str, file_name: Optional[str], title_col: str,
+                       content_col: str, metadata_cols: Optional[List[str]] = None,
+                       sync: bool = False) -> Dict[str, Any]:
+        """Queue a background job that adds a CSV file to an agent"""
+        if not self.agent_manager.has_agent(agent_id):
             return {"error": f"Agent {agent_id} not found"}
         
-        if not os.path.exists(pdf_path):
-            return {"error": f"PDF file {pdf_path} not found"}
-        
-        try:
-            agent.add_pdf_documents(pdf_path, metadata)
-            return {
-                "agent_id": agent_id,
-                "pdf_path": pdf_path,
-                "status": "success",
-                "message": "PDF processed and added successfully"
-            }
-        except Exception as e:
-            return {"error": f"Failed to add PDF: {str(e)}"}
-    
-    def get_relevant_documents(self, agent_id: str, question: str) -> Dict[str, Any]:
-        """Get relevant documents from a specific agent"""
-        agent = self.agent_manager.get_agent(agent_id)
-        if not agent:
+        return self.ingestion_jobs.submit(agent_id, "csv", csv_path, file_name, {
+            "title_col": title_col,
+            "content_col": content_col,
+            "metadata_cols": metadata_cols,
+            "sync": sync
+        })
+    
+    def submit_pdf_job(self, agent_id: str, pdf_path: str, file_name: Optional[str],
+                       metadata: Optional[Dict[str, Any]] = None, chunk_size: Optional[int] = None,
+                       chunk_overlap: Optional[int] = None, sync: bool = False) -> Dict[str, Any]:
+        """Queue a background job that adds a PDF file to an agent"""
+        if not self.agent_manager.has_agent(agent_id):
             return {"error": f"Agent {agent_id} not found"}
         
-        documents = agent.get_relevant_documents(question)
+        return self.ingestion_jobs.submit(agent_id, "pdf", pdf_path, file_name, {
+            "metadata": metadata,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "sync": sync
+        })
+    
+    def list_jobs(self, agent_id: Optional[str] = None) -> Dict[str, Any]:
+        """List recent ingestion jobs"""
+        return {"jobs": self.ingestion_jobs.list_jobs(agent_id)}
+    
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """Get progress of an ingestion job"""
+        job = self.ingestion_jobs.get_job(job_id)
+        if not job:
+            return {"error": f"Job {job_id} not found"}
+        return job
+    
+    def cancel_job(self, job_id: str) -> Dict[str, Any]:
+        """Cancel a queued or running ingestion job"""
+        job = self.ingestion_jobs.cancel_job(job_id)
+        if not job:
+            return {"error": f"Job {job_id} not found"}
+        return job
+    
+    def rebuild_agent_index(self, agent_id: str, hnsw_params: Optional[Dict[str, Any]] = None,
+                            sample_size: int = 50, allow_space_change: bool = False) -> Dict[str, Any]:
+        """Rebuild (compact) an agent's HNSW index, optionally changing some parameters"""
+        report = self.agent_manager.rebuild_index(agent_id, hnsw_params, sample_size, allow_space_change)
+        if report is None:
+            return {"error": f"Agent {agent_id} not found"}
+        return report
+    
+    def measure_vector_recall(self, agent_id: str, questions: Optional[List[str]] = None, sample_size: int = 100,
+                              k: Optional[int] = None, quantization: Optional[str] = None) -> Dict[str, Any]:
+        """Measure recall@k of a quantized vector index against the agent's Chroma search"""
+        with self.agent_manager.lease(agent_id) as agent:
+            if not agent:
+                return {"error": f"Agent {agent_id} not found"}
+            return agent.measure_recall(questions, sample_size, k, quantization)
+    
+    def get_relevant_documents(self, agent_id: str, question: str, retrieval_mode: Optional[str] = None,
+                               metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Get relevant documents from a specific agent"""
+        with self.agent_manager.lease(agent_id) as agent:
+            if not agent:
+                return {"error": f"Agent {agent_id} not found"}
+            
+            documents = agent.get_relevant_documents(question, retrieval_mode, metadata_filter)
         
         return {
             "agent_id": agent_id,
@@ -120,34 +221,196 @@ class MultiAgentQAService:
             "documents": documents
         }
     
-    def ask_agent(self, agent_id: str, question: str) -> Dict[str, Any]:
+    def get_relevant_documents_batch(self, agent_id: str, questions: List[str], retrieval_mode: Optional[str] = None,
+                                     metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Get relevant documents for many questions with one embedding call and one vector query"""
+        with self.agent_manager.lease(agent_id) as agent:
+            if not agent:
+                return {"error": f"Agent {agent_id} not found"}
+            
+            start = time.perf_counter()
+            documents = agent.get_relevant_documents_many(questions, retrieval_mode, metadata_filter)
+            retrieval_time = time.perf_counter() - start
+        
+        return {
+            "agent_id": agent_id,
+            "agent_name": agent.config.name,
+            "results": [
+                {
+                    "index": i,
+                    "question": question,
+                    "documents": docs,
+                    # The whole batch is retrieved at once; each item reports the batch time
+                    "retrieval_time": retrieval_time
+                }
+                for i, (question, docs) in enumerate(zip(questions, documents))
+            ]
+        }
+    
+    def ask_agent(self, agent_id: str, question: str, retrieval_mode: Optional[str] = None,
+                  metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Ask a question to a specific agent"""
-        agent = self.agent_manager.get_agent(agent_id)
-        if not agent:
+        with self.agent_manager.lease(agent_id) as agent:
+            if not agent:
+                return {"error": f"Agent {agent_id} not found"}
+            
+            return agent.answer_question(question, retrieval_mode=retrieval_mode, metadata_filter=metadata_filter)
+    
+    def ask_agent_batch(self, agent_id: str, questions: List[str], retrieval_mode: Optional[str] = None,
+                        metadata_filter: Optional[Dict[str, Any]] = None,
+                        concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """Ask many questions to an agent, returning a lazy iterator of results in completion order"""
+        # Opened here (a cold open touches disk); the iterator leases it while it runs
+        if not self.agent_manager.get_agent(agent_id):
+            return {"error": f"Agent {agent_id} not found"}
+        
+        return {
+            "agent_id": agent_id,
+            "results": self._leased_iterator(
+                agent_id, lambda agent: agent.answer_many(questions, retrieval_mode, metadata_filter, concurrency)
+            )
+        }
+    
+    def stream_agent_answer(self, agent_id: str, question: str, retrieval_mode: Optional[str] = None,
+                            metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Ask a question to a specific agent, streaming the answer as events"""
+        if not self.agent_manager.get_agent(agent_id):
             return {"error": f"Agent {agent_id} not found"}
         
-        return agent.answer_question(question)
+        return {
+            "agent_id": agent_id,
+            "events": self._leased_iterator(
+                agent_id, lambda agent: agent.stream_answer(question, retrieval_mode, metadata_filter)
+            )
+        }
+    
+    def _leased_iterator(self, agent_id: str, make_iterator: Callable[[Any], Iterator[Any]]) -> Iterator[Any]:
+        """Iterate over an agent's lazy results, holding the agent open until they are consumed
+        
+        The lease is taken on the first next(), so an iterator that is never consumed
+        doesn't keep the agent open.
+        """
+        with self.agent_manager.lease(agent_id) as agent:
+            if not agent:
+                raise RuntimeError(f"Agent {agent_id} not found")
+            yield from make_iterator(agent)
     
-    def ask_all_agents(self, question: str) -> Dict[str, Any]:
-        """Ask a question to all agents and return their responses"""
-        responses = {}
+    def ask_all_agents(self, question: str, retrieval_mode: Optional[str] = None,
+                       metadata_filter: Optional[Dict[str, Any]] = None, top_n: Optional[int] = None,
+                       min_score: Optional[float] = None) -> Dict[str, Any]:
+        """Ask a question to the agents most relevant to it and return their responses
+        
+        The router scores every agent against the question; only the top_n best
+        (0 = all) scoring at least min_score are asked.
+        
+        A timed-out agent can't be interrupted and keeps its slot on the bounded
+        ask-all executor until it finishes. Agents that find it full get an error
+        response; QueueFullError is raised when none of them could be asked.
+        """
+        agent_names = {
+            agent_id: info["name"] for agent_id, info in self.agent_manager.list_agents().items()
+        }
+        
+        # Every agent embeds with the shared embedding function: embed the question once
+        try:
+            query_embedding = get_cached_embeddings().embed_query(question)
+        except Exception:
+            # Let each agent retry and report its own error
+            query_embedding = None
+        
+        routing_scores = {}
+        selected = list(agent_names)
+        if query_embedding is not None:
+            try:
+                routing_scores = self.router.score(query_embedding)
+                selected = [
+                    agent_id for agent_id in self.router.select(routing_scores, top_n, min_score)
+                    if agent_id in agent_names
+                ]
+            except Exception:
+                # Routing is an optimization: fall back to asking every agent
+                routing_scores = {}
+        
+        def ask(agent_id: str) -> Dict[str, Any]:
+            # Agents not open yet are opened here, concurrently with the others
+            with self.agent_manager.lease(agent_id) as agent:
+                if not agent:
+                    raise RuntimeError(f"Agent {agent_id} not found")
+                return agent.answer_question(question, query_embedding, retrieval_mode, metadata_filter)
+        
+        futures, responses, rejected = {}, {}, None
+        for agent_id in selected:
+            try:
+                futures[agent_id] = self.executor.submit(ask, agent_id)
+            except QueueFullError as e:
+                rejected = e
+                responses[agent_id] = {
+                    "error": str(e),
+                    "agent_id": agent_id,
+                    "agent_name": agent_names[agent_id]
+                }
+        if rejected and not futures:
+            raise rejected
         
-        for agent_id, agent in self.agent_manager.agents.items():
+        # Each agent gets agent_timeout seconds from dispatch; agents run concurrently
+        # so the deadline is shared instead of accumulating
+        deadline = time.monotonic() + self.agent_timeout
+        for agent_id, future in futures.items():
             try:
-                response = agent.answer_question(question)
-                responses[agent_id] = response
+                responses[agent_id] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                responses[agent_id] = {
+                    "error": f"Agent timed out after {self.agent_timeout:g}s",
+                    "agent_id": agent_id,
+                    "agent_name": agent_names[agent_id]
+                }
             except Exception as e:
                 responses[agent_id] = {
                     "error": str(e),
                     "agent_id": agent_id,
-                    "agent_name": agent.config.name
+                    "agent_name": agent_names[agent_id]
                 }
         
         return {
             "question": question,
-            "responses": responses,
-            "total_agents": len(responses)
+            "responses": {agent_id: responses[agent_id] for agent_id in selected},
+            "total_agents": len(responses),
+            "registered_agents": len(agent_names),
+            "routing_scores": routing_scores
+        }
+    
+    def get_embedding_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters of the shared embedding cache"""
+        return get_embedding_cache().stats()
+    
+    def get_answer_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters of the answer cache of each open agent"""
+        return {
+            agent_id: agent.answer_cache.stats()
+            for agent_id, agent in self.agent_manager.open_agents().items()
         }
+    
+    def get_agent_manager_stats(self) -> Dict[str, Any]:
+        """Get open agent count and cold open timings"""
+        return self.agent_manager.stats()
+    
+    def warm_up(self, agent_ids: List[str]) -> Dict[str, Any]:
+        """Open agents ahead of their first request"""
+        warmed, failed = [], {}
+        for agent_id in agent_ids:
+            try:
+                if self.agent_manager.get_agent(agent_id) is None:
+                    failed[agent_id] = f"Agent '{agent_id}' not found"
+                else:
+                    warmed.append(agent_id)
+            except Exception as e:
+                failed[agent_id] = str(e)
+        return {"warmed": warmed, "failed": failed}
+    
+    def get_warm_agents(self) -> List[str]:
+        """IDs of the agents currently open"""
+        return list(self.agent_manager.open_agents())
 
 # Global service instance
 qa_service = MultiAgentQAService()
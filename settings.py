@@ -0,0 +1,124 @@
+"""
+Configurações do sistema RAG multi-agente
+
+Todos os valores podem ser sobrescritos por variáveis de ambiente.
+"""
+import os
+
+# Embeddings
+EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "mxbai-embed-large")
+
+# Persistent embedding cache shared by every agent
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("RAG_EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+# /agents/ask-all fan-out. Agents that time out keep their worker until they finish,
+# so once workers and queue are full new asks are refused instead of piling up
+ASK_ALL_MAX_WORKERS = int(os.getenv("RAG_ASK_ALL_MAX_WORKERS", "8"))
+ASK_ALL_MAX_QUEUE = int(os.getenv("RAG_ASK_ALL_MAX_QUEUE", "32"))
+ASK_ALL_AGENT_TIMEOUT = float(os.getenv("RAG_ASK_ALL_AGENT_TIMEOUT", "120"))
+
+# /agents/ask-all routing: ask only the top N agents (0 = all) scoring at least the minimum.
+# Scores blend question similarity to the agent profile and to its documents' centroid
+ROUTER_TOP_N = int(os.getenv("RAG_ROUTER_TOP_N", "3"))
+ROUTER_MIN_SCORE = float(os.getenv("RAG_ROUTER_MIN_SCORE", "-1"))
+ROUTER_PROFILE_WEIGHT = float(os.getenv("RAG_ROUTER_PROFILE_WEIGHT", "0.5"))
+ROUTER_CENTROID_SAMPLE = int(os.getenv("RAG_ROUTER_CENTROID_SAMPLE", "2000"))
+ROUTER_CENTROIDS_PATH = os.getenv("RAG_ROUTER_CENTROIDS_PATH", "./router_centroids.json")
+
+# Batch endpoints (/agents/ask-batch, /agents/documents-batch)
+BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "1000"))
+BATCH_GENERATE_CONCURRENCY = int(os.getenv("RAG_BATCH_GENERATE_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("RAG_BATCH_MAX_CONCURRENCY", "16"))
+
+# Bounded executors for blocking work in the API (workers / extra queued calls per class)
+GENERATE_MAX_WORKERS = int(os.getenv("RAG_GENERATE_MAX_WORKERS", "4"))
+GENERATE_MAX_QUEUE = int(os.getenv("RAG_GENERATE_MAX_QUEUE", "32"))
+RETRIEVE_MAX_WORKERS = int(os.getenv("RAG_RETRIEVE_MAX_WORKERS", "16"))
+RETRIEVE_MAX_QUEUE = int(os.getenv("RAG_RETRIEVE_MAX_QUEUE", "128"))
+INGEST_MAX_WORKERS = int(os.getenv("RAG_INGEST_MAX_WORKERS", "2"))
+INGEST_MAX_QUEUE = int(os.getenv("RAG_INGEST_MAX_QUEUE", "8"))
+EXECUTOR_RETRY_AFTER = int(os.getenv("RAG_EXECUTOR_RETRY_AFTER", "5"))
+
+# Document ingestion
+INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", "64"))
+INGEST_EMBED_WORKERS = int(os.getenv("RAG_INGEST_EMBED_WORKERS", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("RAG_INGEST_MAX_RETRIES", "3"))
+INGEST_RETRY_BACKOFF = float(os.getenv("RAG_INGEST_RETRY_BACKOFF", "0.5"))
+
+# Background ingestion jobs
+JOBS_DB_PATH = os.getenv("RAG_JOBS_DB_PATH", "./ingestion_jobs.sqlite3")
+UPLOAD_DIR = os.getenv("RAG_UPLOAD_DIR", "./uploads")
+JOB_WORKERS = int(os.getenv("RAG_JOB_WORKERS", "1"))
+# Running jobs heartbeat every JOB_HEARTBEAT_INTERVAL seconds; another process takes over a
+# job whose owner died or hasn't heartbeat for JOB_STALE_AFTER seconds
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("RAG_JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_AFTER = float(os.getenv("RAG_JOB_STALE_AFTER", "60"))
+CSV_CHUNK_SIZE = int(os.getenv("RAG_CSV_CHUNK_SIZE", "2000"))
+PDF_CHUNK_SIZE = int(os.getenv("RAG_PDF_CHUNK_SIZE", "1000"))
+PDF_CHUNK_OVERLAP = int(os.getenv("RAG_PDF_CHUNK_OVERLAP", "150"))
+PDF_EXTRACT_WORKERS = int(os.getenv("RAG_PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("RAG_PDF_PAGES_PER_TASK", "8"))
+
+# Semantic answer cache (per agent)
+ANSWER_CACHE_ENABLED = os.getenv("RAG_ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_SIMILARITY = float(os.getenv("RAG_ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# Agents are opened on first use; least recently used ones are closed past this limit (0 = no limit)
+MAX_OPEN_AGENTS = int(os.getenv("RAG_MAX_OPEN_AGENTS", "64"))
+
+# Vector storage: "per_agent" (./agents_db/<agent_id>) or "shared" (one client, a collection per agent)
+STORAGE_MODE = os.getenv("RAG_STORAGE_MODE", "per_agent")
+SHARED_DB_PATH = os.getenv("RAG_SHARED_DB_PATH", "./agents_store")
+
+# Retrieval: "vector", "hybrid" (BM25 + vector, reciprocal rank fusion) or "lexical" (BM25 only)
+DEFAULT_RETRIEVAL_MODE = os.getenv("RAG_DEFAULT_RETRIEVAL_MODE", "vector")
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+# Prompt context: token budget per answer (default for new agents), metadata shown with each
+# document and word overlap (Jaccard) above which a chunk counts as a duplicate
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_METADATA_KEYS = [
+    key.strip() for key in os.getenv("RAG_CONTEXT_METADATA_KEYS", "source,page_number").split(",") if key.strip()
+]
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("RAG_CONTEXT_DUPLICATE_THRESHOLD", "0.9"))
+CHARS_PER_TOKEN = int(os.getenv("RAG_CHARS_PER_TOKEN", "4"))
+
+# Vector search backend: "chroma" (HNSW) or an in-process quantized index, "int8" or "binary",
+# scanning the codes for rescore_factor * k candidates that are rescored with full vectors
+DEFAULT_VECTOR_BACKEND = os.getenv("RAG_DEFAULT_VECTOR_BACKEND", "chroma")
+QUANTIZED_INDEX_DIR = os.getenv("RAG_QUANTIZED_INDEX_DIR", "./quantized_indexes")
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("RAG_QUANTIZED_RESCORE_FACTOR", "8"))
+
+# Ollama clients, shared by every agent using the same model
+OLLAMA_BASE_URL = os.getenv("RAG_OLLAMA_BASE_URL") or None
+OLLAMA_KEEP_ALIVE = int(os.getenv("RAG_OLLAMA_KEEP_ALIVE", "1800"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("RAG_OLLAMA_MAX_CONNECTIONS", "16"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("RAG_OLLAMA_KEEPALIVE_EXPIRY", "60"))
+# Concurrent requests per model; overrides as "model=limit,model=limit"
+OLLAMA_DEFAULT_CONCURRENCY = int(os.getenv("RAG_OLLAMA_DEFAULT_CONCURRENCY", "4"))
+OLLAMA_MODEL_CONCURRENCY = {
+    model.strip(): int(limit)
+    for model, _, limit in (
+        item.rpartition("=") for item in os.getenv("RAG_OLLAMA_MODEL_CONCURRENCY", "").split(",") if "=" in item
+    )
+}
+
+# Sampling profiler: profile this fraction of requests, and any request slower than the
+# threshold in seconds (0 = off); stacks are sampled every PROFILE_INTERVAL seconds
+PROFILE_SAMPLE_RATE = float(os.getenv("RAG_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_THRESHOLD = float(os.getenv("RAG_PROFILE_SLOW_THRESHOLD", "0"))
+PROFILE_INTERVAL = float(os.getenv("RAG_PROFILE_INTERVAL", "0.01"))
+PROFILE_DIR = os.getenv("RAG_PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.getenv("RAG_PROFILE_MAX_FILES", "200"))
+
+# Agents opened in the background at startup; /health/ready reports ready once they are warm
+WARM_AGENTS = [agent.strip() for agent in os.getenv("RAG_WARM_AGENTS", "").split(",") if agent.strip()]
+
+# Agent configs shared by every worker process (SQLite in WAL mode); each worker checks the
+# registry version at most every AGENT_REGISTRY_POLL_INTERVAL seconds for other workers' changes
+AGENT_REGISTRY_PATH = os.getenv("RAG_AGENT_REGISTRY_PATH", "./agent_registry.sqlite3")
+AGENT_REGISTRY_POLL_INTERVAL = float(os.getenv("RAG_AGENT_REGISTRY_POLL_INTERVAL", "1"))
@@ -6,6 +6,7 @@ import streamlit as st
 import requests
 import json
 import os
+import time
 from typing import Dict, Any, Optional
 
 # Configuração da página
@@ -90,6 +91,37 @@ def upload_pdf(file, agent_id: str, metadata: Optional[str] = None):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def get_job(job_id: str) -> Dict[str, Any]:
+    """Consulta o progresso de um job de ingestão"""
+    try:
+        response = requests.get(f"{API_BASE_URL}/agents/jobs/{job_id}")
+        return {"success": response.status_code == 200, "data": response.json(), "status": response.status_code}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def wait_for_job(job: Dict[str, Any]):
+    """Acompanha um job de ingestão até terminar, exibindo o progresso"""
+    progress_bar = st.progress(0.0, text=f"Job {job['job_id']} na fila...")
+    while job['status'] in ("queued", "running"):
+        time.sleep(1)
+        result = get_job(job['job_id'])
+        if not result['success']:
+            st.error(f"❌ Erro ao consultar job: {result.get('error', result.get('data'))}")
+            return
+        job = result['data']
+        if job['progress'] is not None:
+            eta = f", ETA {job['eta_seconds']:.0f}s" if job['eta_seconds'] is not None else ""
+            progress_bar.progress(min(job['progress'], 1.0), text=f"{job['done']}/{job['total']} processados{eta}")
+    
+    if job['status'] == "completed":
+        progress_bar.progress(1.0, text="Concluído")
+        st.success("✅ Arquivo processado com sucesso!")
+    elif job['status'] == "cancelled":
+        st.warning("⚠️ Job cancelado")
+    else:
+        st.error(f"❌ Erro: {'; '.join(job['errors']) or 'Falha no processamento'}")
+    st.json(job)
+
 def add_documents(agent_id: str, documents: list):
     """Adiciona documentos individuais"""
     payload = {
@@ -244,12 +276,11 @@ def upload_documents_page(agents):
                 metadata_cols = st.text_input("Colunas de Metadata (separadas por vírgula)", placeholder="categoria,prioridade")
             
             if st.button("Upload CSV"):
-                with st.spinner("Processando CSV..."):
+                with st.spinner("Enviando CSV..."):
                     result = upload_csv(uploaded_file, agent_id, title_col, content_col, metadata_cols)
                 
                 if result['success']:
-                    st.success("✅ CSV processado com sucesso!")
-                    st.json(result['data'])
+                    wait_for_job(result['data'])
                 else:
                     st.error(f"❌ Erro: {result.get('error', 'Erro no upload')}")
     
@@ -266,12 +297,11 @@ def upload_documents_page(agents):
             )
             
             if st.button("Upload PDF"):
-                with st.spinner("Processando PDF..."):
+                with st.spinner("Enviando PDF..."):
                     result = upload_pdf(uploaded_pdf, agent_id, metadata_json)
                 
                 if result['success']:
-                    st.success("✅ PDF processado com sucesso!")
-                    st.json(result['data'])
+                    wait_for_job(result['data'])
                 else:
                     st.error(f"❌ Erro: {result.get('error', 'Erro no upload')}")
     
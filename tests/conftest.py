@@ -0,0 +1,29 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# Importing agents builds the global AgentManager, which creates its registry and
+# reads agents_config.json. Run the tests from a scratch directory with every path
+# setting pointing into it, so nothing is written to (or read from) the checkout.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="rag-tests-")
+
+for name, path in {
+    "RAG_AGENT_REGISTRY_PATH": "agent_registry.sqlite3",
+    "RAG_EMBEDDING_CACHE_PATH": "embedding_cache.sqlite3",
+    "RAG_ROUTER_CENTROIDS_PATH": "router_centroids.json",
+    "RAG_JOBS_DB_PATH": "ingestion_jobs.sqlite3",
+    "RAG_UPLOAD_DIR": "uploads",
+    "RAG_SHARED_DB_PATH": "agents_store",
+    "RAG_QUANTIZED_INDEX_DIR": "quantized_indexes",
+    "RAG_PROFILE_DIR": "profiles",
+}.items():
+    os.environ[name] = os.path.join(WORKDIR, path)
+
+sys.path.insert(0, ROOT)
+os.chdir(WORKDIR)
+
+def pytest_unconfigure(config):
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
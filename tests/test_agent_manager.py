@@ -0,0 +1,32 @@
+import os
+import threading
+
+import pytest
+
+from agents import AgentManager, AgentConfig
+from vector_stores import per_agent_db_path
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = AgentManager(registry_path=str(tmp_path / "registry.sqlite3"), poll_interval=0)
+    yield manager
+    manager.registry.close()
+
+def config(agent_id):
+    return AgentConfig(agent_id=agent_id, name=agent_id, description="Teste", system_prompt="Responda.")
+
+def test_delete_waits_for_leases_before_dropping_the_store(manager):
+    manager.create_agent(config("leased"))
+    deleted = threading.Event()
+
+    with manager.lease("leased") as agent:
+        thread = threading.Thread(target=lambda: manager.delete_agent("leased") and deleted.set())
+        thread.start()
+        assert not deleted.wait(0.3)
+        assert os.path.isdir(per_agent_db_path("leased"))
+        assert agent.vector_store._collection.count() == 0
+
+    thread.join(5)
+    assert deleted.is_set()
+    assert not os.path.exists(per_agent_db_path("leased"))
+    assert "leased" not in manager.agent_ids()
@@ -0,0 +1,87 @@
+import pytest
+
+from agent_registry import AgentRegistry
+from agents import AgentManager, AgentConfig
+
+@pytest.fixture
+def registry_path(tmp_path):
+    return str(tmp_path / "registry.sqlite3")
+
+@pytest.fixture
+def registry(registry_path):
+    registry = AgentRegistry(registry_path)
+    yield registry
+    registry.close()
+
+def config(agent_id, system_prompt="Responda."):
+    return AgentConfig(agent_id=agent_id, name=agent_id, description="Teste", system_prompt=system_prompt)
+
+def test_initialize_seeds_once_without_moving_the_version_again(registry, registry_path):
+    assert registry.initialize([config("a").to_dict()])
+    version = registry.version()
+
+    # A second worker starting on the same registry
+    other = AgentRegistry(registry_path)
+    try:
+        assert not other.initialize([config("b").to_dict()])
+        assert other.version() == version
+        assert list(other.load()[1]) == ["a"]
+    finally:
+        other.close()
+
+def test_writes_move_the_version_only_when_they_change_something(registry):
+    version = registry.version()
+    registry.put(config("a").to_dict())
+    assert registry.version() == version + 1
+
+    assert registry.bump_data_version("a") == 1
+    assert registry.version() == version + 2
+    assert registry.load()[1]["a"][1] == 1
+
+    assert registry.bump_data_version("missing") is None
+    assert not registry.delete("missing")
+    assert registry.version() == version + 2
+
+    assert registry.delete("a")
+    assert registry.version() == version + 3
+
+@pytest.fixture
+def workers(registry_path):
+    managers = [AgentManager(registry_path=registry_path, poll_interval=0) for _ in range(2)]
+    yield managers
+    for manager in managers:
+        manager.registry.close()
+
+def test_second_worker_start_does_not_make_the_first_reload(workers):
+    first, second = workers
+    reloads = first.registry_reloads
+    first.refresh()
+    assert first.registry_reloads == reloads
+    assert first.agent_ids() == second.agent_ids()
+
+def test_workers_pick_up_each_others_changes(workers):
+    first, second = workers
+    first.create_agent(config("shared"))
+    second.refresh()
+    assert "shared" in second.agent_ids()
+
+    first.create_agent(config("shared", system_prompt="Responda em inglês."))
+    second.refresh()
+    assert second.get_config("shared").system_prompt == "Responda em inglês."
+
+    second.delete_agent("shared")
+    first.refresh()
+    assert "shared" not in first.agent_ids()
+
+def test_documents_changed_elsewhere_notify_listeners(workers):
+    first, second = workers
+    first.create_agent(config("docs"))
+    second.refresh()
+    notified = []
+    second.change_listeners.append(notified.append)
+
+    first.notify_documents_changed("docs")
+    second.refresh()
+    assert notified == ["docs"]
+    second.refresh()
+    assert notified == ["docs"]
@@ -0,0 +1,57 @@
+import time
+
+from answer_cache import SemanticAnswerCache
+
+def make_cache(**kwargs):
+    options = {"similarity_threshold": 0.95, "ttl": 60, "max_entries": 10}
+    options.update(kwargs)
+    return SemanticAnswerCache(**options)
+
+def test_near_duplicate_question_hits_and_distinct_question_misses():
+    cache = make_cache()
+    cache.store([1.0, 0.0, 0.0], {"answer": "Abrimos às 18h"})
+
+    hit = cache.lookup([0.99, 0.05, 0.0])
+    assert hit["answer"] == "Abrimos às 18h"
+    assert hit["cache_similarity"] >= 0.95
+    assert cache.lookup([0.7, 0.7, 0.0]) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_returned_results_are_copies():
+    cache = make_cache()
+    cache.store([1.0, 0.0], {"answer": "Sim", "relevant_documents": []})
+    cache.lookup([1.0, 0.0])["relevant_documents"].append("alterado")
+    assert cache.lookup([1.0, 0.0])["relevant_documents"] == []
+
+def test_least_recently_used_entry_is_evicted():
+    cache = make_cache(max_entries=2)
+    cache.store([1.0, 0.0, 0.0], {"answer": "a"})
+    cache.store([0.0, 1.0, 0.0], {"answer": "b"})
+    assert cache.lookup([1.0, 0.0, 0.0])["answer"] == "a"
+
+    cache.store([0.0, 0.0, 1.0], {"answer": "c"})
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0])["answer"] == "a"
+    assert cache.lookup([0.0, 0.0, 1.0])["answer"] == "c"
+
+def test_expired_entries_miss():
+    cache = make_cache(ttl=0.05)
+    cache.store([1.0, 0.0], {"answer": "a"})
+    time.sleep(0.1)
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+def test_zero_max_entries_stores_nothing():
+    cache = make_cache(max_entries=0)
+    cache.store([1.0, 0.0], {"answer": "a"})
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+def test_clear_counts_an_invalidation():
+    cache = make_cache()
+    cache.clear()
+    cache.store([1.0, 0.0], {"answer": "a"})
+    cache.clear()
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.invalidations == 1
@@ -0,0 +1,104 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+import settings
+from agents import RAGAgent
+from answer_cache import SemanticAnswerCache
+from api import BatchQuestionRequest
+
+class FakeEmbeddings:
+    model = "modelo"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_queries(self, texts):
+        self.calls.append(list(texts))
+        # "pergunta 3" -> [3, 1]: distinct questions are far apart, repeats are identical
+        return [[float(text.split()[-1]), 1.0] for text in texts]
+
+class FakeAgent:
+    """Runs the real answer_many around a fake retrieval and generation"""
+
+    answer_many = RAGAgent.answer_many
+    _stage = RAGAgent._stage
+    _uses_answer_cache = RAGAgent._uses_answer_cache
+    _cache_answer = RAGAgent._cache_answer
+
+    def __init__(self, generation_time=0.05, fail_on=None):
+        self.config = SimpleNamespace(agent_id="a", name="A", retrieval_mode="dense")
+        self.embeddings = FakeEmbeddings()
+        self.answer_cache = SemanticAnswerCache(similarity_threshold=0.99, ttl=3600, max_entries=10)
+        self.data_version = 0
+        self.generation_time = generation_time
+        self.fail_on = fail_on
+        self.retrieved = []
+        self.running = 0
+        self.max_running = 0
+        self._running_lock = threading.Lock()
+
+    def retrieve_many(self, questions, query_embeddings, retrieval_mode, metadata_filter):
+        self.retrieved.append(list(questions))
+        return [[] for _ in questions]
+
+    def _generate(self, question, docs):
+        with self._running_lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.generation_time)
+            if question == self.fail_on:
+                raise RuntimeError("model unavailable")
+            return {"agent_id": "a", "agent_name": "A", "question": question, "answer": question.upper(),
+                    "relevant_documents": [], "prompt_tokens": 1, "cache_hit": False}
+        finally:
+            with self._running_lock:
+                self.running -= 1
+
+QUESTIONS = [f"pergunta {i}" for i in range(6)]
+
+def test_batch_embeds_and_retrieves_once_and_answers_every_question():
+    agent = FakeAgent()
+    results = list(agent.answer_many(QUESTIONS, concurrency=3))
+
+    assert agent.embeddings.calls == [QUESTIONS]
+    assert agent.retrieved == [QUESTIONS]
+    assert sorted(result["index"] for result in results) == list(range(6))
+    assert all(result["answer"] == QUESTIONS[result["index"]].upper() for result in results)
+    assert agent.max_running == 3
+
+def test_concurrency_is_capped(monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_CONCURRENCY", 2)
+    agent = FakeAgent()
+    list(agent.answer_many(QUESTIONS, concurrency=50))
+    assert agent.max_running == 2
+
+def test_a_failed_answer_doesnt_stop_the_batch():
+    agent = FakeAgent(generation_time=0, fail_on="pergunta 2")
+    results = {result["index"]: result for result in agent.answer_many(QUESTIONS, concurrency=2)}
+    assert results[2] == {"index": 2, "question": "pergunta 2", "error": "model unavailable"}
+    assert all("answer" in results[i] for i in range(6) if i != 2)
+
+def test_cached_answers_skip_retrieval(monkeypatch):
+    monkeypatch.setattr(settings, "ANSWER_CACHE_ENABLED", True)
+    agent = FakeAgent(generation_time=0)
+    list(agent.answer_many(QUESTIONS[:2]))
+
+    results = {result["index"]: result for result in agent.answer_many(QUESTIONS[:3])}
+    assert agent.retrieved == [QUESTIONS[:2], QUESTIONS[2:3]]
+    assert [results[i]["cache_hit"] for i in range(3)] == [True, True, False]
+
+def test_request_bounds_questions_and_concurrency():
+    BatchQuestionRequest(agent_id="a", questions=["p"], concurrency=settings.BATCH_MAX_CONCURRENCY)
+    with pytest.raises(ValidationError):
+        BatchQuestionRequest(agent_id="a", questions=[])
+    with pytest.raises(ValidationError):
+        BatchQuestionRequest(agent_id="a", questions=["p"] * (settings.BATCH_MAX_QUESTIONS + 1))
+    with pytest.raises(ValidationError):
+        BatchQuestionRequest(agent_id="a", questions=["p"], concurrency=settings.BATCH_MAX_CONCURRENCY + 1)
+    with pytest.raises(ValidationError):
+        BatchQuestionRequest(agent_id="a", questions=["p"], concurrency=0)
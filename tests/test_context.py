@@ -0,0 +1,46 @@
+import pytest
+from langchain_core.documents import Document
+
+import settings
+from context import build_context, estimate_tokens, format_document
+
+@pytest.fixture(autouse=True)
+def four_chars_per_token(monkeypatch):
+    monkeypatch.setattr(settings, "CHARS_PER_TOKEN", 4)
+
+def doc(text, **metadata):
+    return Document(page_content=text, metadata=metadata)
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+def test_format_document_keeps_only_present_metadata():
+    document = doc("  Texto  ", source="faq.pdf", page_number=None, Rating="")
+    assert format_document(2, document, ["source", "page_number", "Rating"]) == "[2] (source: faq.pdf)\nTexto"
+    assert format_document(1, document, []) == "[1]\nTexto"
+
+def test_near_duplicates_are_dropped_and_blocks_renumbered():
+    documents = [
+        doc("o cartao foi bloqueado ontem"),
+        doc("O cartão foi bloqueado ontem!"),
+        doc("segunda via do boleto"),
+    ]
+    text, included = build_context(documents, 1000, metadata_keys=[], duplicate_threshold=0.9)
+    assert included == [documents[0], documents[2]]
+    assert text == "[1]\no cartao foi bloqueado ontem\n\n[2]\nsegunda via do boleto"
+
+def test_documents_that_dont_fit_are_skipped_for_shorter_ones():
+    documents = [doc("a" * 36), doc("b" * 80), doc("c" * 20)]
+    # Blocks cost 10, 21 and 6 tokens (plus 1 per separator)
+    text, included = build_context(documents, 20, metadata_keys=[], duplicate_threshold=1.1)
+    assert included == [documents[0], documents[2]]
+    assert estimate_tokens(text) <= 20
+
+def test_first_document_is_truncated_to_the_budget():
+    documents = [doc("x" * 400), doc("y" * 4)]
+    text, included = build_context(documents, 10, metadata_keys=[], duplicate_threshold=1.1)
+    assert included == [documents[0]]
+    assert len(text) == 40
+    assert build_context(documents, 0, metadata_keys=[]) == ("", [])
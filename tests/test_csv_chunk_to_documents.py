@@ -0,0 +1,22 @@
+import io
+
+import pandas as pd
+
+from agents import csv_chunk_to_documents
+
+def test_empty_cells_become_empty_strings():
+    df = pd.read_csv(io.StringIO("Title,Review,Rating\nBom,Gostei,5\n,Sem titulo,4\nSem texto,,3\n"))
+    documents = csv_chunk_to_documents(df, "Title", "Review", ["Rating"])
+    assert [doc.page_content for doc in documents] == ["Bom Gostei", " Sem titulo", "Sem texto "]
+    assert [doc.metadata["Rating"] for doc in documents] == [5, 4, 3]
+
+def test_single_column_with_empty_cell():
+    df = pd.read_csv(io.StringIO("Review\nGostei\n\"\"\n"))
+    documents = csv_chunk_to_documents(df, "Review", "Review")
+    assert [doc.page_content for doc in documents] == ["Gostei", ""]
+
+def test_row_numbers_count_from_first_row():
+    # One field more than the header: pandas indexes these rows by their first column
+    df = pd.read_csv(io.StringIO("Title,Review\nA,Bom,extra\nB,Ruim,extra\n"))
+    documents = csv_chunk_to_documents(df, "Title", "Review", first_row=4)
+    assert [doc.metadata["row_number"] for doc in documents] == [4, 5]
@@ -0,0 +1,17 @@
+from langchain_core.documents import Document
+
+from agents import document_id, document_position, document_to_dict
+
+def test_identical_chunks_at_different_positions_get_different_ids():
+    first = document_id("a", "menu.pdf", "Rodapé", document_position({"page_number": 1, "chunk_index": 0}))
+    second = document_id("a", "menu.pdf", "Rodapé", document_position({"page_number": 2, "chunk_index": 0}))
+    assert first != second
+
+def test_documents_without_position_keep_their_id():
+    assert document_id("a", "manual", "Texto", document_position({"source": "manual"})) == document_id(
+        "a", "manual", "Texto"
+    )
+
+def test_serialized_documents_leave_out_the_content_hash():
+    document = Document(page_content="Texto", metadata={"source": "manual", "content_hash": "abc"})
+    assert document_to_dict(document) == {"content": "Texto", "metadata": {"source": "manual"}}
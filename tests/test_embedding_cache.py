@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+
+class CountingEmbeddings(Embeddings):
+    """Embeds a text as [length, 1, 0] (exact in float32) and records every call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(("documents", list(texts)))
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append(("query", [text]))
+        return [float(len(text)), 0.0, 1.0]
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embeddings.sqlite3")
+
+@pytest.fixture
+def embeddings(cache_path):
+    return CachedEmbeddings(CountingEmbeddings(), "modelo", EmbeddingCache(cache_path, max_entries=100))
+
+def test_only_uncached_texts_reach_the_model(embeddings):
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0, 1.0, 0.0], [2.0, 1.0, 0.0]]
+    assert embeddings.embed_documents(["bb", "ccc", "ccc", "a"]) == [
+        [2.0, 1.0, 0.0], [3.0, 1.0, 0.0], [3.0, 1.0, 0.0], [1.0, 1.0, 0.0]
+    ]
+    assert embeddings.underlying.calls == [("documents", ["a", "bb"]), ("documents", ["ccc"])]
+
+    stats = embeddings.cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (3, 2, 4)
+
+def test_queries_are_cached_apart_from_documents(embeddings):
+    embeddings.embed_documents(["pizza"])
+    assert embeddings.embed_query("pizza") == [5.0, 0.0, 1.0]
+    assert embeddings.embed_queries(["pizza", "massa"]) == [[5.0, 0.0, 1.0], [5.0, 1.0, 0.0]]
+    assert embeddings.underlying.calls == [
+        ("documents", ["pizza"]), ("query", ["pizza"]), ("documents", ["massa"])
+    ]
+
+def test_cache_persists_across_instances(embeddings, cache_path):
+    embeddings.embed_documents(["a", "bb"])
+    reopened = CachedEmbeddings(CountingEmbeddings(), "modelo", EmbeddingCache(cache_path, max_entries=100))
+    assert reopened.embed_documents(["bb"]) == [[2.0, 1.0, 0.0]]
+    assert reopened.underlying.calls == []
+
+    # Another model doesn't share the vectors
+    other = CachedEmbeddings(CountingEmbeddings(), "outro", reopened.cache)
+    other.embed_documents(["bb"])
+    assert other.underlying.calls == [("documents", ["bb"])]
+
+def test_least_recently_used_entries_are_evicted(cache_path):
+    cache = EmbeddingCache(cache_path, max_entries=3)
+    for text in ["a", "b", "c"]:
+        cache.put_many("modelo", [text], [[1.0]])
+        time.sleep(0.01)
+    cache.get_many("modelo", ["a"])
+
+    cache.put_many("modelo", ["d"], [[1.0]])
+    assert cache.stats()["entries"] == 2
+    assert cache.get_many("modelo", ["a", "b", "c", "d"]) == [[1.0], None, None, [1.0]]
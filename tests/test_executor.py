@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import itertools
+import threading
+
+import pytest
+
+from executor import OperationExecutor, QueueFullError
+
+@pytest.fixture
+def executor():
+    return OperationExecutor("generate", max_workers=1, max_queue=1, retry_after=7)
+
+def test_submissions_beyond_workers_and_queue_are_rejected(executor):
+    release = threading.Event()
+    running = executor.submit(release.wait, 5)
+    queued = executor.submit(lambda: "queued")
+    assert executor.stats()["in_flight"] == 2
+    assert executor.stats()["queued"] == 1
+
+    with pytest.raises(QueueFullError) as e:
+        executor.submit(lambda: "rejected")
+    assert (e.value.operation, e.value.retry_after) == ("generate", 7)
+
+    release.set()
+    assert running.result(5) is True
+    assert queued.result(5) == "queued"
+    stats = executor.stats()
+    assert (stats["in_flight"], stats["completed"], stats["rejected"]) == (0, 2, 1)
+    assert executor.submit(lambda: "again").result(5) == "again"
+
+def test_failed_calls_release_their_slot(executor):
+    def fail():
+        raise ValueError("boom")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            executor.submit(fail).result(5)
+    assert executor.stats()["in_flight"] == 0
+
+def test_run_propagates_context_variables(executor):
+    request_id = contextvars.ContextVar("request_id", default=None)
+
+    async def main():
+        request_id.set("abc")
+        return await executor.run(request_id.get)
+
+    assert asyncio.run(main()) == "abc"
+
+def test_stream_holds_one_slot_and_stops_when_the_consumer_does(executor):
+    async def main():
+        # Endless: the producer only frees its slot if the consumer stopping stops it
+        stream = executor.stream(itertools.count())
+        assert executor.stats()["in_flight"] == 1
+        items = []
+        async for item in stream:
+            items.append(item)
+            if len(items) == 3:
+                break
+        await stream.aclose()
+        return items
+
+    assert asyncio.run(main()) == [0, 1, 2]
+    for _ in range(100):
+        if executor.stats()["in_flight"] == 0:
+            break
+        threading.Event().wait(0.01)
+    assert executor.stats()["in_flight"] == 0
@@ -0,0 +1,200 @@
+import os
+import socket
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from agents import RAGAgent
+from jobs import IngestionJobManager
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one line of text per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    data, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(data)
+
+class FakeAgent:
+    """Runs the real CSV/PDF loaders but keeps the documents instead of embedding them"""
+
+    add_csv_documents = RAGAgent.add_csv_documents
+    add_pdf_documents = RAGAgent.add_pdf_documents
+
+    def __init__(self, batch_size=2, before_batch=None):
+        self.batch_size = batch_size
+        self.before_batch = before_batch
+        self.documents = []
+
+    def add_documents(self, documents, sync=False, default_source="manual", progress_callback=None):
+        documents = list(documents)
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            if self.before_batch:
+                self.before_batch(batch)
+            self.documents.extend(batch)
+            if progress_callback:
+                progress_callback(batch)
+        return {"documents_added": len(documents)}
+
+class FakeAgentManager:
+    def __init__(self, agents):
+        self.agents = agents
+
+    @contextmanager
+    def lease(self, agent_id):
+        yield self.agents.get(agent_id)
+
+@pytest.fixture
+def make_manager(tmp_path):
+    def make(agents, start=True):
+        manager = IngestionJobManager(
+            FakeAgentManager(agents), db_path=str(tmp_path / "jobs.sqlite3"), upload_dir=str(tmp_path / "uploads"),
+            workers=1, heartbeat_interval=0.05, stale_after=1
+        )
+        if start:
+            manager.start()
+        return manager
+    return make
+
+def write_csv(manager, rows):
+    path = manager.new_upload_path(".csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Title,Review\n" + "".join(f"Titulo {i},Texto {i}\n" for i in range(rows)))
+    return path
+
+def wait_finished(manager, job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get_job(job_id)
+        if job["status"] in IngestionJobManager.TERMINAL_STATUSES:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job still {job['status']}")
+
+CSV_PARAMS = {"title_col": "Title", "content_col": "Review"}
+
+def test_csv_job_completes_with_progress(make_manager):
+    agent = FakeAgent()
+    manager = make_manager({"a": agent})
+    path = write_csv(manager, 5)
+    job = manager.submit("a", "csv", path, "reviews.csv", CSV_PARAMS)
+    assert job["status"] == "queued"
+
+    job = wait_finished(manager, job["job_id"])
+    assert job["status"] == "completed"
+    assert (job["done"], job["total"], job["progress"]) == (5, 5, 1.0)
+    assert job["result"] == {"documents_added": 5}
+    assert [doc.metadata["row_number"] for doc in agent.documents] == [1, 2, 3, 4, 5]
+    assert not os.path.exists(path)
+
+def test_cancel_queued_job(make_manager):
+    manager = make_manager({"a": FakeAgent()}, start=False)
+    path = write_csv(manager, 3)
+    job = manager.submit("a", "csv", path, "reviews.csv", CSV_PARAMS)
+
+    assert manager.cancel_job(job["job_id"])["status"] == "cancelled"
+    assert not os.path.exists(path)
+    manager.start()
+    time.sleep(0.2)
+    assert manager.get_job(job["job_id"])["status"] == "cancelled"
+
+def test_cancel_running_csv_job_stops_after_the_batch(make_manager):
+    job_ids = []
+    agent = FakeAgent(before_batch=lambda batch: manager.cancel_job(job_ids[0]))
+    manager = make_manager({"a": agent}, start=False)
+    job_ids.append(manager.submit("a", "csv", write_csv(manager, 6), "reviews.csv", CSV_PARAMS)["job_id"])
+    manager.start()
+
+    job = wait_finished(manager, job_ids[0])
+    assert job["status"] == "cancelled"
+    assert job["done"] == 2
+    assert len(agent.documents) == 2
+
+def test_cancel_running_pdf_job(make_manager, tmp_path):
+    job_ids = []
+    agent = FakeAgent(batch_size=1, before_batch=lambda batch: manager.cancel_job(job_ids[0]))
+    manager = make_manager({"a": agent}, start=False)
+    path = manager.new_upload_path(".pdf")
+    write_pdf(path, ["Primeira pagina", "Segunda pagina", "Terceira pagina"])
+    job_ids.append(manager.submit("a", "pdf", path, "menu.pdf", {})["job_id"])
+    manager.start()
+
+    job = wait_finished(manager, job_ids[0])
+    assert job["status"] == "cancelled"
+    assert job["errors"] == []
+    assert (job["done"], job["total"]) == (1, 3)
+    assert agent.documents[0].metadata["page_number"] == 1
+
+def test_pdf_job_completes(make_manager):
+    agent = FakeAgent()
+    manager = make_manager({"a": agent})
+    path = manager.new_upload_path(".pdf")
+    write_pdf(path, ["Primeira pagina", "Segunda pagina", "Terceira pagina"])
+
+    job = wait_finished(manager, manager.submit("a", "pdf", path, "menu.pdf", {})["job_id"])
+    assert job["status"] == "completed"
+    assert (job["done"], job["total"]) == (3, 3)
+    assert [doc.page_content for doc in agent.documents] == ["Primeira pagina", "Segunda pagina", "Terceira pagina"]
+    assert {doc.metadata["source"] for doc in agent.documents} == {"menu.pdf"}
+
+def test_job_fails_for_unknown_agent_or_ingestion_error(make_manager):
+    def fail(batch):
+        raise RuntimeError("embedding server down")
+
+    manager = make_manager({"broken": FakeAgent(before_batch=fail)})
+    unknown = manager.submit("missing", "csv", write_csv(manager, 2), "reviews.csv", CSV_PARAMS)
+    broken = manager.submit("broken", "csv", write_csv(manager, 2), "reviews.csv", CSV_PARAMS)
+
+    unknown = wait_finished(manager, unknown["job_id"])
+    assert (unknown["status"], unknown["errors"]) == ("failed", ["Agent missing not found"])
+    broken = wait_finished(manager, broken["job_id"])
+    assert (broken["status"], broken["errors"]) == ("failed", ["embedding server down"])
+
+def insert_running_job(manager, path, done, owner, heartbeat_at):
+    now = time.time()
+    manager.store.insert({
+        "job_id": "interrupted", "agent_id": "a", "kind": "csv", "file_name": "reviews.csv", "file_path": path,
+        "params": CSV_PARAMS, "status": "running", "total": 5, "done": done, "errors": [],
+        "created_at": now, "started_at": now, "updated_at": now, "owner": owner, "heartbeat_at": heartbeat_at
+    })
+
+def test_job_of_a_stale_worker_resumes_after_the_rows_done(make_manager):
+    agent = FakeAgent()
+    manager = make_manager({"a": agent}, start=False)
+    insert_running_job(manager, write_csv(manager, 5), 3, "otherhost:1:abcdef12", time.time() - 60)
+    manager.start()
+
+    job = wait_finished(manager, "interrupted")
+    assert job["status"] == "completed"
+    assert job["done"] == 5
+    assert [doc.metadata["row_number"] for doc in agent.documents] == [4, 5]
+    assert [doc.page_content for doc in agent.documents] == ["Titulo 3 Texto 3", "Titulo 4 Texto 4"]
+
+def test_job_of_a_live_worker_is_left_alone(make_manager):
+    manager = make_manager({"a": FakeAgent()}, start=False)
+    owner = f"{socket.gethostname()}:{os.getpid()}:abcdef12"
+    insert_running_job(manager, write_csv(manager, 5), 3, owner, time.time())
+    manager.start()
+
+    time.sleep(0.3)
+    job = manager.store.get("interrupted")
+    assert (job["status"], job["owner"], job["done"]) == ("running", owner, 3)
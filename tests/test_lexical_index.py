@@ -0,0 +1,57 @@
+import math
+
+import pytest
+
+from lexical_index import BM25Index, tokenize, reciprocal_rank_fusion
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    index.add([
+        ("boleto", "Como emitir a segunda via do boleto"),
+        ("cartao", "Cartão de crédito bloqueado: como desbloquear o cartão"),
+        ("pix", "Limite do Pix noturno"),
+    ])
+    return index
+
+def test_tokens_ignore_case_and_accents():
+    assert tokenize("Cartão de CRÉDITO, 2ª via!") == ["cartao", "de", "credito", "2a", "via"]
+
+def test_search_ranks_by_term_frequency_and_rarity(index):
+    results = index.search("cartao bloqueado", k=5)
+    assert [doc_id for doc_id, _ in results] == ["cartao"]
+
+    results = index.search("como emitir boleto", k=5)
+    assert [doc_id for doc_id, _ in results] == ["boleto", "cartao"]
+    assert results[0][1] > results[1][1] > 0
+
+def test_search_scores_match_bm25():
+    index = BM25Index(k1=1.5, b=0.75)
+    index.add([("a", "pizza pizza massa"), ("b", "massa")])
+    idf = math.log(1 + (2 - 1 + 0.5) / (1 + 0.5))
+    norm = 1.5 * (1 - 0.75 + 0.75 * 3 / 2)
+    assert index.search("pizza", k=1) == [("a", pytest.approx(idf * 2 * 2.5 / (2 + norm)))]
+
+def test_search_is_limited_to_allowed_ids_and_k(index):
+    assert [doc_id for doc_id, _ in index.search("como", k=5, allowed_ids={"cartao"})] == ["cartao"]
+    assert len(index.search("como", k=1)) == 1
+    assert index.search("inexistente", k=5) == []
+    assert index.search("", k=5) == []
+
+def test_documents_can_be_replaced_and_removed(index):
+    index.add([("pix", "Pix agendado")])
+    assert index.search("noturno", k=5) == []
+    assert [doc_id for doc_id, _ in index.search("agendado", k=5)] == ["pix"]
+
+    index.remove(["pix", "missing"])
+    assert len(index) == 2
+    assert index.search("pix", k=5) == []
+    assert index.stats() == {"documents": 2, "terms": len(set(
+        tokenize("Como emitir a segunda via do boleto Cartão de crédito bloqueado: como desbloquear o cartão")
+    ))}
+
+def test_reciprocal_rank_fusion_rewards_documents_ranked_by_both():
+    dense = ["a", "b", "c"]
+    lexical = ["c", "a", "d"]
+    assert reciprocal_rank_fusion([dense, lexical], k=60) == ["a", "c", "b", "d"]
+    assert reciprocal_rank_fusion([]) == []
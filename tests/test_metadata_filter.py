@@ -0,0 +1,51 @@
+import chromadb
+import pytest
+
+from metadata_filter import to_chroma_where, InvalidFilterError
+
+def test_no_filter():
+    assert to_chroma_where(None) is None
+    assert to_chroma_where({}) is None
+
+def test_single_condition_is_not_wrapped():
+    assert to_chroma_where({"categoria": "cartao"}) == {"categoria": {"$eq": "cartao"}}
+    assert to_chroma_where({"Rating": {"gte": 4}}) == {"Rating": {"$gte": 4}}
+
+def test_conditions_are_combined_with_and():
+    assert to_chroma_where({"Rating": {"gte": 2, "lt": 5}, "source": {"in": ["faq.pdf"]}}) == {"$and": [
+        {"Rating": {"$gte": 2}}, {"Rating": {"$lt": 5}}, {"source": {"$in": ["faq.pdf"]}}
+    ]}
+
+@pytest.mark.parametrize("metadata_filter", [
+    ["categoria"],
+    {"categoria": {}},
+    {"categoria": {"like": "cart%"}},
+    {"Rating": {"gte": "4"}},
+    {"Rating": {"gt": True}},
+    {"source": {"in": []}},
+    {"source": {"nin": "faq.pdf"}},
+    {"source": {"in": [["faq.pdf"]]}},
+    {"categoria": None},
+])
+def test_invalid_filters_are_rejected(metadata_filter):
+    with pytest.raises(InvalidFilterError):
+        to_chroma_where(metadata_filter)
+
+def test_where_clause_runs_in_chroma():
+    collection = chromadb.EphemeralClient().get_or_create_collection("metadata_filter_test")
+    collection.add(
+        ids=["1", "2", "3"],
+        embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+        metadatas=[
+            {"source": "faq.pdf", "Rating": 5},
+            {"source": "manual.pdf", "Rating": 3},
+            {"source": "faq.pdf", "Rating": 2},
+        ]
+    )
+
+    def matching(metadata_filter):
+        return sorted(collection.get(where=to_chroma_where(metadata_filter))["ids"])
+
+    assert matching({"source": "faq.pdf"}) == ["1", "3"]
+    assert matching({"source": "faq.pdf", "Rating": {"gte": 3}}) == ["1"]
+    assert matching({"source": {"nin": ["faq.pdf"]}, "Rating": {"lte": 3}}) == ["2"]
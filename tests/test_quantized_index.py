@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from quantized_index import QuantizedIndex, drop_quantized_index, recall_at_k
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((500, 32)).astype(np.float32)
+
+def ids(count, prefix="doc"):
+    return [f"{prefix}{i}" for i in range(count)]
+
+def exact_top_k(vectors, queries, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return [[f"doc{row}" for row in np.argsort(-(vectors @ query))[:k]] for query in queries]
+
+@pytest.mark.parametrize("quantization, min_recall", [("int8", 0.95), ("binary", 0.6)])
+def test_search_recall_against_exact_search(tmp_path, vectors, quantization, min_recall):
+    index = QuantizedIndex(str(tmp_path), quantization=quantization, rescore_factor=8)
+    index.add(ids(len(vectors)), vectors)
+    queries = vectors[:20] + 0.3 * np.random.default_rng(1).standard_normal((20, 32)).astype(np.float32)
+
+    results = index.search(queries.tolist(), k=10)
+    found = [[doc_id for doc_id, _ in result] for result in results]
+    assert recall_at_k(exact_top_k(vectors, queries, 10), found) >= min_recall
+    scores = [score for _, score in results[0]]
+    assert scores == sorted(scores, reverse=True)
+
+def test_exact_match_scores_one_and_allowed_ids_restrict_results(tmp_path, vectors):
+    index = QuantizedIndex(str(tmp_path))
+    index.add(ids(len(vectors)), vectors)
+
+    assert index.search([vectors[7].tolist()], k=1) == [[("doc7", pytest.approx(1.0, abs=1e-5))]]
+    result = index.search([vectors[7].tolist()], k=5, allowed_ids={"doc1", "doc2", "missing"})[0]
+    assert sorted(doc_id for doc_id, _ in result) == ["doc1", "doc2"]
+
+def test_vectors_can_be_replaced_and_removed(tmp_path, vectors):
+    index = QuantizedIndex(str(tmp_path))
+    index.add(ids(10), vectors[:10])
+    index.add(["doc3"], vectors[20:21])
+    assert len(index) == 10
+    assert index.search([vectors[20].tolist()], k=1)[0][0][0] == "doc3"
+
+    index.remove(["doc3", "missing"])
+    assert len(index) == 9
+    assert "doc3" not in {doc_id for doc_id, _ in index.search([vectors[20].tolist()], k=10)[0]}
+
+    with pytest.raises(ValueError):
+        index.add(["bad"], [[1.0, 2.0]])
+
+def test_removing_most_rows_compacts_the_files(tmp_path, vectors):
+    index = QuantizedIndex(str(tmp_path))
+    index.add(ids(10), vectors[:10])
+    index.remove(ids(10)[:8])
+    stats = index.stats()
+    assert (stats["vectors"], stats["deleted_rows"]) == (2, 0)
+    assert (tmp_path / "vectors.bin").stat().st_size == 2 * 32 * 4
+    assert {doc_id for doc_id, _ in index.search([vectors[9].tolist()], k=5)[0]} == {"doc8", "doc9"}
+
+def test_other_instances_see_writes_through_the_generation(tmp_path, vectors):
+    first = QuantizedIndex(str(tmp_path))
+    second = QuantizedIndex(str(tmp_path))
+    first.add(ids(5), vectors[:5])
+    assert second.search([vectors[4].tolist()], k=1)[0][0][0] == "doc4"
+
+    second.remove(["doc4"])
+    second.add(["new"], vectors[4:5])
+    assert first.search([vectors[4].tolist()], k=1)[0][0][0] == "new"
+    assert len(first) == 5
+
+    first.rebuild([(ids(3), vectors[:3])])
+    assert len(QuantizedIndex(str(tmp_path))) == 3
+    # Already holding the expected count: another process just rebuilt it
+    second.rebuild([(ids(5), vectors[:5])], expected=3)
+    assert len(first.search([vectors[0].tolist()], k=10)[0]) == 3
+
+def test_rows_of_an_interrupted_write_are_ignored(tmp_path, vectors):
+    index = QuantizedIndex(str(tmp_path))
+    index.add(ids(3), vectors[:3])
+    # A write that died before appending to ids.txt
+    with open(tmp_path / "vectors.bin", "ab") as f:
+        f.write(vectors[3:5].tobytes())
+
+    reopened = QuantizedIndex(str(tmp_path))
+    assert len(reopened) == 3
+    reopened.add(["doc3"], vectors[3:4])
+    assert reopened.search([vectors[3].tolist()], k=1)[0][0] == ("doc3", pytest.approx(1.0, abs=1e-5))
+
+def test_another_quantization_starts_over(tmp_path, vectors):
+    QuantizedIndex(str(tmp_path), quantization="int8").add(ids(5), vectors[:5])
+    index = QuantizedIndex(str(tmp_path), quantization="binary")
+    assert len(index) == 0
+    assert index.stats()["dimensions"] is None
+
+    index.add(ids(5), vectors[:5])
+    assert index.stats()["compression"] == pytest.approx(32.0)
+    drop_quantized_index(str(tmp_path))
+    assert not tmp_path.exists()
+
+def test_recall_at_k():
+    assert recall_at_k([["a", "b"], ["c"]], [["b", "x"], ["c"]]) == pytest.approx(0.75)
+    assert recall_at_k([], []) == 0.0
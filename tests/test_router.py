@@ -0,0 +1,111 @@
+import json
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import router
+from router import AgentRouter
+
+PROFILE_VECTORS = {"Pizzaria": [1.0, 0.0, 0.0], "Banco": [0.0, 1.0, 0.0]}
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return PROFILE_VECTORS[text.split(".")[0]]
+
+class FakeAgentManager:
+    """Agents are only "open" when listed in open_agents; nothing can open them"""
+
+    def __init__(self, documents):
+        self.configs = {
+            agent_id: SimpleNamespace(name=name, description="d", system_prompt="s")
+            for agent_id, name in (("pizza", "Pizzaria"), ("bank", "Banco"))
+        }
+        self.documents = documents
+        self.open_agents = set()
+        self.change_listeners = []
+
+    def agent_ids(self):
+        return list(self.configs)
+
+    def get_config(self, agent_id):
+        return self.configs.get(agent_id)
+
+    @contextmanager
+    def lease_if_open(self, agent_id):
+        if agent_id not in self.open_agents:
+            yield None
+            return
+        embeddings = self.documents[agent_id]
+        collection = SimpleNamespace(get=lambda include, limit: {"embeddings": embeddings})
+        yield SimpleNamespace(vector_store=SimpleNamespace(_collection=collection))
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(router, "get_cached_embeddings", lambda: FakeEmbeddings())
+
+@pytest.fixture
+def manager():
+    return FakeAgentManager({"pizza": [[0.0, 0.0, 1.0], [0.0, 0.0, 2.0]], "bank": []})
+
+def test_closed_agents_are_scored_by_profile_without_being_opened(manager, tmp_path):
+    agent_router = AgentRouter(manager, centroids_path=str(tmp_path / "centroids.json"), profile_weight=0.5)
+    scores = agent_router.score([1.0, 0.0, 1.0])
+    assert scores["pizza"] == pytest.approx(np.sqrt(0.5))
+    assert scores["bank"] == pytest.approx(0.0)
+    assert not (tmp_path / "centroids.json").exists()
+
+def test_centroid_of_an_open_agent_is_blended_and_saved(manager, tmp_path):
+    path = tmp_path / "centroids.json"
+    manager.open_agents = {"pizza", "bank"}
+    agent_router = AgentRouter(manager, centroids_path=str(path), profile_weight=0.5)
+    scores = agent_router.score([1.0, 0.0, 1.0])
+    assert scores["pizza"] == pytest.approx(0.5 * np.sqrt(0.5) + 0.5 * np.sqrt(0.5))
+    assert list(scores) == ["pizza", "bank"]
+    assert json.loads(path.read_text()) == {"pizza": [0.0, 0.0, 1.0], "bank": None}
+
+    # Another worker (or a restart) reuses the saved centroids without opening the agents
+    manager.open_agents = set()
+    assert AgentRouter(manager, centroids_path=str(path), profile_weight=0.5).score([1.0, 0.0, 1.0]) == scores
+
+def test_invalidate_forgets_the_centroid(manager, tmp_path):
+    path = tmp_path / "centroids.json"
+    manager.open_agents = {"pizza"}
+    agent_router = AgentRouter(manager, centroids_path=str(path), profile_weight=0.5)
+    agent_router.score([0.0, 0.0, 1.0])
+    manager.open_agents = set()
+
+    agent_router.invalidate("pizza")
+    assert agent_router.score([0.0, 0.0, 1.0])["pizza"] == pytest.approx(0.0)
+    assert json.loads(path.read_text()) == {}
+
+def test_select_keeps_the_best_scores_above_the_minimum(manager, tmp_path):
+    agent_router = AgentRouter(manager, centroids_path=str(tmp_path / "centroids.json"))
+    scores = {"a": 0.9, "b": 0.5, "c": 0.1}
+    assert agent_router.select(scores, top_n=2, min_score=-1) == ["a", "b"]
+    assert agent_router.select(scores, top_n=0, min_score=0.4) == ["a", "b"]
+
+def test_concurrent_saves_leave_a_complete_file(manager, tmp_path):
+    path = tmp_path / "centroids.json"
+    routers = [AgentRouter(manager, centroids_path=str(path)) for _ in range(4)]
+    for agent_router in routers:
+        agent_router._centroids = {f"agent{i}": np.ones(64, dtype=np.float32) for i in range(50)}
+    errors = []
+
+    def save(agent_router):
+        try:
+            for _ in range(20):
+                agent_router._save_centroids()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(agent_router,)) for agent_router in routers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(json.loads(path.read_text())) == 50
+    assert [p.name for p in tmp_path.iterdir()] == ["centroids.json"]
@@ -0,0 +1,83 @@
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import services
+from executor import OperationExecutor, QueueFullError
+from services import MultiAgentQAService
+
+class FakeAgent:
+    def __init__(self, agent_id, release):
+        self.agent_id = agent_id
+        self.release = release
+
+    def answer_question(self, question, query_embedding=None, retrieval_mode=None, metadata_filter=None):
+        if self.agent_id == "slow":
+            self.release.wait(5)
+        else:
+            # Long enough to still hold its slot while the other agents are submitted
+            time.sleep(0.05)
+        return {"agent_id": self.agent_id, "agent_name": self.agent_id, "question": question, "answer": "ok"}
+
+class FakeAgentManager:
+    def __init__(self):
+        self.agent_ids = []
+        self.release = threading.Event()
+
+    def list_agents(self):
+        return {agent_id: {"name": agent_id} for agent_id in self.agent_ids}
+
+    @contextmanager
+    def lease(self, agent_id):
+        yield FakeAgent(agent_id, self.release)
+
+def no_embeddings():
+    raise RuntimeError("embedding server down")
+
+@pytest.fixture
+def make_service(monkeypatch):
+    # Without a question embedding the router is skipped and every agent is asked
+    monkeypatch.setattr(services, "get_cached_embeddings", no_embeddings)
+    managers = []
+
+    def make(max_workers):
+        service = MultiAgentQAService(OperationExecutor("ask-all", max_workers, 0, 5), agent_timeout=0.3)
+        service.agent_manager = FakeAgentManager()
+        managers.append(service.agent_manager)
+        return service
+    yield make
+    for manager in managers:
+        manager.release.set()
+
+def test_timed_out_agent_keeps_its_slot_until_it_finishes(make_service):
+    service = make_service(1)
+    service.agent_manager.agent_ids = ["slow"]
+    result = service.ask_all_agents("Pergunta?")
+    assert result["responses"]["slow"]["error"] == "Agent timed out after 0.3s"
+    assert service.executor.stats()["in_flight"] == 1
+
+    with pytest.raises(QueueFullError):
+        service.ask_all_agents("Pergunta?")
+    assert service.executor.stats()["rejected"] == 1
+
+    service.agent_manager.release.set()
+    service.agent_manager.agent_ids = ["fast"]
+    for _ in range(50):
+        if service.executor.stats()["in_flight"] == 0:
+            break
+        time.sleep(0.02)
+    assert service.ask_all_agents("Pergunta?")["responses"]["fast"]["answer"] == "ok"
+
+def test_agents_without_a_free_slot_get_an_error(make_service):
+    service = make_service(2)
+    service.agent_manager.agent_ids = ["slow"]
+    service.ask_all_agents("Pergunta?")
+
+    service.agent_manager.agent_ids = ["fast", "other"]
+    result = service.ask_all_agents("Pergunta?")
+    assert list(result["responses"]) == ["fast", "other"]
+    assert result["responses"]["fast"]["answer"] == "ok"
+    assert "Too many concurrent 'ask-all' operations" in result["responses"]["other"]["error"]
@@ -0,0 +1,47 @@
+import chromadb
+from langchain_core.embeddings import Embeddings
+
+from vector_stores import (
+    open_vector_store, close_vector_store, rebuild_collection, rebuild_copy_name, per_agent_db_path
+)
+
+class FixedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.0]
+
+def interrupted_swap(agent_id, collection_name, documents):
+    """Leave an agent's store as a rebuild that crashed after dropping the original"""
+    client = chromadb.PersistentClient(path=per_agent_db_path(agent_id))
+    copy = client.create_collection(rebuild_copy_name(collection_name))
+    copy.add(
+        ids=[f"doc{i}" for i in range(len(documents))],
+        embeddings=FixedEmbeddings().embed_documents(documents),
+        documents=documents
+    )
+    client.close()
+
+def test_rebuild_recovers_the_copy_left_by_an_interrupted_swap():
+    interrupted_swap("crashed_rebuild", "agent_crashed_rebuild", ["um", "dois", "tres"])
+
+    report = rebuild_collection("crashed_rebuild", "agent_crashed_rebuild", {"M": 8})
+    assert report["documents"] == 3
+
+    store = open_vector_store("crashed_rebuild", "agent_crashed_rebuild", FixedEmbeddings())
+    try:
+        assert sorted(store.get()["documents"]) == ["dois", "tres", "um"]
+    finally:
+        close_vector_store("crashed_rebuild", store)
+
+def test_opening_an_agent_recovers_the_copy_left_by_an_interrupted_swap():
+    interrupted_swap("crashed_open", "agent_crashed_open", ["um", "dois"])
+
+    store = open_vector_store("crashed_open", "agent_crashed_open", FixedEmbeddings())
+    try:
+        assert sorted(store.get()["documents"]) == ["dois", "um"]
+        names = {collection.name for collection in store._client.list_collections()}
+        assert names == {"agent_crashed_open"}
+    finally:
+        close_vector_store("crashed_open", store)
@@ -1,37 +1,45 @@
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
-from langchain_core.documents import Document
+from embedding_cache import get_cached_embeddings
 import os
-import pandas as pd
+import threading
 
-df = pd.read_csv("exemplo_documentos.csv")
-embeddings = OllamaEmbeddings(model="mxbai-embed-large")
+import settings
 
 db_location = "./chrome_langchain_db"
-add_documents = not os.path.exists(db_location)
 
-if add_documents:
-    documents = []
-    ids = []
-    
-    for i, row in df.iterrows():
-        document = Document(
-            page_content=row["Title"] + " " + row["Review"],
-            metadata={"rating": row["Rating"], "date": row["Date"]},
-            id=str(i)
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+def get_vector_store():
+    """Open the reviews store, indexing the CSV the first time it is created
+
+    Nothing is opened or embedded at import time; the work happens on the first call.
+    """
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is not None:
+            return _vector_store
+        
+        from langchain_chroma import Chroma
+        import pandas as pd
+        
+        add_documents = not os.path.exists(db_location)
+        vector_store = Chroma(
+            collection_name="restaurant_reviews",
+            persist_directory=db_location,
+            embedding_function=get_cached_embeddings()
         )
-        ids.append(str(i))
-        documents.append(document)
         
-vector_store = Chroma(
-    collection_name="restaurant_reviews",
-    persist_directory=db_location,
-    embedding_function=embeddings
-)
+        if add_documents:
+            # Read the CSV in chunks and build texts/metadata column-wise
+            for chunk in pd.read_csv("exemplo_documentos.csv", chunksize=settings.CSV_CHUNK_SIZE):
+                contents = chunk["Title"] + " " + chunk["Review"]
+                metadatas = chunk[["Rating", "Date"]].rename(columns={"Rating": "rating", "Date": "date"}).to_dict("records")
+                ids = chunk.index.astype(str).tolist()
+                vector_store.add_texts(texts=contents.tolist(), metadatas=metadatas, ids=ids)
+        
+        _vector_store = vector_store
+        return _vector_store
 
-if add_documents:
-    vector_store.add_documents(documents=documents, ids=ids)
-    
-retriever = vector_store.as_retriever(
-    search_kwargs={"k": 5}
-)
\ No newline at end of file
+def get_retriever(k: int = 5):
+    """Retriever over the reviews store"""
+    return get_vector_store().as_retriever(search_kwargs={"k": k})
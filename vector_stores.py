@@ -0,0 +1,394 @@
+"""
+Armazenamento vetorial dos agentes
+
+Two storage modes are supported (RAG_STORAGE_MODE):
+- per_agent: one Chroma persistent directory per agent under ./agents_db/<agent_id>
+- shared: one pooled persistent client at RAG_SHARED_DB_PATH with a collection per agent
+
+Migrate existing per-agent directories into the shared store with:
+    python vector_stores.py migrate
+
+Collections are created with each agent's HNSW parameters (space, M, construction
+and search ef). Deleted and overwritten entries stay in the HNSW files until the
+collection is rebuilt with rebuild_collection, which copies it into a fresh index
+and reports size, latency and recall before and after.
+"""
+from langchain_core.embeddings import Embeddings
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import numpy as np
+
+import settings
+
+if TYPE_CHECKING:
+    # chromadb takes a while to import; it is loaded when the first store is opened
+    from langchain_chroma import Chroma
+
+PER_AGENT_DB_ROOT = "./agents_db"
+
+HNSW_SPACES = ("l2", "cosine", "ip")
+# HNSW parameter -> Chroma collection metadata key
+HNSW_METADATA_KEYS = {
+    "space": "hnsw:space",
+    "M": "hnsw:M",
+    "construction_ef": "hnsw:construction_ef",
+    "search_ef": "hnsw:search_ef"
+}
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+# Chroma shares one System between the clients of a path and stops it when the last
+# of them closes; creating a client for that path meanwhile fails with a KeyError.
+# Per-agent clients are therefore created and closed under a lock per path, so an
+# evicted agent closing doesn't break the same agent being reopened.
+_path_locks: Dict[str, threading.Lock] = {}
+_path_locks_lock = threading.Lock()
+
+def _client_lock(path: str) -> threading.Lock:
+    with _path_locks_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+def get_shared_client():
+    """Return the process-wide persistent client used in shared storage mode"""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            import chromadb
+            os.makedirs(settings.SHARED_DB_PATH, exist_ok=True)
+            _shared_client = chromadb.PersistentClient(path=settings.SHARED_DB_PATH)
+        return _shared_client
+
+def per_agent_db_path(agent_id: str) -> str:
+    """Persist directory of an agent in per_agent storage mode"""
+    return f"{PER_AGENT_DB_ROOT}/{agent_id}"
+
+def validate_hnsw_params(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Check HNSW parameters (space, M, construction_ef, search_ef; all optional)"""
+    params = dict(params or {})
+    unknown = set(params) - set(HNSW_METADATA_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown HNSW parameters {sorted(unknown)}, expected {list(HNSW_METADATA_KEYS)}")
+    if "space" in params and params["space"] not in HNSW_SPACES:
+        raise ValueError(f"Unknown HNSW space {params['space']!r}, expected one of {HNSW_SPACES}")
+    for name in ("M", "construction_ef", "search_ef"):
+        if name in params and (not isinstance(params[name], int) or params[name] <= 0):
+            raise ValueError(f"HNSW parameter {name} must be a positive integer")
+    return params
+
+def hnsw_metadata(params: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Collection metadata applying HNSW parameters (None keeps Chroma's defaults)"""
+    if not params:
+        return None
+    return {HNSW_METADATA_KEYS[name]: value for name, value in params.items()}
+
+def open_vector_store(agent_id: str, collection_name: str, embeddings: Embeddings,
+                      hnsw_params: Optional[Dict[str, Any]] = None) -> "Chroma":
+    """Open an agent's vector store according to the configured storage mode
+    
+    HNSW parameters only apply when the collection is created; an existing collection
+    keeps its own until rebuilt.
+    """
+    import chromadb
+    from langchain_chroma import Chroma
+    
+    if settings.STORAGE_MODE == "shared":
+        client = get_shared_client()
+        recover_interrupted_rebuild(client, collection_name)
+        return Chroma(
+            collection_name=collection_name,
+            client=client,
+            embedding_function=embeddings,
+            collection_metadata=hnsw_metadata(hnsw_params)
+        )
+
+    db_location = per_agent_db_path(agent_id)
+    os.makedirs(db_location, exist_ok=True)
+    with _client_lock(db_location):
+        client = chromadb.PersistentClient(path=db_location)
+        recover_interrupted_rebuild(client, collection_name)
+        return Chroma(
+            collection_name=collection_name,
+            client=client,
+            embedding_function=embeddings,
+            collection_metadata=hnsw_metadata(hnsw_params)
+        )
+
+def rebuild_copy_name(collection_name: str) -> str:
+    """Name of the copy rebuild_collection fills before swapping it in"""
+    return f"{collection_name}_rebuild"
+
+def recover_interrupted_rebuild(client, collection_name: str) -> bool:
+    """Finish a rebuild that stopped between dropping a collection and renaming its copy
+    
+    The copy is complete once the original is dropped, so it is renamed into place;
+    otherwise opening the agent would create an empty collection and the next rebuild
+    would delete the copy. Returns whether a copy was recovered.
+    """
+    names = {collection.name for collection in client.list_collections()}
+    copy_name = rebuild_copy_name(collection_name)
+    if collection_name in names or copy_name not in names:
+        return False
+    client.get_collection(copy_name).modify(name=collection_name)
+    return True
+
+def close_vector_store(agent_id: str, vector_store: "Chroma") -> None:
+    """Release a vector store's client; the shared client stays open for other agents"""
+    if settings.STORAGE_MODE == "shared":
+        return
+    client = getattr(vector_store, "_client", None)
+    if client is not None and hasattr(client, "close"):
+        with _client_lock(per_agent_db_path(agent_id)):
+            client.close()
+
+def drop_agent_store(agent_id: str, collection_name: str) -> None:
+    """Delete an agent's stored documents"""
+    if settings.STORAGE_MODE == "shared":
+        client = get_shared_client()
+        if collection_name in {collection.name for collection in client.list_collections()}:
+            client.delete_collection(collection_name)
+        return
+
+    db_path = per_agent_db_path(agent_id)
+    if os.path.exists(db_path):
+        shutil.rmtree(db_path)
+
+def migrate_per_agent_stores(source_root: str = PER_AGENT_DB_ROOT, page_size: int = 1000,
+                             remove_source: bool = False) -> List[Dict[str, Any]]:
+    """Copy every per-agent Chroma directory into the shared store, collection by collection"""
+    import chromadb
+    
+    target = get_shared_client()
+    report = []
+    if not os.path.isdir(source_root):
+        return report
+
+    for agent_id in sorted(os.listdir(source_root)):
+        source_path = os.path.join(source_root, agent_id)
+        if not os.path.isdir(source_path):
+            continue
+
+        source = chromadb.PersistentClient(path=source_path)
+        try:
+            for collection in source.list_collections():
+                source_collection = source.get_collection(collection.name)
+                target_collection = target.get_or_create_collection(
+                    collection.name, metadata=source_collection.metadata
+                )
+                copied = 0
+                while True:
+                    page = source_collection.get(
+                        include=["embeddings", "metadatas", "documents"],
+                        limit=page_size,
+                        offset=copied
+                    )
+                    if not page["ids"]:
+                        break
+                    target_collection.upsert(
+                        ids=page["ids"],
+                        embeddings=page["embeddings"],
+                        metadatas=page["metadatas"],
+                        documents=page["documents"]
+                    )
+                    copied += len(page["ids"])
+                report.append({"agent_id": agent_id, "collection": collection.name, "documents": copied})
+        finally:
+            source.close()
+
+        if remove_source:
+            shutil.rmtree(source_path)
+
+    return report
+
+def _store_root(agent_id: str) -> str:
+    return settings.SHARED_DB_PATH if settings.STORAGE_MODE == "shared" else per_agent_db_path(agent_id)
+
+def _vector_segment_dirs(root: str, collection_id: str) -> List[str]:
+    """Directories holding a collection's HNSW files, looked up in Chroma's catalog"""
+    catalog = os.path.join(root, "chroma.sqlite3")
+    if not os.path.exists(catalog):
+        return []
+    try:
+        conn = sqlite3.connect(f"file:{catalog}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'", (str(collection_id),)
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return []
+    return [os.path.join(root, segment_id) for segment_id, in rows]
+
+def _directory_bytes(paths: List[str]) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for path in paths if os.path.isdir(path)
+        for directory, _, names in os.walk(path)
+        for name in names
+    )
+
+def _distances(vectors: np.ndarray, queries: np.ndarray, space: str) -> np.ndarray:
+    """(vectors, queries) distances as Chroma computes them in each space"""
+    if space == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        return 1.0 - vectors @ queries.T
+    if space == "ip":
+        return 1.0 - vectors @ queries.T
+    return (
+        (vectors ** 2).sum(axis=1)[:, np.newaxis] - 2.0 * vectors @ queries.T + (queries ** 2).sum(axis=1)
+    )
+
+class _ExactNeighbors:
+    """Brute-force top-k of a set of queries, fed one page of vectors at a time"""
+
+    def __init__(self, queries: np.ndarray, k: int, space: str):
+        self.queries = queries
+        self.k = k
+        self.space = space
+        self._distances = np.full((0, len(queries)), np.inf, dtype=np.float32)
+        self._ids: List[str] = []
+
+    def add(self, ids: List[str], vectors: np.ndarray) -> None:
+        distances = np.vstack([self._distances, _distances(vectors, self.queries, self.space)])
+        candidates = self._ids + list(ids)
+        # Keep the union of every query's current top k
+        keep = np.unique(np.argsort(distances, axis=0)[:self.k].ravel())
+        self._distances = distances[keep]
+        self._ids = [candidates[i] for i in keep]
+
+    def neighbors(self) -> List[List[str]]:
+        order = np.argsort(self._distances, axis=0)[:self.k]
+        return [[self._ids[i] for i in order[:, column]] for column in range(len(self.queries))]
+
+def _measure(collection, queries: np.ndarray, k: int, exact: List[List[str]], segment_dirs: List[str]) -> Dict[str, Any]:
+    """Index size, single-query latency and recall@k against exact search"""
+    timings, recalls = [], []
+    if len(queries):
+        # The first query loads the index from disk
+        collection.query(query_embeddings=queries[:1].tolist(), n_results=k, include=[])
+    for query, expected in zip(queries, exact):
+        start = time.perf_counter()
+        found = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+        timings.append(time.perf_counter() - start)
+        if expected:
+            recalls.append(len(set(found) & set(expected)) / len(expected))
+    timings.sort()
+    return {
+        "index_bytes": _directory_bytes(segment_dirs),
+        "query_p50_ms": 1000 * timings[len(timings) // 2] if timings else None,
+        "query_p95_ms": 1000 * timings[min(len(timings) - 1, int(len(timings) * 0.95))] if timings else None,
+        "recall_at_k": sum(recalls) / len(recalls) if recalls else None
+    }
+
+def rebuild_collection(agent_id: str, collection_name: str, hnsw_params: Optional[Dict[str, Any]] = None,
+                       sample_size: int = 50, k: int = 5, page_size: int = 1000,
+                       allow_space_change: bool = False) -> Dict[str, Any]:
+    """Copy an agent's collection into a fresh HNSW index, dropping deleted entries
+    
+    hnsw_params are merged over the collection's HNSW parameters (unset ones are kept).
+    Changing the distance space changes relevance scores, so it raises ValueError
+    unless allow_space_change is set. The agent must be closed meanwhile. Size, query
+    latency and recall@k against exact search (over a sample of stored vectors used as
+    queries) are measured before and after.
+    """
+    import chromadb
+    
+    start = time.perf_counter()
+    root = _store_root(agent_id)
+    if settings.STORAGE_MODE == "shared":
+        client = get_shared_client()
+    else:
+        with _client_lock(root):
+            client = chromadb.PersistentClient(path=root)
+    try:
+        recover_interrupted_rebuild(client, collection_name)
+        old = client.get_collection(collection_name)
+        old_metadata = dict(old.metadata or {})
+        new_metadata = {**old_metadata, **(hnsw_metadata(validate_hnsw_params(hnsw_params)) or {})}
+        old_space = old_metadata.get("hnsw:space", "l2")
+        new_space = new_metadata.get("hnsw:space", "l2")
+        if new_space != old_space and not allow_space_change:
+            raise ValueError(
+                f"Changing the HNSW space from {old_space!r} to {new_space!r} changes relevance scores; "
+                f"pass allow_space_change to do it"
+            )
+        
+        sample = old.get(include=["embeddings"], limit=sample_size)
+        queries = np.asarray(sample["embeddings"] if sample["embeddings"] is not None else [], dtype=np.float32)
+        exact_before = _ExactNeighbors(queries, k, old_space)
+        exact_after = _ExactNeighbors(queries, k, new_space)
+        
+        # A rebuild interrupted while copying (the original still exists) leaves a partial copy
+        temp_name = rebuild_copy_name(collection_name)
+        if temp_name in {collection.name for collection in client.list_collections()}:
+            client.delete_collection(temp_name)
+        new = client.create_collection(temp_name, metadata=new_metadata or None)
+        
+        copied = 0
+        while True:
+            page = old.get(include=["embeddings", "metadatas", "documents"], limit=page_size, offset=copied)
+            if not page["ids"]:
+                break
+            new.upsert(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                metadatas=page["metadatas"],
+                documents=page["documents"]
+            )
+            if len(queries):
+                vectors = np.asarray(page["embeddings"], dtype=np.float32)
+                exact_before.add(page["ids"], vectors)
+                exact_after.add(page["ids"], vectors)
+            copied += len(page["ids"])
+        
+        old_segments = _vector_segment_dirs(root, old.id)
+        before = _measure(old, queries, k, exact_before.neighbors() if len(queries) else [], old_segments)
+        
+        # Swap: drop the old collection, give the copy its name and delete the old HNSW files
+        client.delete_collection(collection_name)
+        new.modify(name=collection_name)
+        for path in old_segments:
+            shutil.rmtree(path, ignore_errors=True)
+        
+        rebuilt = client.get_collection(collection_name)
+        after = _measure(
+            rebuilt, queries, k, exact_after.neighbors() if len(queries) else [],
+            _vector_segment_dirs(root, rebuilt.id)
+        )
+        return {
+            "agent_id": agent_id,
+            "collection": collection_name,
+            "documents": copied,
+            "hnsw_before": {key: value for key, value in old_metadata.items() if key.startswith("hnsw:")},
+            "hnsw_after": {key: value for key, value in new_metadata.items() if key.startswith("hnsw:")},
+            "k": k,
+            "sample_queries": len(queries),
+            "before": before,
+            "after": after,
+            "elapsed_seconds": time.perf_counter() - start
+        }
+    finally:
+        if settings.STORAGE_MODE != "shared" and hasattr(client, "close"):
+            with _client_lock(root):
+                client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ferramentas do armazenamento vetorial dos agentes")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    migrate = subcommands.add_parser("migrate", help="Copiar ./agents_db/* para o armazenamento compartilhado")
+    migrate.add_argument("--source", default=PER_AGENT_DB_ROOT)
+    migrate.add_argument("--remove-source", action="store_true", help="Apagar os diretórios migrados")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        result = migrate_per_agent_stores(args.source, remove_source=args.remove_source)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        print(f"Migração concluída em {settings.SHARED_DB_PATH}. Defina RAG_STORAGE_MODE=shared para usá-la.")